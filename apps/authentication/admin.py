@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import WorkDistance, User
+from .models import WorkDistance, User, OutgoingEmail, Interest
 
 admin.site.register(WorkDistance)
-admin.site.register(User)
\ No newline at end of file
+admin.site.register(User)
+admin.site.register(OutgoingEmail)
+admin.site.register(Interest)
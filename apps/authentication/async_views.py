@@ -0,0 +1,78 @@
+import inspect
+from asgiref.sync import sync_to_async
+from django.http import HttpRequest, HttpResponse
+from rest_framework.views import APIView
+from .exports import aexport
+from .views import UserListView, UserRetrieveUpdateDestroyView, UserFindView, ExportView
+
+
+class AsyncAPIView(APIView):
+    '''
+    Async dispatch for the read endpoints served under ASGI.
+
+    Mixed in ahead of a sync view, it runs that view's own DRF pipeline
+    (authentication, permissions, throttling, pagination, response caching
+    and rendering) with the token version check awaited, and the handler
+    itself through `sync_to_async`, so nothing blocks the event loop and
+    the async endpoints cannot drift from the sync ones.
+    '''
+    http_method_names = ['get', 'head', 'options']
+
+    async def dispatch(self, request: HttpRequest, *args, **kwargs) -> HttpResponse:
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await self.aauthenticate(request)
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if inspect.isawaitable(response):
+                response = await response
+        except Exception as exc:
+            response = await sync_to_async(self.handle_exception)(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def aauthenticate(self, request) -> None:
+        '''
+        Sets the request user from the first authenticator with an async
+        check. DRF's own authentication then finds the user already set;
+        requests without a token fall through to it unchanged.
+        '''
+        for authenticator in request.authenticators:
+            if hasattr(authenticator, 'aauthenticate'):
+                result = await authenticator.aauthenticate(request)
+                if result is not None:
+                    request.user, request.auth = result
+                    return
+
+    async def get(self, request: HttpRequest, *args, **kwargs) -> HttpResponse:
+        return await sync_to_async(super().get)(request, *args, **kwargs)
+
+
+class AsyncUserListView(AsyncAPIView, UserListView):
+    pass
+
+
+class AsyncUserRetrieveView(AsyncAPIView, UserRetrieveUpdateDestroyView):
+    pass
+
+
+class AsyncUserFindView(AsyncAPIView, UserFindView):
+    pass
+
+
+class AsyncExportView(AsyncAPIView, ExportView):
+    '''
+    `ExportView` streaming from an async iterator, so a long export holds no
+    worker thread between database chunks.
+    '''
+    exporter = staticmethod(aexport)
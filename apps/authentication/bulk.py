@@ -0,0 +1,172 @@
+from django.db import transaction
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.response import Response
+from .cache import bump_resource_version
+
+MAX_BULK_ITEMS = 500
+
+
+class PreloadedQuerySet:
+    '''
+    Stands in for a PrimaryKeyRelatedField's queryset, answering its
+    `get(pk = ...)` from objects loaded for a whole batch in one query.
+    '''
+    def __init__(self, model, objects: dict):
+        self.model = model
+        self.objects = objects
+
+    def all(self):
+        return self
+
+    def get(self, pk):
+        try:
+            return self.objects[int(pk)]
+        except (KeyError, TypeError, ValueError):
+            raise self.model.DoesNotExist
+
+
+class BulkModelMixin:
+    '''
+    Adds a `bulk/` list route to a ModelViewSet whose objects belong to a
+    `user`. POST creates, PATCH updates (items carry their `id`) and DELETE
+    deletes (a list of ids) many objects in one transaction.
+
+    Each item is validated by the viewset's serializer and checked against
+    the same rule as the single-object actions: the model permission, or
+    being the owner. Valid items are written with `bulk_create` /
+    `bulk_update` and invalid ones are reported by index without failing
+    the rest.
+    '''
+    def bulk_perm(self, action: str) -> str:
+        opts = self.get_queryset().model._meta
+        return f'{opts.app_label}.{action}_{opts.model_name}'
+
+    def can_write(self, action: str, *owner_ids: int) -> bool:
+        return self.request.user.has_perm(self.bulk_perm(action)) or all(owner_id == self.request.user.id for owner_id in owner_ids)
+
+    def get_bulk_items(self, request) -> list:
+        return request.data
+
+    def bulk_atomic(self):
+        '''
+        The transaction the bulk writes run in.
+        '''
+        return transaction.atomic()
+
+    def get_bulk_serializer(self, related: dict, *args, **kwargs):
+        serializer = self.get_serializer(*args, **kwargs)
+        for name, objects in related.items():
+            field = serializer.fields[name]
+            field.queryset = PreloadedQuerySet(field.queryset.model, objects)
+        return serializer
+
+    def preload_related(self, items: list) -> dict:
+        '''
+        The objects referenced by the items' related primary keys, one query
+        per related field instead of one per item.
+        '''
+        related = {}
+        for name, field in self.get_serializer().fields.items():
+            if isinstance(field, PrimaryKeyRelatedField) and not field.read_only:
+                ids = set()
+                for item in items:
+                    try:
+                        ids.add(int(item[name]))
+                    except (KeyError, TypeError, ValueError):
+                        pass
+                related[name] = field.queryset.model._default_manager.in_bulk(ids)
+        return related
+
+    def build_instances(self, validated: list[dict]) -> list:
+        model = self.get_queryset().model
+        return [model(**data) for data in validated]
+
+    def apply_changes(self, instances: list, validated: list[dict]) -> set[str]:
+        '''
+        Sets the validated values on the instances and returns the fields to write.
+        '''
+        fields = set()
+        for instance, data in zip(instances, validated):
+            for field, value in data.items():
+                setattr(instance, field, value)
+                fields.add(field)
+        return fields
+
+    @action(detail = False, methods = ['post', 'patch', 'delete'], url_path = 'bulk')
+    def bulk(self, request, *args, **kwargs) -> Response:
+        items = self.get_bulk_items(request)
+        if not isinstance(items, list) or not items or len(items) > MAX_BULK_ITEMS:
+            return Response({'non_field_errors': [f'Expected a list of 1 to {MAX_BULK_ITEMS} items.']}, status = status.HTTP_400_BAD_REQUEST)
+
+        handler = {'POST': self.perform_bulk_create, 'PATCH': self.perform_bulk_update, 'DELETE': self.perform_bulk_destroy}[request.method]
+        with self.bulk_atomic():
+            key, done, errors = handler(items)
+            if done:
+                label = self.get_queryset().model._meta.label_lower
+                transaction.on_commit(lambda: bump_resource_version(label))
+
+        report = {key: done, 'errors': errors}
+        if not done:
+            return Response(report, status = status.HTTP_400_BAD_REQUEST)
+        return Response(report, status = status.HTTP_201_CREATED if request.method == 'POST' else status.HTTP_200_OK)
+
+    def perform_bulk_create(self, items: list) -> tuple[str, list, list]:
+        related = self.preload_related(items)
+        errors, validated = [], []
+        for index, item in enumerate(items):
+            serializer = self.get_bulk_serializer(related, data = item)
+            if not serializer.is_valid():
+                errors.append({'index': index, 'errors': serializer.errors})
+            elif not self.can_write('add', serializer.validated_data['user'].id):
+                errors.append({'index': index, 'errors': {'non_field_errors': ['You do not have permission to perform this action.']}})
+            else:
+                validated.append(serializer.validated_data)
+
+        instances = self.get_queryset().model._default_manager.bulk_create(self.build_instances(validated)) if validated else []
+        return 'created', self.get_serializer(instances, many = True).data, errors
+
+    def perform_bulk_update(self, items: list) -> tuple[str, list, list]:
+        ids = [item.get('id') for item in items if isinstance(item, dict)]
+        objects = self.get_queryset().in_bulk([pk for pk in ids if isinstance(pk, int)])
+        related = self.preload_related(items)
+        errors, instances, validated = [], [], []
+        for index, item in enumerate(items):
+            instance = objects.get(item.get('id')) if isinstance(item, dict) else None
+            if instance is None:
+                errors.append({'index': index, 'errors': {'id': ['Not found.']}})
+                continue
+            serializer = self.get_bulk_serializer(related, instance, data = item, partial = True)
+            if not serializer.is_valid():
+                errors.append({'index': index, 'errors': serializer.errors})
+                continue
+            owners = [instance.user_id]
+            if 'user' in serializer.validated_data:
+                owners.append(serializer.validated_data['user'].id)
+            if not self.can_write('change', *owners):
+                errors.append({'index': index, 'errors': {'non_field_errors': ['You do not have permission to perform this action.']}})
+                continue
+            instances.append(instance)
+            validated.append(serializer.validated_data)
+
+        fields = self.apply_changes(instances, validated)
+        if fields:
+            self.get_queryset().model._default_manager.bulk_update(instances, list(fields))
+        return 'updated', self.get_serializer(instances, many = True).data, errors
+
+    def perform_bulk_destroy(self, items: list) -> tuple[str, list, list]:
+        objects = self.get_queryset().in_bulk([pk for pk in items if isinstance(pk, int)])
+        errors, ids = [], []
+        for index, pk in enumerate(items):
+            instance = objects.get(pk) if isinstance(pk, int) else None
+            if instance is None:
+                errors.append({'index': index, 'errors': {'id': ['Not found.']}})
+            elif not self.can_write('delete', instance.user_id):
+                errors.append({'index': index, 'errors': {'non_field_errors': ['You do not have permission to perform this action.']}})
+            else:
+                ids.append(pk)
+
+        if ids:
+            self.get_queryset().filter(pk__in = ids).delete()
+        return 'deleted', ids, errors
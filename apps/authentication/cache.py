@@ -0,0 +1,135 @@
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.utils.connection import ConnectionProxy
+
+local_cache = ConnectionProxy(caches, getattr(settings, 'PERMISSION_LOCAL_CACHE', 'local'))
+
+TOKEN_VERSION_TIMEOUT = getattr(settings, 'TOKEN_VERSION_CACHE_TIMEOUT', 60 * 60)
+
+
+def token_version_key(user_id: int) -> str:
+    return f'auth:token-version:{user_id}'
+
+
+def get_token_version(user_id: int) -> int|None:
+    '''
+    Current token version of a user, from the cache when possible. Only the
+    `token_version` column is read on a miss. Returns None for unknown users.
+    '''
+    from .models import User
+
+    key = token_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = User.objects.filter(pk = user_id).values_list('token_version', flat = True).first()
+        if version is not None:
+            cache.set(key, version, TOKEN_VERSION_TIMEOUT)
+    return version
+
+
+async def aget_token_version(user_id: int) -> int|None:
+    '''
+    `get_token_version` for async views, using the async cache and ORM APIs.
+    '''
+    from .models import User
+
+    key = token_version_key(user_id)
+    version = await cache.aget(key)
+    if version is None:
+        version = await User.objects.filter(pk = user_id).values_list('token_version', flat = True).afirst()
+        if version is not None:
+            await cache.aset(key, version, TOKEN_VERSION_TIMEOUT)
+    return version
+
+
+def set_token_version(user_id: int, version: int) -> None:
+    cache.set(token_version_key(user_id), version, TOKEN_VERSION_TIMEOUT)
+
+
+def forget_token_version(user_id: int) -> None:
+    cache.delete(token_version_key(user_id))
+
+
+PERMISSIONS_TIMEOUT = getattr(settings, 'PERMISSION_CACHE_TIMEOUT', 60 * 60)
+GLOBAL_PERMISSIONS_VERSION_KEY = 'auth:perms-version'
+
+
+def permissions_version_key(user_id: int) -> str:
+    return f'auth:perms-version:{user_id}'
+
+
+def _new_version() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+def _permissions_versions(user_id: int) -> tuple[str, str]:
+    '''
+    The global and per-user permission versions, in one cache round trip.
+    Versions never expire; an evicted version is replaced by a fresh random
+    one, so stale permission entries can never be read back.
+    '''
+    keys = [GLOBAL_PERMISSIONS_VERSION_KEY, permissions_version_key(user_id)]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _new_version(), None)
+            versions[key] = cache.get(key)
+    return versions[keys[0]], versions[keys[1]]
+
+
+def get_permissions(user) -> frozenset[str]:
+    '''
+    The "app_label.codename" permissions `user` holds through its own and its
+    groups' permissions. Served from the local-memory cache, then Redis, and
+    only computed from the database when both miss.
+    '''
+    global_version, user_version = _permissions_versions(user.pk)
+    key = f'auth:perms:{user.pk}:{global_version}:{user_version}'
+
+    permissions = local_cache.get(key)
+    if permissions is None:
+        permissions = cache.get(key)
+        if permissions is None:
+            permissions = frozenset(user.get_all_permissions())
+            cache.set(key, permissions, PERMISSIONS_TIMEOUT)
+        local_cache.set(key, permissions, PERMISSIONS_TIMEOUT)
+    return permissions
+
+
+def invalidate_user_permissions(user_id: int) -> None:
+    cache.set(permissions_version_key(user_id), _new_version(), None)
+
+
+def invalidate_all_permissions() -> None:
+    cache.set(GLOBAL_PERMISSIONS_VERSION_KEY, _new_version(), None)
+
+
+RESPONSE_CACHE_TIMEOUT = getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 5 * 60)
+
+
+def resource_version_key(label: str) -> str:
+    return f'responses:version:{label}'
+
+
+def _new_resource_version() -> str:
+    return f'{time.time():.6f}-{uuid.uuid4().hex[:8]}'
+
+
+def get_resource_versions(labels: list[str]) -> dict[str, str]:
+    '''
+    The current version of each model label, in one cache round trip. Like
+    permission versions they never expire and are replaced when evicted.
+    '''
+    keys = {label: resource_version_key(label) for label in labels}
+    versions = cache.get_many(keys.values())
+    for key in keys.values():
+        if key not in versions:
+            cache.add(key, _new_resource_version(), None)
+            versions[key] = cache.get(key)
+    return {label: versions[key] for label, key in keys.items()}
+
+
+def bump_resource_version(label: str) -> None:
+    cache.set(resource_version_key(label), _new_resource_version(), None)
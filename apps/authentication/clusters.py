@@ -0,0 +1,164 @@
+import math
+from django.conf import settings
+from django.db import connection
+from .models import User, UserCluster, UserClusterDelta
+
+# Upper bound on the grid cells a single request may cover.
+MAX_CELLS = 16384
+
+
+class TooManyPoints(Exception):
+    '''
+    Raised when a bbox holds more users than DBSCAN may cluster per request.
+    '''
+    def __init__(self, limit: int):
+        super().__init__(f'The bbox holds more than {limit} users; zoom in or use method=grid.')
+        self.limit = limit
+
+
+def cell_size(zoom: int) -> float:
+    '''
+    Grid cell size in degrees at `zoom`, about USER_CLUSTER_CELLS_PER_TILE
+    cells across each map tile.
+    '''
+    return 360.0 / (2 ** zoom * settings.USER_CLUSTER_CELLS_PER_TILE)
+
+
+def cell_range(bbox: tuple[float, float, float, float], zoom: int) -> tuple[range, range]:
+    min_lon, min_lat, max_lon, max_lat = bbox
+    size = cell_size(zoom)
+    columns = range(math.floor((min_lon + 180) / size), math.floor((max_lon + 180) / size) + 1)
+    rows = range(math.floor((min_lat + 90) / size), math.floor((max_lat + 90) / size) + 1)
+    return columns, rows
+
+
+def is_materialized(zoom: int) -> bool:
+    return zoom <= settings.USER_CLUSTER_MATERIALIZED_MAX_ZOOM
+
+
+def materialized_cells(columns: range, rows: range, zoom: int, address: str):
+    return UserCluster.objects.filter(
+        address = address,
+        zoom = zoom,
+        cell_x__gte = columns.start,
+        cell_x__lt = columns.stop,
+        cell_y__gte = rows.start,
+        cell_y__lt = rows.stop,
+        count__gt = 0
+    ).values_list('cell_x', 'cell_y', 'country', 'count', 'sum_longitude', 'sum_latitude')
+
+
+def _points_sql(field: str) -> str:
+    # Matches the geometry expression indexes on the address fields.
+    return f'''
+        SELECT {field}::geometry(POINT,4326) AS g, country
+        FROM {User._meta.db_table}
+        WHERE {field}::geometry(POINT,4326) && ST_MakeEnvelope(%s, %s, %s, %s, 4326)
+    '''
+
+
+def _envelope(columns: range, rows: range, zoom: int) -> list[float]:
+    size = cell_size(zoom)
+    return [columns.start * size - 180, rows.start * size - 90, columns.stop * size - 180, rows.stop * size - 90]
+
+
+def live_cells(columns: range, rows: range, zoom: int, address: str) -> list[tuple]:
+    '''
+    The same per-cell rows as `materialized_cells`, aggregated from the
+    users table for zoom levels that are not materialised.
+    '''
+    size = cell_size(zoom)
+    sql = f'''
+        SELECT floor((ST_X(g) + 180) / %s)::int, floor((ST_Y(g) + 90) / %s)::int, country,
+               count(*), sum(ST_X(g)), sum(ST_Y(g))
+        FROM ({_points_sql(f'{address}_address')}) points
+        GROUP BY 1, 2, 3
+    '''
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [size, size, *_envelope(columns, rows, zoom)])
+        return cursor.fetchall()
+
+
+def dbscan_cells(columns: range, rows: range, zoom: int, address: str) -> list[tuple]:
+    '''
+    Density-based clusters (`ST_ClusterDBSCAN`) with a radius of one grid
+    cell, in the same row shape keyed by cluster id. Raises `TooManyPoints`
+    when the bbox holds more than `USER_CLUSTER_DBSCAN_MAX_POINTS` users.
+    '''
+    limit = settings.USER_CLUSTER_DBSCAN_MAX_POINTS
+    # One user past the limit is enough to tell the bbox is too dense, and
+    # keeps the window function from clustering the whole bbox.
+    sql = f'''
+        SELECT cluster, NULL, country, count(*), sum(ST_X(g)), sum(ST_Y(g))
+        FROM (
+            SELECT ST_ClusterDBSCAN(g, eps := %s, minpoints := 1) OVER () AS cluster, g, country
+            FROM ({_points_sql(f'{address}_address')} LIMIT %s) points
+        ) clustered
+        GROUP BY 1, 3
+    '''
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [cell_size(zoom), *_envelope(columns, rows, zoom), limit + 1])
+        cells = cursor.fetchall()
+    if sum(cell[3] for cell in cells) > limit:
+        raise TooManyPoints(limit)
+    return cells
+
+
+def aggregate(cells, countries: bool = False) -> list[dict]:
+    '''
+    Merges per-country cell rows into one cluster per cell, with its user
+    count, centroid and, optionally, the count per country.
+    '''
+    clusters = {}
+    for cell_x, cell_y, country, count, sum_longitude, sum_latitude in cells:
+        cluster = clusters.setdefault((cell_x, cell_y), {'count': 0, 'sum_longitude': 0.0, 'sum_latitude': 0.0, 'countries': {}})
+        cluster['count'] += count
+        cluster['sum_longitude'] += sum_longitude
+        cluster['sum_latitude'] += sum_latitude
+        cluster['countries'][country] = cluster['countries'].get(country, 0) + count
+
+    results = []
+    for cluster in clusters.values():
+        result = {
+            'longitude': cluster['sum_longitude'] / cluster['count'],
+            'latitude': cluster['sum_latitude'] / cluster['count'],
+            'count': cluster['count']
+        }
+        if countries:
+            result['countries'] = cluster['countries']
+        results.append(result)
+    return sorted(results, key = lambda result: -result['count'])
+
+
+def clusters(bbox: tuple[float, float, float, float], zoom: int, address: str = 'home', method: str = 'grid', countries: bool = False) -> list[dict]:
+    '''
+    User clusters inside `bbox` at `zoom`. Grid clusters of coarse zoom
+    levels come from the materialised `UserCluster` table; finer levels and
+    DBSCAN (finer levels only) are computed from the users in the bbox.
+    '''
+    columns, rows = cell_range(bbox, zoom)
+    if method == 'dbscan':
+        cells = dbscan_cells(columns, rows, zoom, address)
+    elif is_materialized(zoom):
+        cells = materialized_cells(columns, rows, zoom, address)
+    else:
+        cells = live_cells(columns, rows, zoom, address)
+    return aggregate(cells, countries)
+
+
+def cluster_deltas(old_state: dict|None, user: User|None) -> list[UserClusterDelta]:
+    '''
+    The deltas moving a user from `old_state` (a complete `_loaded_state`,
+    None for new users) to `user`'s current addresses and country (None
+    for deleted users).
+    '''
+    deltas = []
+    for address in ('home', 'office'):
+        field = f'{address}_address'
+        if old_state is not None and old_state[field] is not None:
+            point = old_state[field]
+            deltas.append(UserClusterDelta(address = address, longitude = point.x, latitude = point.y, country = old_state['country'], weight = -1))
+        if user is not None and getattr(user, field) is not None:
+            point = getattr(user, field)
+            deltas.append(UserClusterDelta(address = address, longitude = point.x, latitude = point.y, country = user.country, weight = 1))
+    return deltas
@@ -0,0 +1,84 @@
+import numpy as np
+from django.db.models.query import QuerySet
+from .spatial_index import EARTH_RADIUS_M
+
+# Upper bound on the cells of one distance block (8 MB of float64). Evaluating
+# a block holds about eight block-sized arrays at once (the haversine
+# temporaries, the candidate distances and indices, and the argpartition
+# result), so `top_k` peaks at about 64 MB.
+MAX_BLOCK_ELEMENTS = 1024 * 1024
+
+
+def load_coordinates(queryset: QuerySet, field: str, limit: int|None = None) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Loads the ids and `field` points of a user queryset, at most `limit` of
+    them, into arrays: int64 ids and an (n, 2) float64 array of (lon, lat)
+    in radians.
+    '''
+    ids, coordinates = [], []
+    rows = queryset.values_list('id', field)
+    if limit is not None:
+        rows = rows.order_by('id')[:limit]
+    for pk, point in rows.iterator(chunk_size = 10000):
+        if point is not None:
+            ids.append(pk)
+            coordinates.append((point.x, point.y))
+    return np.array(ids, dtype = np.int64), to_radians(coordinates)
+
+
+def to_radians(coordinates) -> np.ndarray:
+    return np.radians(np.asarray(coordinates, dtype = np.float64).reshape(-1, 2))
+
+
+def haversine_matrix(origins: np.ndarray, destinations: np.ndarray) -> np.ndarray:
+    '''
+    (len(origins), len(destinations)) great-circle distances in metres
+    between two arrays of (lon, lat) radians.
+    '''
+    lon1, lat1 = origins[:, 0:1], origins[:, 1:2]
+    lon2, lat2 = destinations[:, 0], destinations[:, 1]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def top_k(origins: np.ndarray, destinations: np.ndarray, k: int, origin_ids: np.ndarray|None = None, destination_ids: np.ndarray|None = None) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    The `k` nearest destinations of every origin, as (indices, distances)
+    arrays of shape (len(origins), k) sorted nearest first. Missing matches
+    have index -1 and distance inf.
+
+    The distance matrix is computed in row and column blocks of at most
+    MAX_BLOCK_ELEMENTS cells, so working memory stays bounded however many
+    users are compared. When ids are given, an origin is never matched to the
+    destination with the same id.
+    '''
+    n, m = len(origins), len(destinations)
+    k = min(k, m)
+    indices = np.full((n, k), -1, dtype = np.int64)
+    distances = np.full((n, k), np.inf)
+    if not n or not k:
+        return indices, distances
+
+    columns = min(m, MAX_BLOCK_ELEMENTS)
+    rows = max(1, MAX_BLOCK_ELEMENTS // columns)
+    for row in range(0, n, rows):
+        best_index = np.full((min(rows, n - row), 0), -1, dtype = np.int64)
+        best_distance = np.empty((min(rows, n - row), 0))
+        for column in range(0, m, columns):
+            block = haversine_matrix(origins[row:row + rows], destinations[column:column + columns])
+            if origin_ids is not None and destination_ids is not None:
+                block[origin_ids[row:row + rows, None] == destination_ids[None, column:column + columns]] = np.inf
+
+            candidate_index = np.concatenate([best_index, np.broadcast_to(np.arange(column, column + block.shape[1]), block.shape)], axis = 1)
+            candidate_distance = np.concatenate([best_distance, block], axis = 1)
+            keep = np.argpartition(candidate_distance, k - 1, axis = 1)[:, :k] if candidate_distance.shape[1] > k else np.argsort(candidate_distance, axis = 1)
+            best_index = np.take_along_axis(candidate_index, keep, axis = 1)
+            best_distance = np.take_along_axis(candidate_distance, keep, axis = 1)
+
+        order = np.argsort(best_distance, axis = 1, kind = 'stable')
+        best_index = np.take_along_axis(best_index, order, axis = 1)
+        best_distance = np.take_along_axis(best_distance, order, axis = 1)
+        best_index[np.isinf(best_distance)] = -1
+        indices[row:row + len(best_index)] = best_index
+        distances[row:row + len(best_distance)] = best_distance
+    return indices, distances
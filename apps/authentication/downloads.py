@@ -0,0 +1,128 @@
+import mimetypes
+import os
+import re
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from .models import Document
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeFile:
+    '''
+    Read-only view of `length` bytes of a file starting at `start`.
+
+    It keeps `fileno()`, so servers that implement `wsgi.file_wrapper` with
+    `os.sendfile` (e.g. gunicorn) still copy the range in the kernel, bounded
+    by the Content-Length we set.
+    '''
+    def __init__(self, file, start: int, length: int):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size: int = -1) -> bytes:
+        if self.remaining <= 0:
+            return b''
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self) -> int:
+        return self.file.fileno()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def parse_range(header: str, size: int) -> tuple[int, int]|None:
+    '''
+    (start, end) of a single `bytes=` range, inclusive. Returns None when the
+    header should be ignored and raises ValueError when it cannot be satisfied.
+    '''
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first == '':
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def document_etag(document: Document, size: int, modified: float) -> str:
+    if document.blob_id is not None:
+        return quote_etag(document.blob.sha256)
+    return quote_etag(f'{size:x}-{int(modified):x}')
+
+
+def document_response(request, document: Document) -> HttpResponse:
+    '''
+    Serves a document's file with ETag/Last-Modified validation and single
+    byte ranges. Depending on DOCUMENT_DOWNLOAD_BACKEND the bytes are either
+    streamed by Django from the open file or left to the front proxy via
+    X-Accel-Redirect (nginx) or X-Sendfile (Apache/lighttpd).
+    '''
+    name = document.document.name
+    size = default_storage.size(name)
+    modified = default_storage.get_modified_time(name).timestamp()
+    etag = document_etag(document, size, modified)
+
+    response = get_conditional_response(request, etag = etag, last_modified = int(modified))
+    if response is None:
+        response = _file_response(request, name, size, etag)
+
+    content_type, _ = mimetypes.guess_type(os.path.basename(name))
+    if response.status_code in (200, 206):
+        response['Content-Type'] = content_type or 'application/octet-stream'
+        response['Content-Disposition'] = f'attachment; filename="{document.document_type}-{document.pk}{os.path.splitext(name)[1]}"'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(modified)
+    response['Accept-Ranges'] = 'bytes'
+    response['Cache-Control'] = 'private'
+    return response
+
+
+def _file_response(request, name: str, size: int, etag: str) -> HttpResponse:
+    backend = getattr(settings, 'DOCUMENT_DOWNLOAD_BACKEND', 'django')
+    if backend == 'nginx':
+        # nginx serves the internal location, including any Range header.
+        response = HttpResponse()
+        response['X-Accel-Redirect'] = settings.DOCUMENT_ACCEL_REDIRECT_PREFIX + name
+        return response
+    if backend == 'sendfile':
+        response = HttpResponse()
+        response['X-Sendfile'] = default_storage.path(name)
+        return response
+
+    byte_range = None
+    if_range = request.headers.get('If-Range')
+    if 'Range' in request.headers and (if_range is None or if_range == etag):
+        try:
+            byte_range = parse_range(request.headers['Range'], size)
+        except ValueError:
+            response = HttpResponse(status = 416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    file = default_storage.open(name, 'rb')
+    if byte_range is None:
+        response = FileResponse(file)
+        response['Content-Length'] = size
+        return response
+
+    start, end = byte_range
+    response = FileResponse(RangeFile(file, start, end - start + 1), status = 206)
+    response['Content-Length'] = end - start + 1
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
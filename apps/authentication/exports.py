@@ -0,0 +1,213 @@
+import zlib
+import orjson
+from .models import User, WorkDistance, AreaOfInterest
+
+CHUNK_SIZE = 2000
+FORMATS = {
+    'geojson': 'application/geo+json',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    '''
+    Whether an Accept-Encoding header allows gzip: listed (or covered by
+    `*`) with a non-zero q-value. `gzip;q=0` explicitly refuses it.
+    '''
+    qualities = {}
+    for coding in accept_encoding.split(','):
+        name, *params = [part.strip() for part in coding.split(';')]
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name:
+            qualities[name.lower()] = quality
+    for name in ('gzip', 'x-gzip', '*'):
+        if name in qualities:
+            return qualities[name] > 0
+    return False
+
+
+def _point(point) -> dict|None:
+    if point is None:
+        return None
+    return {'type': 'Point', 'coordinates': [point.x, point.y]}
+
+
+def _line(line) -> dict|None:
+    if line is None:
+        return None
+    return {'type': 'LineString', 'coordinates': [list(coords) for coords in line.coords]}
+
+
+def user_rows(address: str = 'home'):
+    other = 'office' if address == 'home' else 'home'
+    return User.objects.order_by('id').values_list(
+        'id', 'email', 'first_name', 'last_name', 'country', f'{address}_address', f'{other}_address'
+    )
+
+
+def user_features(rows, address: str = 'home'):
+    '''
+    One feature per user located at their `address`; the other address is
+    kept as a property so nothing is lost.
+    '''
+    other = 'office' if address == 'home' else 'home'
+    for pk, email, first_name, last_name, country, point, other_point in rows:
+        yield {
+            'type': 'Feature',
+            'id': pk,
+            'geometry': _point(point),
+            'properties': {
+                'email': email,
+                'first_name': first_name,
+                'last_name': last_name,
+                'country': country,
+                f'{other}_address': _point(other_point)
+            }
+        }
+
+
+def work_distance_rows(address: str = 'home'):
+    return WorkDistance.objects.order_by('id').values_list('id', 'user_id', 'length', 'points')
+
+
+def work_distance_features(rows, address: str = 'home'):
+    for pk, user_id, length, points in rows:
+        yield {
+            'type': 'Feature',
+            'id': pk,
+            'geometry': _line(points),
+            'properties': {'user': user_id, 'length': length}
+        }
+
+
+def area_of_interest_rows(address: str = 'home'):
+    return AreaOfInterest.objects.order_by('id').values_list('id', 'user_id', 'interest__name')
+
+
+def area_of_interest_features(rows, address: str = 'home'):
+    for pk, user_id, interest in rows:
+        yield {
+            'type': 'Feature',
+            'id': pk,
+            'geometry': None,
+            'properties': {'user': user_id, 'interest': interest}
+        }
+
+
+# kind -> (row queryset, rows to features, permission needed to export it)
+EXPORTS = {
+    'users': (user_rows, user_features, 'authentication.view_user'),
+    'work-distances': (work_distance_rows, work_distance_features, 'authentication.view_workdistance'),
+    'areas-of-interest': (area_of_interest_rows, area_of_interest_features, 'authentication.view_areaofinterest'),
+}
+
+
+def dumps(feature: dict) -> bytes:
+    return orjson.dumps(feature, default = str)
+
+
+class FeatureEncoder:
+    '''
+    Serialises features one at a time as a GeoJSON FeatureCollection or as
+    NDJSON, optionally gzipped, batching many small features into each
+    chunk. `encode` and `aencode` drive it from sync and async iterators.
+    '''
+    def __init__(self, format: str, gzip: bool = False):
+        self.format = format
+        self.compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+        self.buffer = [b'{"type":"FeatureCollection","features":['] if format == 'geojson' else []
+        self.count = 0
+
+    def add(self, feature: dict) -> bytes:
+        '''
+        Buffers one feature and returns the next chunk, or b'' until a batch is full.
+        '''
+        if self.format == 'geojson' and self.count:
+            self.buffer.append(b',')
+        self.buffer.append(dumps(feature))
+        if self.format == 'ndjson':
+            self.buffer.append(b'\n')
+        self.count += 1
+        return self.flush() if len(self.buffer) >= 1000 else b''
+
+    def finish(self) -> bytes:
+        if self.format == 'geojson':
+            self.buffer.append(b']}')
+        chunk = self.flush()
+        if self.compressor is not None:
+            chunk += self.compressor.flush()
+        return chunk
+
+    def flush(self) -> bytes:
+        chunk, self.buffer = b''.join(self.buffer), []
+        if self.compressor is not None and chunk:
+            chunk = self.compressor.compress(chunk)
+        return chunk
+
+
+def encode(features, format: str, gzip: bool = False):
+    '''
+    Byte chunks of `features`, encoded lazily.
+    '''
+    encoder = FeatureEncoder(format, gzip)
+    for feature in features:
+        chunk = encoder.add(feature)
+        if chunk:
+            yield chunk
+    chunk = encoder.finish()
+    if chunk:
+        yield chunk
+
+
+async def aencode(features, format: str, gzip: bool = False):
+    '''
+    `encode` for an async iterable of features.
+    '''
+    encoder = FeatureEncoder(format, gzip)
+    async for feature in features:
+        chunk = encoder.add(feature)
+        if chunk:
+            yield chunk
+    chunk = encoder.finish()
+    if chunk:
+        yield chunk
+
+
+def export(kind: str, format: str, address: str = 'home', gzip: bool = False):
+    '''
+    Byte chunks of a whole export. Rows are read through a server-side cursor
+    and encoded as they arrive, so memory use does not grow with the export.
+    '''
+    rows, features, _ = EXPORTS[kind]
+    return encode(features(rows(address).iterator(chunk_size = CHUNK_SIZE), address), format, gzip)
+
+
+async def _afeatures(kind: str, address: str):
+    # Rows arrive from the async ORM a chunk at a time; converting a chunk
+    # to features is plain CPU work and reuses the sync generators.
+    rows, features, _ = EXPORTS[kind]
+    chunk = []
+    async for row in rows(address).aiterator(chunk_size = CHUNK_SIZE):
+        chunk.append(row)
+        if len(chunk) >= CHUNK_SIZE:
+            for feature in features(chunk, address):
+                yield feature
+            chunk = []
+    for feature in features(chunk, address):
+        yield feature
+
+
+def aexport(kind: str, format: str, address: str = 'home', gzip: bool = False):
+    '''
+    `export` as an async iterator of byte chunks, for async views. The
+    database is read through the async ORM so a long export never holds a
+    worker thread.
+    '''
+    return aencode(_afeatures(kind, address), format, gzip)
@@ -0,0 +1,186 @@
+import csv
+import io
+import json
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+from .models import User, UserClusterDelta, WorkDistance, birthday_key
+from .clusters import cluster_deltas
+from .serializers import UserImportSerializer
+from .tiles import invalidate_all_tiles
+from . import spatial_index
+from .cache import bump_resource_version
+from .utils import chunked
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+class InvalidRow:
+    '''
+    A record that could not be decoded, reported like a validation error.
+    '''
+    def __init__(self, message: str):
+        self.errors = {'non_field_errors': [message]}
+
+
+def _is_utf8(text: str) -> bool:
+    # Streams are opened with errors = 'surrogateescape', so bytes that are
+    # not UTF-8 survive as lone surrogates instead of aborting the import.
+    try:
+        text.encode('utf-8')
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def read_rows(stream: io.TextIOBase, format: str):
+    '''
+    Yields one dict per CSV or NDJSON record without loading the whole input,
+    or an `InvalidRow` for a record that is not valid UTF-8 or JSON.
+    '''
+    if format == 'csv':
+        for row in csv.DictReader(stream):
+            if not all(_is_utf8(value) for value in row.values() if isinstance(value, str)):
+                yield InvalidRow('Row is not valid UTF-8.')
+                continue
+            yield {key: value for key, value in row.items() if value != ''}
+    elif format == 'ndjson':
+        for line in stream:
+            if not line.strip():
+                continue
+            if not _is_utf8(line):
+                yield InvalidRow('Row is not valid UTF-8.')
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as ex:
+                yield InvalidRow(f'Invalid JSON: {ex}')
+    else:
+        raise ValueError(f'Unsupported import format: {format}')
+
+
+def _init_worker() -> None:
+    # Spawned (non-forked) workers start without Django configured.
+    import django
+    django.setup()
+
+
+_executors: dict[int|None, ProcessPoolExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def hashing_executor(workers: int|None) -> ProcessPoolExecutor:
+    '''
+    The process pool hashing passwords with `workers` processes, started
+    once per process and shared by every import.
+    '''
+    with _executors_lock:
+        executor = _executors.get(workers)
+        if executor is None:
+            executor = _executors[workers] = ProcessPoolExecutor(max_workers = workers, initializer = _init_worker)
+        return executor
+
+
+class UserImporter:
+    '''
+    Streams user records into the database in `bulk_create` batches.
+
+    Rows are validated with the signup serializer's rules, including the
+    configured password validators. Passwords of valid rows are hashed in a
+    process pool, since PBKDF2 dominates the cost of creating a user.
+    '''
+    def __init__(self, batch_size: int = DEFAULT_BATCH_SIZE, workers: int|None = None):
+        self.batch_size = batch_size
+        self.workers = workers
+        self.created = 0
+        self.errors: list[dict] = []
+        self._seen_emails: set[str] = set()
+
+    def run(self, rows) -> dict:
+        if self.workers == 1:
+            self._import(rows, map)
+        else:
+            executor = hashing_executor(self.workers)
+            self._import(rows, lambda func, items: executor.map(func, items, chunksize = 64))
+        if self.created:
+            # bulk_create sends no signals, so cached tiles and responses are dropped wholesale.
+            invalidate_all_tiles()
+            bump_resource_version(User._meta.label_lower)
+            spatial_index.invalidate()
+        return self.report()
+
+    def report(self) -> dict:
+        return {
+            'created': self.created,
+            'failed': len(self.errors),
+            'errors': self.errors
+        }
+
+    def _import(self, rows, hash_map) -> None:
+        numbered = enumerate(rows, start = 1)
+        for batch in chunked(numbered, self.batch_size):
+            valid = [(number, data) for number, data in map(self._validate, batch) if data is not None]
+            valid = self._drop_existing(valid)
+            if not valid:
+                continue
+
+            passwords = hash_map(make_password, [data.pop('password') for _, data in valid])
+            users = []
+            for (_, data), password in zip(valid, passwords):
+                user = User(**data, password = password)
+                user.birthday_key = birthday_key(user.date_of_birth)
+                users.append(user)
+            self._write(valid, users)
+
+    def _validate(self, numbered: tuple[int, dict]) -> tuple[int, dict|None]:
+        number, row = numbered
+        if isinstance(row, InvalidRow):
+            self._error(number, row.errors)
+            return number, None
+        serializer = UserImportSerializer(data = row)
+        if not serializer.is_valid():
+            self._error(number, serializer.errors)
+            return number, None
+
+        data = dict(serializer.validated_data)
+        if data['email'] in self._seen_emails:
+            self._error(number, {'email': ['Duplicate email in import.']})
+            return number, None
+
+        self._seen_emails.add(data['email'])
+        return number, data
+
+    def _drop_existing(self, valid: list[tuple[int, dict]]) -> list[tuple[int, dict]]:
+        '''
+        One query per batch instead of the serializer's per-row unique check.
+        '''
+        existing = set(User.objects.filter(
+            email__in = [data['email'] for _, data in valid]
+        ).values_list('email', flat = True))
+
+        for number, data in valid:
+            if data['email'] in existing:
+                self._error(number, {'email': ['user with this email address already exists.']})
+        return [(number, data) for number, data in valid if data['email'] not in existing]
+
+    def _write(self, valid: list[tuple[int, dict]], users: list[User]) -> None:
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create(users, batch_size = self.batch_size)
+                UserClusterDelta.objects.bulk_create(
+                    [delta for user in users for delta in cluster_deltas(None, user)],
+                    batch_size = self.batch_size
+                )
+                # bulk_create skips User.save, which derives the commutes.
+                ids = [user.pk for user in users]
+                WorkDistance.objects.recompute_range(min(ids), max(ids) + 1)
+        except IntegrityError as ex:
+            # A concurrent signup took one of the emails; report the whole batch.
+            for number, _ in valid:
+                self._error(number, {'non_field_errors': [str(ex)]})
+        else:
+            self.created += len(users)
+
+    def _error(self, number: int, errors: dict) -> None:
+        self.errors.append({'row': number, 'errors': errors})
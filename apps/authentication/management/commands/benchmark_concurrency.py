@@ -0,0 +1,83 @@
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+from django.core.management.base import BaseCommand, CommandError
+
+
+async def fetch(url: str, token: str|None) -> int:
+    '''
+    One GET over a fresh connection, read to the end. Plain asyncio streams
+    keep the client from being the bottleneck or needing an extra package.
+    '''
+    parts = urlsplit(url)
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    reader, writer = await asyncio.open_connection(parts.hostname, port, ssl = parts.scheme == 'https' or None)
+    path = parts.path + (f'?{parts.query}' if parts.query else '')
+    headers = [f'GET {path or "/"} HTTP/1.1', f'Host: {parts.netloc}', 'Connection: close', 'Accept-Encoding: identity']
+    if token:
+        headers.append(f'Authorization: Bearer {token}')
+    writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode())
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    await writer.wait_closed()
+    return int(response.split(b' ', 2)[1])
+
+
+async def load(url: str, requests: int, concurrency: int, token: str|None) -> tuple[list[float], int, float]:
+    latencies, errors = [], 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            started = time.perf_counter()
+            try:
+                status = await fetch(url, token)
+            except (OSError, ValueError, IndexError):
+                status = None
+            latencies.append(time.perf_counter() - started)
+            if status != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-tests running deployments with concurrent GETs and compares their throughput, e.g. '
+        'wsgi=http://127.0.0.1:8000/api/user/find/?... asgi=http://127.0.0.1:8001/api/async/user/find/?...'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('targets', nargs = '+', help = 'name=url pairs to compare.')
+        parser.add_argument('--requests', type = int, default = 1000)
+        parser.add_argument('--concurrency', type = int, default = 50)
+        parser.add_argument('--token', help = 'Access token sent as a Bearer Authorization header.')
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options['targets']:
+            name, sep, url = target.partition('=')
+            if not sep or not url.startswith(('http://', 'https://')):
+                raise CommandError(f'Expected name=url, got "{target}".')
+            targets.append((name, url))
+
+        throughputs = {}
+        for name, url in targets:
+            latencies, errors, elapsed = asyncio.run(load(url, options['requests'], options['concurrency'], options['token']))
+            latencies.sort()
+            throughputs[name] = len(latencies) / elapsed
+            self.stdout.write(
+                f'{name:<10} {throughputs[name]:8.1f} req/s   '
+                f'p50 {statistics.median(latencies) * 1000:8.1f} ms   '
+                f'p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:8.1f} ms   '
+                f'errors {errors}'
+            )
+
+        baseline, *others = throughputs
+        for name in others:
+            self.stdout.write(f'{name} vs {baseline}: x{throughputs[name] / throughputs[baseline]:.2f}')
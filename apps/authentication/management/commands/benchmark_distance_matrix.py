@@ -0,0 +1,50 @@
+import statistics
+import time
+from django.contrib.gis.geos import Point
+from django.core.management.base import BaseCommand
+from django.db import connection
+from apps.authentication.distances import load_coordinates, top_k
+from apps.authentication.models import User
+from apps.authentication.proximity import nearest_users
+
+
+class Command(BaseCommand):
+    help = 'Compares the NumPy top-k distance matrix with one ORM nearest-neighbour query per origin.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--origins', type = int, default = 100, help = 'Number of origin users (offices).')
+        parser.add_argument('--k', type = int, default = 10)
+        parser.add_argument('--repeat', type = int, default = 3)
+
+    def handle(self, *args, **options):
+        origin_users = list(User.objects.order_by('id').values_list('id', 'office_address')[:options['origins']])
+        if not origin_users:
+            self.stdout.write('No users to compare.')
+            return
+
+        def numpy_path():
+            origin_ids, origins = load_coordinates(User.objects.filter(id__in = [pk for pk, _ in origin_users]), 'office_address')
+            destination_ids, destinations = load_coordinates(User.objects.all(), 'home_address')
+            return top_k(origins, destinations, options['k'], origin_ids, destination_ids)
+
+        def orm_path():
+            return [
+                list(nearest_users(Point(point.x, point.y, srid = 4326), 'home_address', options['k'] + 1).values_list('id', flat = True))
+                for _, point in origin_users
+            ]
+
+        runs = {'numpy': numpy_path}
+        if connection.vendor == 'postgresql':
+            runs['orm'] = orm_path
+
+        for name, run in runs.items():
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                run()
+                timings.append(time.perf_counter() - started)
+            self.stdout.write(
+                f'{name:<6} {len(origin_users)} origins x k={options["k"]}: '
+                f'median {statistics.median(timings) * 1000:9.1f} ms '
+                f'({len(origin_users) / statistics.median(timings):,.0f} origins/s)'
+            )
@@ -0,0 +1,56 @@
+import random
+import statistics
+import time
+from django.contrib.gis.geos import Point
+from django.core.management.base import BaseCommand
+from django.db import connection
+from apps.authentication import spatial_index
+from apps.authentication.proximity import *
+
+
+class Command(BaseCommand):
+    help = 'Compares UserFindView proximity queries on the database against the in-process spatial index.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type = int, default = 200)
+        parser.add_argument('--radius', type = float, default = DEFAULT_RADIUS_KM, help = 'Radius in km.')
+        parser.add_argument('--nearest', type = int, default = 10)
+        parser.add_argument('--address', choices = ['home', 'office'], default = 'home')
+        parser.add_argument('--seed', type = int, default = 0)
+
+    def handle(self, *args, **options):
+        field = f"{options['address']}_address"
+        rng = random.Random(options['seed'])
+
+        started = time.perf_counter()
+        index = spatial_index.get_index(field)
+        self.stdout.write(f'Index build: {len(index)} points in {(time.perf_counter() - started) * 1000:.1f} ms')
+        if not len(index):
+            self.stdout.write('No users to query.')
+            return
+
+        # Sample search points around existing users so the queries hit dense areas.
+        anchors = [rng.choice(index.points()) for _ in range(options['queries'])]
+        points = [Point(lon + rng.uniform(-0.05, 0.05), lat + rng.uniform(-0.05, 0.05), srid = 4326) for lon, lat in anchors]
+
+        runs = {
+            'index radius': lambda point: indexed_users_within(point, field, options['radius']),
+            'index nearest': lambda point: indexed_nearest_users(point, field, options['nearest']),
+        }
+        if connection.vendor == 'postgresql':
+            runs['db radius'] = lambda point: list(users_within(point, field, options['radius']).values_list('id', flat = True))
+            runs['db nearest'] = lambda point: list(nearest_users(point, field, options['nearest']).values_list('id', flat = True))
+
+        for name, run in runs.items():
+            timings = []
+            for point in points:
+                started = time.perf_counter()
+                run(point)
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            self.stdout.write(
+                f'{name:<14} p50 {statistics.median(timings):8.3f} ms   '
+                f'p95 {timings[int(len(timings) * 0.95) - 1]:8.3f} ms   '
+                f'max {timings[-1]:8.3f} ms'
+            )
+
@@ -0,0 +1,51 @@
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from apps.authentication.models import User, WorkDistance, AreaOfInterest, Document
+from apps.authentication.renderers import ORJSONRenderer
+from apps.authentication.serializers import UserSerializer, WorkDistanceSerializer, AreaOfInterestSerializer, DocumentSerializer
+from apps.authentication.values import ValuesSerializer
+
+ENDPOINTS = {
+    'users': (User, UserSerializer),
+    'work-distances': (WorkDistance, WorkDistanceSerializer),
+    'areas-of-interest': (AreaOfInterest, AreaOfInterestSerializer),
+    'documents': (Document, DocumentSerializer),
+}
+
+
+class Command(BaseCommand):
+    help = 'Compares model serializers + JSONRenderer with .values() rows + ORJSONRenderer for each list endpoint.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type = int, default = 100, help = 'Rows per page.')
+        parser.add_argument('--repeat', type = int, default = 20)
+
+    def handle(self, *args, **options):
+        for name, (model, serializer_class) in ENDPOINTS.items():
+            queryset = model.objects.order_by('id')[:options['rows']]
+            values = ValuesSerializer(serializer_class)
+            runs = {
+                'serializer+json': lambda: JSONRenderer().render(serializer_class(list(queryset), many = True).data),
+                'values+orjson': lambda: ORJSONRenderer().render(values.to_representation(list(values.queryset(queryset)))),
+            }
+
+            rows = queryset.count()
+            if not rows:
+                self.stdout.write(f'{name:<18} no rows')
+                continue
+
+            medians = {}
+            for run_name, run in runs.items():
+                timings = []
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    run()
+                    timings.append(time.perf_counter() - started)
+                medians[run_name] = statistics.median(timings)
+                self.stdout.write(
+                    f'{name:<18} {run_name:<16} {rows} rows: median {medians[run_name] * 1000:8.2f} ms '
+                    f'({rows / medians[run_name]:,.0f} rows/s)'
+                )
+            self.stdout.write(f'{name:<18} speed-up x{medians["serializer+json"] / medians["values+orjson"]:.1f}')
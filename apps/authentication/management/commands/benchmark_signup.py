@@ -0,0 +1,67 @@
+import statistics
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from apps.authentication.models import User
+
+
+class Command(BaseCommand):
+    help = 'Posts concurrent signups and reports the SQL writes and round trips each one costs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type = int, default = 200)
+        parser.add_argument('--concurrency', type = int, default = 8)
+
+    def handle(self, *args, **options):
+        run = uuid.uuid4().hex[:8]
+        payloads = [
+            {
+                'email': f'bench-{run}-{i}@example.com',
+                'password': 'Str0ng-Passw0rd',
+                'first_name': 'Bench',
+                'country': 'Nepal',
+                'phone_number': '+9779860099345',
+                'date_of_birth': '1998-12-12'
+            }
+            for i in range(options['requests'])
+        ]
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers = options['concurrency']) as executor:
+            results = list(executor.map(self._signup, payloads))
+        elapsed = time.perf_counter() - started
+
+        try:
+            statuses = Counter(status for status, _, _ in results)
+            round_trips = [len(queries) for _, queries, _ in results]
+            writes = Counter()
+            for _, queries, _ in results:
+                for query in queries:
+                    verb = query['sql'].lstrip().split(' ', 1)[0].upper()
+                    if verb in ('INSERT', 'UPDATE', 'DELETE'):
+                        writes[verb] += 1
+            latencies = sorted(latency for _, _, latency in results)
+
+            self.stdout.write(f'Signups: {len(results)} in {elapsed:.2f}s ({len(results) / elapsed:.1f}/s), statuses {dict(statuses)}')
+            self.stdout.write(f'Round trips per signup: mean {statistics.mean(round_trips):.2f}, max {max(round_trips)}')
+            for verb, count in sorted(writes.items()):
+                self.stdout.write(f'{verb} per signup: {count / len(results):.2f}')
+            self.stdout.write(f'Latency p50 {statistics.median(latencies):.1f} ms, p95 {latencies[int(len(latencies) * 0.95) - 1]:.1f} ms')
+        finally:
+            User.objects.filter(email__startswith = f'bench-{run}-').delete()
+
+    def _signup(self, payload: dict) -> tuple[int, list[dict], float]:
+        client = APIClient(HTTP_HOST = 'localhost')
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = client.post('/api/user/signup/', payload)
+                latency = (time.perf_counter() - started) * 1000
+            return response.status_code, queries.captured_queries, latency
+        finally:
+            connection.close()
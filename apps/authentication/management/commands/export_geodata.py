@@ -0,0 +1,35 @@
+import sys
+from django.core.management.base import BaseCommand
+from apps.authentication.exports import EXPORTS, FORMATS, export
+from apps.authentication.routers import replica_reads
+
+
+class Command(BaseCommand):
+    help = 'Streams users, work distances or areas of interest as GeoJSON or NDJSON ("-" for stdout).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices = list(EXPORTS))
+        parser.add_argument('path', nargs = '?', default = '-')
+        parser.add_argument('--format', choices = list(FORMATS), default = 'ndjson')
+        parser.add_argument('--address', choices = ['home', 'office'], default = 'home', help = 'Which user address to use as geometry.')
+        parser.add_argument('--gzip', action = 'store_true')
+        parser.add_argument('--primary', action = 'store_true', help = 'Read from the primary instead of a replica.')
+
+    def handle(self, *args, **options):
+        with replica_reads(allowed = not options['primary']):
+            self.write(options)
+
+    def write(self, options):
+        chunks = export(options['kind'], options['format'], options['address'], options['gzip'])
+        if options['path'] == '-':
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+            return
+
+        written = 0
+        with open(options['path'], 'wb') as output:
+            for chunk in chunks:
+                output.write(chunk)
+                written += len(chunk)
+        self.stderr.write(self.style.SUCCESS(f"Wrote {written} bytes to {options['path']}."))
@@ -0,0 +1,34 @@
+import json
+import sys
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from apps.authentication.importer import UserImporter, read_rows, DEFAULT_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Bulk imports users from a CSV or NDJSON file ("-" for stdin).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices = ['csv', 'ndjson'], help = 'Defaults to the file extension.')
+        parser.add_argument('--batch-size', type = int, default = DEFAULT_BATCH_SIZE)
+        parser.add_argument('--workers', type = int, default = settings.USER_IMPORT_WORKERS, help = 'Password hashing processes.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or Path(path).suffix.lstrip('.').lower()
+        if format not in ('csv', 'ndjson'):
+            raise CommandError('Pass --format csv or --format ndjson.')
+
+        importer = UserImporter(options['batch_size'], options['workers'])
+        if path == '-':
+            sys.stdin.reconfigure(errors = 'surrogateescape')
+            report = importer.run(read_rows(sys.stdin, format))
+        else:
+            with open(path, newline = '', encoding = 'utf-8', errors = 'surrogateescape') as stream:
+                report = importer.run(read_rows(stream, format))
+
+        for error in report['errors']:
+            self.stderr.write(json.dumps(error, default = str))
+        self.stdout.write(self.style.SUCCESS(f"Created {report['created']} users, {report['failed']} rows failed."))
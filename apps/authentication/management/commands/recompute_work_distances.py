@@ -0,0 +1,45 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from apps.authentication.models import WorkDistanceRecomputeChunk
+from apps.authentication.tasks import (
+    plan_work_distance_recompute,
+    recompute_work_distances,
+    recompute_work_distance_chunk,
+    work_distance_recompute_progress,
+)
+
+
+class Command(BaseCommand):
+    help = 'Recomputes every WorkDistance from user addresses with set-based SQL, in resumable id-range chunks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type = int, default = settings.WORK_DISTANCE_RECOMPUTE_CHUNK_SIZE)
+        parser.add_argument('--resume', metavar = 'RUN', help = 'Resume an interrupted run.')
+        parser.add_argument('--status', metavar = 'RUN', help = 'Show the progress of a run and exit.')
+        parser.add_argument('--sync', action = 'store_true', help = 'Process chunks in this process instead of on Celery workers.')
+
+    def handle(self, *args, **options):
+        if options['status']:
+            self._report(work_distance_recompute_progress(options['status']))
+            return
+
+        if not options['sync']:
+            run = recompute_work_distances.delay(options['resume'], options['chunk_size']).get()
+            self.stdout.write(f'Dispatched run {run}')
+            while True:
+                progress = work_distance_recompute_progress(run)
+                self._report(progress)
+                if progress['done'] >= progress['total']:
+                    return
+                time.sleep(5)
+
+        run = options['resume'] or plan_work_distance_recompute(options['chunk_size'])
+        self.stdout.write(f'Run {run}')
+        pending = WorkDistanceRecomputeChunk.objects.filter(run = run, completed_at = None)
+        for chunk_id in pending.values_list('id', flat = True):
+            recompute_work_distance_chunk(chunk_id)
+            self._report(work_distance_recompute_progress(run))
+
+    def _report(self, progress: dict) -> None:
+        self.stdout.write(f"{progress['run']}: {progress['done']}/{progress['total']} chunks done")
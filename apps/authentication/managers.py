@@ -1,4 +1,7 @@
 from django.contrib.auth.base_user import BaseUserManager
+from django.db import models, transaction, connection
+from django.db.models.functions import ExtractMonth, ExtractDay
+from .cache import bump_resource_version
 
 class UserManager(BaseUserManager):
     use_in_migrations = True
@@ -27,4 +30,202 @@ class UserManager(BaseUserManager):
         if extra_fields.get('is_superuser') is not True:
             raise ValueError('Superuser must have is_superuser=True.')
 
-        return self._create_user(email, password, **extra_fields)
\ No newline at end of file
+        return self._create_user(email, password, **extra_fields)
+
+    def refresh_birthday_keys(self) -> int:
+        """
+        Recomputes every user's birthday key in a single UPDATE. Needed after
+        writes that bypass `User.save`, such as `QuerySet.update` or `bulk_create`.
+        """
+        return self.update(
+            birthday_key = ExtractMonth('date_of_birth') * 100 + ExtractDay('date_of_birth')
+        )
+
+
+class OutgoingEmailManager(models.Manager):
+    def enqueue(self, subject: str, message: str, from_email: str|None, recipient_list: list[str], key: str|None = None, html_message: str|None = None):
+        """
+        Queues one email for the outbox dispatcher. Messages with a `key` are
+        enqueued at most once, so retried callers do not double-send.
+        """
+        return self.enqueue_many([
+            self.model(
+                key = key,
+                subject = subject,
+                body = message,
+                html_body = html_message,
+                from_email = from_email or '',
+                to = list(recipient_list)
+            )
+        ])
+
+    def enqueue_many(self, emails: list) -> list:
+        """
+        Queues already built emails in one INSERT and wakes a dispatcher once
+        the surrounding transaction commits.
+        """
+        from .tasks import dispatch_outbox
+
+        created = self.bulk_create(emails, ignore_conflicts = True)
+        transaction.on_commit(dispatch_outbox.delay)
+        return created
+
+
+class WorkDistanceManager(models.Manager):
+    def refresh_for(self, user, created: bool = False):
+        """
+        Rebuilds a user's commute line and length from their addresses with
+        an UPDATE, or a single INSERT for a newly created user. Returns the
+        inserted row; an updated or removed commute returns None rather than
+        costing `User.save` another query.
+        """
+        from django.contrib.gis.geos import LineString
+        from .spatial_index import haversine
+
+        home, office = user.home_address, user.office_address
+        if home is None or office is None:
+            if not created:
+                self.filter(user = user).delete()
+            return None
+
+        values = {
+            'points': LineString(home, office, srid = 4326),
+            'length': haversine(home.x, home.y, office.x, office.y)
+        }
+        if created or not self.filter(user = user).update(**values):
+            return self.create(user = user, **values)
+        # update() sends no signals.
+        label = self.model._meta.label_lower
+        transaction.on_commit(lambda: bump_resource_version(label))
+        return None
+
+    def recompute_range(self, start_id: int, end_id: int) -> int:
+        """
+        Recomputes the commute of every user with start_id <= id < end_id in a
+        single set-based `INSERT ... ON CONFLICT DO UPDATE`. The length uses
+        the same sphere as `refresh_for`. Returns the number of rows written.
+        """
+        from .models import User
+
+        sql = f"""
+            INSERT INTO {self.model._meta.db_table} (user_id, points, length)
+            SELECT id,
+                   ST_MakeLine(home_address::geometry, office_address::geometry),
+                   ST_Distance(home_address, office_address, false)
+            FROM {User._meta.db_table}
+            WHERE id >= %s AND id < %s
+            ON CONFLICT (user_id) DO UPDATE
+            SET points = EXCLUDED.points, length = EXCLUDED.length
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [start_id, end_id])
+            rows = cursor.rowcount
+        label = self.model._meta.label_lower
+        transaction.on_commit(lambda: bump_resource_version(label))
+        return rows
+
+class UserClusterManager(models.Manager):
+    def _cell_sql(self) -> str:
+        # Same grid as clusters.cell_size(): 360 / (2^zoom * cells per tile) degrees.
+        return '''
+            floor(({x} + 180) / (360.0 / (power(2, z) * %(cells)s)))::int,
+            floor(({y} + 90) / (360.0 / (power(2, z) * %(cells)s)))::int
+        '''
+
+    def _params(self) -> dict:
+        from django.conf import settings
+
+        return {
+            'cells': settings.USER_CLUSTER_CELLS_PER_TILE,
+            'max_zoom': settings.USER_CLUSTER_MATERIALIZED_MAX_ZOOM
+        }
+
+    def _lock(self, cursor) -> None:
+        # Folds and rebuilds must not interleave.
+        cursor.execute(f'LOCK TABLE {self.model._meta.db_table} IN SHARE ROW EXCLUSIVE MODE')
+
+    def fold_deltas(self) -> int:
+        """
+        Moves every pending `UserClusterDelta` into the materialised cells of
+        all coarse zoom levels in one statement, and drops emptied cells.
+        Returns the number of cells written.
+        """
+        from .models import UserClusterDelta
+
+        table, deltas = self.model._meta.db_table, UserClusterDelta._meta.db_table
+        cell = self._cell_sql().format(x = 'd.longitude', y = 'd.latitude')
+        sql = f"""
+            WITH moved AS (
+                DELETE FROM {deltas} RETURNING address, longitude, latitude, country, weight
+            )
+            INSERT INTO {table} AS c (address, zoom, cell_x, cell_y, country, count, sum_longitude, sum_latitude)
+            SELECT d.address, z, {cell}, d.country,
+                   sum(d.weight), sum(d.weight * d.longitude), sum(d.weight * d.latitude)
+            FROM moved d CROSS JOIN generate_series(0, %(max_zoom)s) z
+            GROUP BY 1, 2, 3, 4, 5
+            ON CONFLICT (address, zoom, cell_x, cell_y, country) DO UPDATE
+            SET count = c.count + EXCLUDED.count,
+                sum_longitude = c.sum_longitude + EXCLUDED.sum_longitude,
+                sum_latitude = c.sum_latitude + EXCLUDED.sum_latitude
+        """
+        with transaction.atomic(), connection.cursor() as cursor:
+            self._lock(cursor)
+            cursor.execute(sql, self._params())
+            written = cursor.rowcount
+            cursor.execute(f'DELETE FROM {table} WHERE count <= 0')
+        return written
+
+    def rebuild(self) -> int:
+        """
+        Recomputes every materialised cell from the users table. Pending
+        deltas are discarded in the same statement, so they are neither
+        lost nor counted twice.
+        """
+        from .models import User, UserClusterDelta
+
+        table, deltas, users = self.model._meta.db_table, UserClusterDelta._meta.db_table, User._meta.db_table
+        selects = []
+        for address in ('home', 'office'):
+            x, y = f'ST_X({address}_address::geometry)', f'ST_Y({address}_address::geometry)'
+            selects.append(f"""
+                SELECT '{address}', z, {self._cell_sql().format(x = x, y = y)}, country,
+                       count(*), sum({x}), sum({y})
+                FROM {users} CROSS JOIN generate_series(0, %(max_zoom)s) z
+                WHERE {address}_address IS NOT NULL
+                GROUP BY 1, 2, 3, 4, 5
+            """)
+        sql = f"""
+            WITH dropped AS (DELETE FROM {deltas})
+            INSERT INTO {table} (address, zoom, cell_x, cell_y, country, count, sum_longitude, sum_latitude)
+            {' UNION ALL '.join(selects)}
+        """
+        with transaction.atomic(), connection.cursor() as cursor:
+            self._lock(cursor)
+            cursor.execute(f'DELETE FROM {table}')
+            cursor.execute(sql, self._params())
+            return cursor.rowcount
+
+
+class InterestManager(models.Manager):
+    def resolve(self, name: str):
+        """
+        The vocabulary entry for `name`, created on first use.
+        """
+        from .models import normalize_interest
+
+        interest, _ = self.get_or_create(key = normalize_interest(name), defaults = {'name': ' '.join(name.split())})
+        return interest
+
+    def resolve_many(self, names: list[str]) -> dict:
+        """
+        Resolves many names with one INSERT and one SELECT. Returns a dict
+        from normalised key to `Interest`.
+        """
+        from .models import normalize_interest
+
+        spellings = {normalize_interest(name): ' '.join(name.split()) for name in names}
+        self.bulk_create(
+            [self.model(key = key, name = name) for key, name in spellings.items()],
+            ignore_conflicts = True
+        )
+        return self.in_bulk(list(spellings), field_name = 'key')
@@ -1,11 +1,20 @@
 from __future__ import unicode_literals
+import calendar
+import datetime
+import uuid
 from django.contrib.gis.db import models
 from django.contrib.gis.geos import Point
-from django.core.mail import send_mail
 from django.contrib.auth.models import PermissionsMixin
 from django.contrib.auth.base_user import AbstractBaseUser
+from django.utils.dateparse import parse_date
 from django.utils.translation import gettext_lazy as _
-from .managers import UserManager
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Cast
+from django.contrib.postgres.indexes import GistIndex, GinIndex
+from django.utils import timezone
+from .managers import UserManager, OutgoingEmailManager, WorkDistanceManager, UserClusterManager, InterestManager
+from .cache import set_token_version, get_permissions
 from typing import Any
 from store.countries import *
 from phonenumber_field.modelfields import PhoneNumberField
@@ -16,6 +25,35 @@ document_choices = (
     ('NID', 'NID')
 )
 
+email_status_choices = (
+    ('Pending', 'Pending'),
+    ('Sent', 'Sent'),
+    ('Failed', 'Failed')
+)
+
+def birthday_key(date: datetime.date) -> int:
+    '''
+    Month and day of a date packed as MMDD, e.g. 1212 for 12th December.
+    '''
+    return date.month * 100 + date.day
+
+def birthday_keys_for(date: datetime.date) -> list[int]:
+    '''
+    Birthday keys celebrated on the given day. Users born on 29th February
+    are wished on 28th February in common years.
+    '''
+    keys = [birthday_key(date)]
+    if date.month == 2 and date.day == 28 and not calendar.isleap(date.year):
+        keys.append(229)
+    return keys
+
+def normalize_interest(name: str) -> str:
+    '''
+    Vocabulary key of an interest: case-folded with whitespace collapsed, so
+    "Machine  Learning" and "machine learning" are the same interest.
+    '''
+    return ' '.join(name.split()).casefold()
+
 class User(AbstractBaseUser, PermissionsMixin):
     email = models.EmailField(
         'email address',
@@ -56,6 +94,11 @@ class User(AbstractBaseUser, PermissionsMixin):
     ) 
     phone_number = PhoneNumberField()
     date_of_birth = models.DateField()
+    birthday_key = models.PositiveSmallIntegerField(
+        editable = False,
+        db_index = True,
+        null = True
+    )
     home_address = models.PointField(
         geography = True,
         default = Point(0.0, 0.0)
@@ -64,8 +107,19 @@ class User(AbstractBaseUser, PermissionsMixin):
         geography = True,
         default = Point(0.0, 0.0)
     )
+    token_version = models.PositiveIntegerField(
+        default = 0,
+        editable = False
+    )
     
     objects = UserManager()
+    
+    # Changing any of these invalidates the user's issued tokens.
+    TOKEN_FIELDS = ('password', 'is_active', 'is_staff', 'is_admin', 'is_superuser')
+    # Changing any of these recomputes the user's WorkDistance.
+    ADDRESS_FIELDS = ('home_address', 'office_address')
+    # Changing any of these moves the user between map clusters.
+    CLUSTER_FIELDS = ('home_address', 'office_address', 'country')
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['country', 'phone_number', 'date_of_birth']
@@ -73,6 +127,12 @@ class User(AbstractBaseUser, PermissionsMixin):
     class Meta:
         verbose_name = _('user')
         verbose_name_plural = _('users')
+        indexes = [
+            # Vector tiles select addresses by geometry bbox, which the
+            # geography indexes cannot serve.
+            GistIndex(Cast('home_address', models.PointField(srid = 4326)), name = 'user_home_geometry_idx'),
+            GistIndex(Cast('office_address', models.PointField(srid = 4326)), name = 'user_office_geometry_idx')
+        ]
 
     @property
     def get_full_name(self):
@@ -89,22 +149,183 @@ class User(AbstractBaseUser, PermissionsMixin):
         '''
         return self.first_name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_state = instance._get_loaded_state()
+        return instance
+
+    def _get_loaded_state(self) -> dict:
+        # Read __dict__ directly so deferred fields are not fetched.
+        fields = (*self.TOKEN_FIELDS, *self.CLUSTER_FIELDS)
+        return {field: self.__dict__[field] for field in fields if field in self.__dict__}
+
+    def _changed_fields(self, update_fields) -> set[str]:
+        loaded_state = getattr(self, '_loaded_state', None)
+        if loaded_state is None:
+            return set()
+        changed = {field for field, value in loaded_state.items() if self.__dict__.get(field) != value}
+        return changed if update_fields is None else changed & set(update_fields)
+
+    def revoke_tokens(self) -> None:
+        '''
+        Invalidates every token issued to this User so far.
+        '''
+        self.token_version += 1
+        self.save(update_fields = ['token_version'])
+
+    def save(self, *args: Any, **kwargs: Any) -> None:
+        if isinstance(self.date_of_birth, str):
+            self.date_of_birth = parse_date(self.date_of_birth)
+        self.birthday_key = birthday_key(self.date_of_birth) if self.date_of_birth else None
+        update_fields = kwargs.get('update_fields')
+        extra_fields = {'birthday_key'} if 'date_of_birth' in (update_fields or ()) else set()
+        
+        adding = self._state.adding
+        changed = self._changed_fields(update_fields)
+        if changed & set(self.TOKEN_FIELDS):
+            self.token_version += 1
+            extra_fields.add('token_version')
+        
+        if update_fields is not None and extra_fields:
+            kwargs['update_fields'] = {*update_fields, *extra_fields}
+        super().save(*args, **kwargs)
+        
+        if adding or changed & set(self.ADDRESS_FIELDS):
+            WorkDistance.objects.refresh_for(self, created = adding)
+        
+        self._loaded_state = self._get_loaded_state()
+        pk, version = self.pk, self.token_version
+        transaction.on_commit(lambda: set_token_version(pk, version))
+
+    def has_perm(self, perm: str, obj: Any = None) -> bool:
+        '''
+        Model-level checks are answered from the shared permission cache
+        instead of querying user and group permissions on every request.
+        '''
+        if obj is not None:
+            return super().has_perm(perm, obj)
+        if not self.is_active:
+            return False
+        return self.is_superuser or perm in get_permissions(self)
+
     def email_user(self, subject: str, message: str, from_email: str|None = None, **kwargs: Any):
         '''
-        Sends an email to this User.
+        Queues an email to this User in the outbox.
         '''
-        send_mail(subject, message, from_email, [self.email], **kwargs)
+        OutgoingEmail.objects.enqueue(
+            subject,
+            message,
+            from_email,
+            [self.email],
+            key = kwargs.get('key'),
+            html_message = kwargs.get('html_message')
+        )
         
     def __str__(self) -> str:
         return str(self.id)
         
 
 class WorkDistance(models.Model):
+    '''
+    A user's commute, derived from their home and office addresses whenever
+    either changes. `length` is the great-circle length in metres and is
+    indexed, so filtering and sorting by commute length are index scans.
+    '''
     user = models.OneToOneField(
         User,
         on_delete = models.CASCADE
     )
     points = models.LineStringField()
+    length = models.FloatField(
+        db_index = True,
+        null = True
+    )
+    
+    objects = WorkDistanceManager()
+    
+    
+class WorkDistanceRecomputeChunk(models.Model):
+    '''
+    One user id range of a bulk WorkDistance recomputation run. Completed
+    chunks are skipped when an interrupted run is resumed.
+    '''
+    run = models.UUIDField(db_index = True)
+    start_id = models.BigIntegerField()
+    end_id = models.BigIntegerField()
+    rows = models.IntegerField(
+        blank = True,
+        null = True
+    )
+    completed_at = models.DateTimeField(
+        blank = True,
+        null = True
+    )
+    
+    class Meta:
+        ordering = ['start_id']
+    
+    
+class UserCluster(models.Model):
+    '''
+    Number of users per map grid cell, address and country for the coarse
+    zoom levels. Coordinate sums are kept so cluster centroids can be
+    updated incrementally by folding in `UserClusterDelta` rows.
+    '''
+    address = models.CharField(max_length = 6)
+    zoom = models.PositiveSmallIntegerField()
+    cell_x = models.IntegerField()
+    cell_y = models.IntegerField()
+    country = models.CharField(max_length = 50)
+    count = models.IntegerField(default = 0)
+    sum_longitude = models.FloatField(default = 0)
+    sum_latitude = models.FloatField(default = 0)
+    
+    objects = UserClusterManager()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields = ['address', 'zoom', 'cell_x', 'cell_y', 'country'],
+                name = 'user_cluster_cell_unique'
+            )
+        ]
+        
+        
+class UserClusterDelta(models.Model):
+    '''
+    A user entering (weight 1) or leaving (weight -1) a location. Appended
+    in the saving transaction, so hot coarse cells are never locked by
+    user saves, and folded into `UserCluster` in batches.
+    '''
+    address = models.CharField(max_length = 6)
+    longitude = models.FloatField()
+    latitude = models.FloatField()
+    country = models.CharField(max_length = 50)
+    weight = models.SmallIntegerField()
+    
+    
+class Interest(models.Model):
+    '''
+    Shared interest vocabulary. Each interest is stored once under its
+    normalised `key`, which has a trigram index for autocomplete and fuzzy
+    search (requires the pg_trgm extension).
+    '''
+    key = models.CharField(
+        max_length = 150,
+        unique = True
+    )
+    name = models.CharField(max_length = 150)
+    
+    objects = InterestManager()
+    
+    class Meta:
+        indexes = [
+            GinIndex(fields = ['key'], opclasses = ['gin_trgm_ops'], name = 'interest_key_trgm_idx')
+        ]
+        
+    def __str__(self) -> str:
+        return self.name
     
     
 class AreaOfInterest(models.Model):
@@ -112,13 +333,40 @@ class AreaOfInterest(models.Model):
         User,
         on_delete = models.CASCADE
     )
-    interest = models.CharField(max_length = 150)
+    interest = models.ForeignKey(
+        Interest,
+        on_delete = models.PROTECT,
+        related_name = 'areas'
+    )
     
     class Meta:
         ordering = ['-id']
+        indexes = [
+            # Inverted index: the users of an interest without touching the table.
+            models.Index(fields = ['interest', 'user'], name = 'area_interest_user_idx')
+        ]
         
     def __str__(self) -> str:
-        return self.interest
+        return self.interest.name
+    
+    
+class DocumentBlob(models.Model):
+    '''
+    Content-addressed document file. Identical uploads share one stored file,
+    which is deleted when the last referencing `Document` goes away.
+    '''
+    sha256 = models.CharField(
+        max_length = 64,
+        unique = True
+    )
+    file = models.FileField(
+        upload_to = 'documents/'
+    )
+    size = models.BigIntegerField()
+    ref_count = models.PositiveIntegerField(default = 0)
+    
+    def __str__(self) -> str:
+        return self.sha256
     
     
 class Document(models.Model):
@@ -133,9 +381,101 @@ class Document(models.Model):
     document = models.FileField(
         upload_to = 'documents/'
     )
+    blob = models.ForeignKey(
+        DocumentBlob,
+        on_delete = models.PROTECT,
+        blank = True,
+        null = True
+    )
     
     class Meta:
         ordering = ['-id']
         
     def __str__(self) -> str:
-        return self.user.get_full_name
\ No newline at end of file
+        return self.user.get_full_name
+    
+    
+class DocumentUpload(models.Model):
+    '''
+    A chunked, resumable document upload in progress. Chunks are appended to
+    a staging file and hashed as they stream in; the per-chunk digests make
+    up the content hash once the upload completes.
+    '''
+    id = models.UUIDField(
+        primary_key = True,
+        default = uuid.uuid4,
+        editable = False
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete = models.CASCADE
+    )
+    document_type = models.CharField(
+        choices = document_choices,
+        max_length = 25
+    )
+    filename = models.CharField(
+        max_length = 255,
+        blank = True,
+        default = ''
+    )
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default = 0)
+    chunk_digests = models.JSONField(default = list)
+    created_at = models.DateTimeField(auto_now_add = True)
+    updated_at = models.DateTimeField(auto_now = True)
+    
+    
+class OutgoingEmail(models.Model):
+    '''
+    Transactional email outbox. Rows are written cheaply by any code path and
+    delivered in batches by the `dispatch_outbox` task.
+    '''
+    key = models.CharField(
+        max_length = 255,
+        unique = True,
+        null = True,
+        blank = True
+    )
+    subject = models.CharField(max_length = 255)
+    body = models.TextField()
+    html_body = models.TextField(
+        blank = True,
+        null = True
+    )
+    from_email = models.CharField(
+        max_length = 255,
+        blank = True
+    )
+    to = models.JSONField()
+    status = models.CharField(
+        choices = email_status_choices,
+        max_length = 10,
+        default = 'Pending'
+    )
+    attempts = models.PositiveSmallIntegerField(default = 0)
+    last_error = models.TextField(
+        blank = True,
+        null = True
+    )
+    created_at = models.DateTimeField(auto_now_add = True)
+    next_attempt_at = models.DateTimeField(default = timezone.now)
+    sent_at = models.DateTimeField(
+        blank = True,
+        null = True
+    )
+    
+    objects = OutgoingEmailManager()
+    
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(
+                fields = ['next_attempt_at', 'id'],
+                condition = Q(status = 'Pending'),
+                name = 'outgoing_email_pending_idx'
+            )
+        ]
+        
+    def __str__(self) -> str:
+        return self.subject
\ No newline at end of file
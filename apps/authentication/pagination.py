@@ -0,0 +1,29 @@
+from rest_framework.pagination import PageNumberPagination, CursorPagination
+
+
+class StandardPagination(PageNumberPagination):
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class StandardCursorPagination(CursorPagination):
+    '''
+    Keyset pagination over the primary key.
+
+    Pages are fetched with `WHERE id < <cursor> ORDER BY id DESC LIMIT n`,
+    so neither a COUNT(*) nor an OFFSET scan is issued however deep a client
+    pages.
+    '''
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = '-id'
+
+
+
+class CommuteCursorPagination(StandardCursorPagination):
+    '''
+    Keyset pagination over the indexed commute length, shortest first.
+    '''
+    ordering = ('length', 'id')
@@ -0,0 +1,95 @@
+from django.contrib.gis.db.models import GeometryField
+from django.contrib.gis.db.models.functions import Distance
+from django.contrib.gis.geos import Point
+from django.contrib.gis.measure import D
+from django.db.models import Func, FloatField, Value
+from django.db.models.query import QuerySet
+from .models import User
+from . import spatial_index
+
+ADDRESS_FIELDS = ('home_address', 'office_address')
+DEFAULT_RADIUS_KM = 10
+MAX_RADIUS_KM = 500
+MAX_NEAREST = 100
+
+
+class KNNDistance(Func):
+    '''
+    PostGIS `<->` operator. Used in ORDER BY it lets the planner walk the
+    GiST index on the geography column nearest-first instead of sorting
+    every candidate row.
+    '''
+    arg_joiner = ' <-> '
+    template = '%(expressions)s'
+    output_field = FloatField()
+
+
+def _geography(point: Point) -> Value:
+    return Value(point, output_field = GeometryField(geography = True, srid = 4326))
+
+
+def _by_distance(queryset: QuerySet, point: Point, field: str) -> QuerySet:
+    '''
+    Annotates the exact geodesic distance (for the response) and orders by
+    the index-assisted KNN operator.
+    '''
+    return queryset.annotate(
+        distance = Distance(field, point)
+    ).order_by(KNNDistance(field, _geography(point)), 'id')
+
+
+def users_within(point: Point, field: str = 'home_address', radius_km: float = DEFAULT_RADIUS_KM) -> QuerySet:
+    '''
+    Users whose `field` lies within `radius_km` of `point`, nearest first.
+    The filter compiles to `ST_DWithin`, which is answered from the GiST index.
+    '''
+    if field not in ADDRESS_FIELDS:
+        raise ValueError(f'Unknown address field: {field}')
+    queryset = User.objects.filter(**{
+        f'{field}__dwithin': (point, D(km = radius_km))
+    })
+    return _by_distance(queryset, point, field)
+
+
+def nearest_users(point: Point, field: str = 'home_address', limit: int = 10, radius_km: float|None = None) -> QuerySet:
+    '''
+    The `limit` users whose `field` is closest to `point`, optionally bounded
+    by `radius_km`.
+    '''
+    if field not in ADDRESS_FIELDS:
+        raise ValueError(f'Unknown address field: {field}')
+    if radius_km is not None:
+        return users_within(point, field, radius_km)[:limit]
+    return _by_distance(User.objects.all(), point, field)[:limit]
+
+
+def use_spatial_index() -> bool:
+    '''
+    The in-process index answers proximity queries when it is switched on
+    or when the database has no PostGIS `ST_DWithin`/`<->` to lean on.
+    '''
+    return spatial_index.is_used()
+
+
+def indexed_users_within(point: Point, field: str = 'home_address', radius_km: float = DEFAULT_RADIUS_KM) -> list[tuple[int, float]]:
+    return spatial_index.get_index(field).within(point.x, point.y, radius_km * 1000)
+
+
+def indexed_nearest_users(point: Point, field: str = 'home_address', limit: int = 10, radius_km: float|None = None) -> list[tuple[int, float]]:
+    radius_m = None if radius_km is None else radius_km * 1000
+    return spatial_index.get_index(field).nearest(point.x, point.y, limit, radius_m)
+
+
+def hydrate(hits: list[tuple[int, float]]) -> list[User]:
+    '''
+    Loads the users for (id, distance) index hits, keeping the hit order and
+    setting `distance` the way the database path annotates it.
+    '''
+    users = User.objects.in_bulk([pk for pk, _ in hits])
+    instance = []
+    for pk, distance in hits:
+        user = users.get(pk)
+        if user is not None:
+            user.distance = D(m = distance)
+            instance.append(user)
+    return instance
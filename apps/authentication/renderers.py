@@ -0,0 +1,50 @@
+import math
+import orjson
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+
+def has_non_finite(data) -> bool:
+    if isinstance(data, float):
+        return not math.isfinite(data)
+    if isinstance(data, dict):
+        return any(has_non_finite(value) for value in data.values())
+    if isinstance(data, (list, tuple)):
+        return any(has_non_finite(value) for value in data)
+    return False
+
+
+class ORJSONRenderer(JSONRenderer):
+    '''
+    JSONRenderer with the encoding done by orjson. Anything orjson does not
+    handle natively, including datetimes so their format stays the same, is
+    passed to DRF's encoder.
+
+    orjson writes NaN and infinities as null. With `STRICT_JSON` (the
+    default) they raise ValueError instead, as with JSONRenderer. Only
+    output containing a null is scanned for them.
+    '''
+    options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type = None, renderer_context = None) -> bytes:
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type or '', renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(data, default = self.encoder_class().default, option = self.options)
+        if self.strict and b'null' in ret and has_non_finite(data):
+            raise ValueError('Out of range float values are not JSON compliant')
+        # Same escaping as JSONRenderer, so the output is valid JavaScript.
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class ORJSONParser(JSONParser):
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type = None, parser_context = None):
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as ex:
+            raise ParseError(f'JSON parse error - {ex}')
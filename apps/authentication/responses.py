@@ -0,0 +1,79 @@
+import functools
+import hashlib
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from rest_framework.response import Response
+from .cache import local_cache, get_resource_versions, RESPONSE_CACHE_TIMEOUT
+from .routers import primary_reads
+
+
+def permission_scope(user, perm: str|None) -> str:
+    '''
+    Requesters holding `perm` share cached responses; anyone else only
+    shares with themselves. Admins are kept apart since some views
+    serialize more fields for them. Without `perm` the view is public.
+    '''
+    if perm is None:
+        return 'public'
+    if not user.is_authenticated:
+        return 'anonymous'
+    role = 'admin' if user.is_admin or user.is_superuser else 'user'
+    return f'{role}:all' if user.has_perm(perm) else f'{role}:{user.pk}'
+
+
+def cached_response(*models, perm: str|None = None):
+    '''
+    Caches the data of a read view's 200 responses in the local and Redis
+    caches, keyed by URL, permission scope and the versions of `models`,
+    which signals bump on every change. Responses carry an ETag derived
+    from that key, and matching conditional requests get a 304 without
+    touching the database. There is no Last-Modified: a whole-second time
+    shared by every scope could validate a response from before a change
+    made within the same second, or one cached for another scope.
+
+    Permission checks stay inside the view: an entry only exists for a
+    scope once the view has answered it with a 200 at the same versions.
+    Cache fills read from the primary, since a lagging replica could
+    otherwise store old rows under the new versions.
+    '''
+    labels = [model._meta.label_lower for model in models]
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            versions = get_resource_versions(labels)
+            scope = permission_scope(request.user, perm)
+            key = ':'.join([
+                'responses',
+                type(self).__name__,
+                scope,
+                *versions.values(),
+                hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+            ])
+            etag = f'W/"{hashlib.md5(key.encode()).hexdigest()}"'
+
+            data = local_cache.get(key)
+            if data is None:
+                data = cache.get(key)
+                if data is not None:
+                    local_cache.set(key, data, RESPONSE_CACHE_TIMEOUT)
+            
+            if data is None:
+                with primary_reads():
+                    response = method(self, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                cache.set(key, response.data, RESPONSE_CACHE_TIMEOUT)
+                local_cache.set(key, response.data, RESPONSE_CACHE_TIMEOUT)
+            else:
+                response = Response(data)
+            
+            not_modified = get_conditional_response(request, etag = etag)
+            if not_modified is not None:
+                response = not_modified
+            response['ETag'] = etag
+            response['Cache-Control'] = 'private, no-cache'
+            patch_vary_headers(response, ('Authorization',))
+            return response
+        return wrapper
+    return decorator
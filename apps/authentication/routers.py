@@ -0,0 +1,236 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, Error, connections
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from .authentication import TokenUserAuthentication
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+REPLICA_STICKY_SECONDS = getattr(settings, 'REPLICA_STICKY_SECONDS', 10)
+REPLICA_MAX_LAG_SECONDS = getattr(settings, 'REPLICA_MAX_LAG_SECONDS', 5)
+REPLICA_HEALTH_CHECK_INTERVAL = getattr(settings, 'REPLICA_HEALTH_CHECK_INTERVAL', 10)
+PIN_COOKIE = 'db_primary'
+
+# Seconds of replay lag, or NULL on a server that is not a standby.
+LAG_SQL = '''
+    SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+           END
+'''
+
+
+class ReadState:
+    '''
+    Whether the current request or job may read from replicas, and whether
+    it has written, after which it reads from the primary too.
+    '''
+    def __init__(self, allowed: bool):
+        self.allowed = allowed
+        self.wrote = False
+
+
+_state: ContextVar[ReadState|None] = ContextVar('replica_read_state', default = None)
+# alias -> (checked at, healthy), per process.
+_health: dict[str, tuple[float, bool]] = {}
+
+
+@contextmanager
+def replica_reads(allowed: bool = True):
+    '''
+    Lets reads inside the block go to replicas, for code that runs outside a
+    request (management commands, scripts).
+    '''
+    state = ReadState(allowed)
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    '''
+    Sends the reads inside the block to the primary, for results that must
+    not be older than the last commit (e.g. responses cached under the
+    current resource versions).
+    '''
+    state = _state.get()
+    allowed = state is not None and state.allowed
+    if allowed:
+        state.allowed = False
+    try:
+        yield
+    finally:
+        if allowed:
+            state.allowed = True
+
+
+def _reset(token) -> None:
+    try:
+        _state.reset(token)
+    except ValueError:
+        # The body was sent from another context (a thread under ASGI), which
+        # only ever saw a copy of the state.
+        pass
+
+
+def _reset_after(content, token):
+    try:
+        yield from content
+    finally:
+        _reset(token)
+
+
+async def _areset_after(content, token):
+    try:
+        async for part in content:
+            yield part
+    finally:
+        _reset(token)
+
+
+def _replica_lag(alias: str) -> float|None:
+    with connections[alias].cursor() as cursor:
+        cursor.execute(LAG_SQL)
+        return cursor.fetchone()[0]
+
+
+def is_healthy(alias: str) -> bool:
+    '''
+    Whether `alias` answers and lags the primary by at most
+    `REPLICA_MAX_LAG_SECONDS`. Checked at most once per
+    `REPLICA_HEALTH_CHECK_INTERVAL` in each process.
+    '''
+    now = time.monotonic()
+    checked = _health.get(alias)
+    if checked is not None and now - checked[0] < REPLICA_HEALTH_CHECK_INTERVAL:
+        return checked[1]
+
+    try:
+        lag = _replica_lag(alias)
+        healthy = lag is None or lag <= REPLICA_MAX_LAG_SECONDS
+    except Error:
+        connections[alias].close()
+        healthy = False
+    _health[alias] = (now, healthy)
+    return healthy
+
+
+class ReplicaRouter:
+    '''
+    Sends reads to a healthy replica from `DATABASE_REPLICAS` when the
+    current request allows it (see `ReplicaReadMiddleware`), and everything
+    else to the primary: writes, reads inside a transaction, reads about
+    objects loaded from the primary and every read once the request wrote
+    or its user wrote within `REPLICA_STICKY_SECONDS`. With no healthy
+    replica, reads fall back to the primary.
+    '''
+    def db_for_read(self, model, **hints) -> str:
+        state = _state.get()
+        if state is None or not state.allowed or state.wrote:
+            return DEFAULT_DB_ALIAS
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db == DEFAULT_DB_ALIAS:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+
+        replicas = [alias for alias in getattr(settings, 'DATABASE_REPLICAS', []) if is_healthy(alias)]
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints) -> str:
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints) -> bool|None:
+        databases = {DEFAULT_DB_ALIAS, *getattr(settings, 'DATABASE_REPLICAS', [])}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db: str, app_label: str, model_name: str|None = None, **hints) -> bool:
+        return db == DEFAULT_DB_ALIAS
+
+
+def pin_key(user_id: int) -> str:
+    return f'db:primary-pin:{user_id}'
+
+
+def _token_user_id(request) -> int|None:
+    # Only the token's signature and expiry are checked; a revoked token at
+    # worst pins its user to the primary.
+    authentication = TokenUserAuthentication()
+    header = authentication.get_header(request)
+    if header is None:
+        return None
+    try:
+        raw_token = authentication.get_raw_token(header)
+        if raw_token is None:
+            return None
+        return authentication.get_validated_token(raw_token)[api_settings.USER_ID_CLAIM]
+    except (AuthenticationFailed, KeyError):
+        return None
+
+
+class ReplicaReadMiddleware:
+    '''
+    Allows replica reads for safe-method requests, unless the requester
+    wrote within `REPLICA_STICKY_SECONDS`: requests that write pin their
+    user (by access token, or by cookie for anonymous clients) to the
+    primary for that long, so they read their own writes.
+
+    Runs natively in both modes, so async views are not pushed onto a
+    thread under ASGI.
+    '''
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        user_id = _token_user_id(request)
+        pinned = user_id is not None and cache.get(pin_key(user_id)) is not None
+        token, state = self.start(request, pinned)
+        response = self.get_response(request)
+        if state.wrote and user_id is not None:
+            cache.set(pin_key(user_id), True, REPLICA_STICKY_SECONDS)
+        return self.finish(response, token, state)
+
+    async def __acall__(self, request):
+        user_id = _token_user_id(request)
+        pinned = user_id is not None and await cache.aget(pin_key(user_id)) is not None
+        token, state = self.start(request, pinned)
+        response = await self.get_response(request)
+        if state.wrote and user_id is not None:
+            await cache.aset(pin_key(user_id), True, REPLICA_STICKY_SECONDS)
+        return self.finish(response, token, state)
+
+    def start(self, request, pinned: bool):
+        state = ReadState(request.method in SAFE_METHODS and not pinned and PIN_COOKIE not in request.COOKIES)
+        return _state.set(state), state
+
+    def finish(self, response, token, state: ReadState):
+        # Streamed responses run their queries while the body is sent, so
+        # their state is reset once the stream is exhausted or closed.
+        if not response.streaming:
+            _state.reset(token)
+        elif response.is_async:
+            response.streaming_content = _areset_after(response.streaming_content, token)
+        else:
+            response.streaming_content = _reset_after(response.streaming_content, token)
+        if state.wrote:
+            response.set_cookie(PIN_COOKIE, '1', max_age = REPLICA_STICKY_SECONDS, httponly = True, samesite = 'Lax')
+        return response
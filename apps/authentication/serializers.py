@@ -1,33 +1,259 @@
-from rest_framework.serializers import ModelSerializer
+import copy
+from rest_framework.serializers import ModelSerializer, Serializer, SerializerMethodField, FloatField, IntegerField, ChoiceField, ListField, CharField, BooleanField, ValidationError
 from rest_framework_gis.serializers import GeoModelSerializer
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.password_validation import validate_password
+from django.core import exceptions
+from django.conf import settings
 from .models import *
+from .proximity import MAX_RADIUS_KM, MAX_NEAREST
+from .clusters import MAX_CELLS, cell_range, is_materialized
+from .uploads import atomic_storage, store_file, release_blob, CHUNK_SIZE
 
+class PasswordSerializerMixin:
+    '''
+    Validates a submitted password against the configured validators and
+    replaces it with its hash, so `save()` writes the user exactly once.
+    '''
+    hash_password = True
+    
+    def validate(self, attrs: dict) -> dict:
+        attrs = super().validate(attrs)
+        if 'password' not in attrs:
+            return attrs
+        
+        user = copy.copy(self.instance) if self.instance is not None else User()
+        for field, value in attrs.items():
+            if field not in ('password', 'groups', 'user_permissions'):
+                setattr(user, field, value)
+        try:
+            validate_password(attrs['password'], user)
+        except exceptions.ValidationError as ex:
+            raise ValidationError({'password': ex.messages})
+        
+        if self.hash_password:
+            attrs['password'] = make_password(attrs['password'])
+        return attrs
+        
 class UserSerializer(GeoModelSerializer):
     class Meta:
         model = User
-        exclude = ['last_login', 'is_superuser', 'password', 'is_active', 'is_admin', 'is_staff', 'groups', 'user_permissions']
+        exclude = ['last_login', 'is_superuser', 'password', 'is_active', 'is_admin', 'is_staff', 'groups', 'user_permissions', 'birthday_key', 'token_version']
+        
+class UserDistanceSerializer(UserSerializer):
+    distance = SerializerMethodField()
+    
+    class Meta(UserSerializer.Meta):
+        pass
+    
+    def get_distance(self, obj: User) -> float:
+        '''
+        Distance from the search point in metres.
+        '''
+        return obj.distance.m
+        
+class UserFindQuerySerializer(Serializer):
+    latitude = FloatField(min_value = -90, max_value = 90)
+    longitude = FloatField(min_value = -180, max_value = 180)
+    address = ChoiceField(choices = ['home', 'office'], default = 'home')
+    radius = FloatField(min_value = 0, max_value = MAX_RADIUS_KM, required = False)
+    nearest = IntegerField(min_value = 1, max_value = MAX_NEAREST, required = False)
+        
+class CommuteQuerySerializer(Serializer):
+    min_km = FloatField(min_value = 0, required = False)
+    max_km = FloatField(min_value = 0, required = False)
+        
+class ClusterQuerySerializer(Serializer):
+    bbox = CharField(help_text = 'min_longitude,min_latitude,max_longitude,max_latitude')
+    zoom = IntegerField(min_value = 0, max_value = 22)
+    address = ChoiceField(choices = ['home', 'office'], default = 'home')
+    method = ChoiceField(choices = ['grid', 'dbscan'], default = 'grid')
+    countries = BooleanField(default = False)
+    
+    def validate_bbox(self, value: str) -> tuple[float, float, float, float]:
+        try:
+            min_lon, min_lat, max_lon, max_lat = (float(part) for part in value.split(','))
+        except ValueError:
+            raise ValidationError('Must be min_longitude,min_latitude,max_longitude,max_latitude.')
+        if not (-180 <= min_lon <= max_lon <= 180 and -90 <= min_lat <= max_lat <= 90):
+            raise ValidationError('Must be a lon/lat box with min <= max.')
+        return min_lon, min_lat, max_lon, max_lat
+    
+    def validate(self, attrs: dict) -> dict:
+        columns, rows = cell_range(attrs['bbox'], attrs['zoom'])
+        if len(columns) * len(rows) > MAX_CELLS:
+            raise ValidationError('The bbox covers too many cells at this zoom.')
+        if attrs['method'] == 'dbscan' and is_materialized(attrs['zoom']):
+            raise ValidationError({'method': f'dbscan needs a zoom above {settings.USER_CLUSTER_MATERIALIZED_MAX_ZOOM}.'})
+        return attrs
         
-class UserAdminSerializer(GeoModelSerializer):
+class LonLatField(ListField):
+    '''
+    A [longitude, latitude] pair, range checked like `UserFindQuerySerializer`.
+    Errors are keyed by index, as for any ListField child.
+    '''
+    coordinates = (FloatField(min_value = -180, max_value = 180), FloatField(min_value = -90, max_value = 90))
+    
+    def __init__(self, **kwargs):
+        super().__init__(child = FloatField(), min_length = 2, max_length = 2, **kwargs)
+        
+    def to_internal_value(self, data) -> list[float]:
+        values = super().to_internal_value(data)
+        if len(values) != len(self.coordinates):
+            # Reported by the length validators.
+            return values
+        point, errors = [], {}
+        for index, (field, value) in enumerate(zip(self.coordinates, values)):
+            try:
+                point.append(field.run_validation(value))
+            except ValidationError as error:
+                errors[index] = error.detail
+        if errors:
+            raise ValidationError(errors)
+        return point
+        
+class DistanceSetSerializer(Serializer):
+    '''
+    A set of locations: given users' home or office addresses, or raw
+    [longitude, latitude] points. With neither, every user is used.
+    '''
+    users = ListField(child = IntegerField(), required = False, max_length = 10000)
+    points = ListField(
+        child = LonLatField(),
+        required = False,
+        max_length = 10000
+    )
+    address = ChoiceField(choices = ['home', 'office'], default = 'home')
+    
+    def validate(self, attrs: dict) -> dict:
+        if 'users' in attrs and 'points' in attrs:
+            raise ValidationError('Pass either users or points, not both.')
+        return attrs
+        
+class DistanceMatrixSerializer(Serializer):
+    origins = DistanceSetSerializer()
+    destinations = DistanceSetSerializer(required = False)
+    k = IntegerField(min_value = 1, max_value = 100, default = 10)
+    
+    def validate_origins(self, value: dict) -> dict:
+        if 'users' not in value and 'points' not in value:
+            raise ValidationError('Pass origin users or points.')
+        return value
+        
+class UserAdminSerializer(PasswordSerializerMixin, GeoModelSerializer):
     class Meta:
         model = User
         fields = '__all__'
         
-class UserSignUpSerializer(GeoModelSerializer):
+class UserSignUpSerializer(PasswordSerializerMixin, GeoModelSerializer):
     class Meta:
         model = User
-        exclude = ['last_login', 'is_superuser', 'is_active', 'is_admin', 'is_staff', 'groups', 'user_permissions']
+        exclude = ['last_login', 'is_superuser', 'is_active', 'is_admin', 'is_staff', 'groups', 'user_permissions', 'birthday_key', 'token_version']
+        
+class UserImportSerializer(UserSignUpSerializer):
+    '''
+    Signup rules without the per-row unique email query or the hashing; the
+    importer checks emails one batch at a time and hashes in a process pool.
+    '''
+    hash_password = False
+    
+    class Meta(UserSignUpSerializer.Meta):
+        extra_kwargs = {'email': {'validators': []}}
         
 class WorkDistanceSerializer(GeoModelSerializer):
+    '''
+    Commutes are derived from the user's addresses; writes only (re)compute them.
+    '''
     class Meta:
         model = WorkDistance
         fields = '__all__'
+        read_only_fields = ['points', 'length']
+        
+    def create(self, validated_data: dict) -> WorkDistance:
+        return self.refresh(validated_data['user'])
+        
+    def update(self, instance: WorkDistance, validated_data: dict) -> WorkDistance:
+        return self.refresh(validated_data.get('user', instance.user))
+        
+    def refresh(self, user: User) -> WorkDistance:
+        # An updated commute is not returned by refresh_for; load it for the response.
+        return WorkDistance.objects.refresh_for(user) or WorkDistance.objects.get(user = user)
         
 class AreaOfInterestSerializer(GeoModelSerializer):
+    '''
+    Reads and writes the interest by name; names are resolved to the shared
+    `Interest` vocabulary on save.
+    '''
+    interest = CharField(source = 'interest.name', max_length = 150)
+    
     class Meta:
         model = AreaOfInterest
         fields = '__all__'
         
+    def create(self, validated_data: dict) -> AreaOfInterest:
+        validated_data['interest'] = Interest.objects.resolve(validated_data['interest']['name'])
+        return super().create(validated_data)
+        
+    def update(self, instance: AreaOfInterest, validated_data: dict) -> AreaOfInterest:
+        if 'interest' in validated_data:
+            validated_data['interest'] = Interest.objects.resolve(validated_data['interest']['name'])
+        return super().update(instance, validated_data)
+        
+class InterestQuerySerializer(Serializer):
+    q = CharField(max_length = 150)
+    limit = IntegerField(min_value = 1, max_value = 50, default = 10)
+    
+class SimilarUsersQuerySerializer(Serializer):
+    limit = IntegerField(min_value = 1, max_value = 100, default = 20)
+        
 class DocumentSerializer(GeoModelSerializer):
     class Meta:
         model = Document
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+        read_only_fields = ['blob']
+        
+    def create(self, validated_data: dict) -> Document:
+        with atomic_storage():
+            blob = store_file(validated_data['document'])
+            validated_data.update(blob = blob, document = blob.file.name)
+            return super().create(validated_data)
+        
+    def update(self, instance: Document, validated_data: dict) -> Document:
+        if 'document' not in validated_data:
+            return super().update(instance, validated_data)
+        
+        with atomic_storage():
+            old_blob_id = instance.blob_id
+            blob = store_file(validated_data['document'])
+            validated_data.update(blob = blob, document = blob.file.name)
+            instance = super().update(instance, validated_data)
+            if old_blob_id is not None:
+                release_blob(old_blob_id)
+            return instance
+        
+class DocumentUploadSerializer(ModelSerializer):
+    chunk_size = SerializerMethodField()
+    
+    class Meta:
+        model = DocumentUpload
+        fields = ['id', 'user', 'document_type', 'filename', 'size', 'offset', 'chunk_size']
+        read_only_fields = ['offset']
+        extra_kwargs = {'size': {'min_value': 1, 'max_value': settings.DOCUMENT_UPLOAD_MAX_SIZE}}
+        
+    def get_chunk_size(self, obj: DocumentUpload) -> int:
+        return CHUNK_SIZE
+        
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    '''
+    Adds the claims `TokenUserAuthentication` needs to build the request user
+    without loading it from the database.
+    '''
+    @classmethod
+    def get_token(cls, user: User):
+        token = super().get_token(user)
+        token['is_staff'] = user.is_staff
+        token['is_admin'] = user.is_admin
+        token['is_superuser'] = user.is_superuser
+        token['ver'] = user.token_version
+        return token
\ No newline at end of file
@@ -0,0 +1,117 @@
+from django.contrib.auth.models import Group, Permission
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.db import transaction
+from django.dispatch import receiver
+from .models import User, WorkDistance, AreaOfInterest, Interest, Document, UserClusterDelta
+from .uploads import release_blob
+from . import spatial_index
+from .cache import forget_token_version, invalidate_user_permissions, invalidate_all_permissions, bump_resource_version
+from .tiles import invalidate_tiles, user_bbox
+from .clusters import cluster_deltas
+
+
+@receiver(post_save, sender = User)
+def sync_spatial_index_on_save(sender, instance: User, **kwargs) -> None:
+    if spatial_index.is_used():
+        pk, points = instance.pk, {field: getattr(instance, field) for field in User.ADDRESS_FIELDS}
+        transaction.on_commit(lambda: spatial_index.update_user(pk, points))
+
+
+@receiver(post_delete, sender = User)
+def sync_spatial_index_on_delete(sender, instance: User, **kwargs) -> None:
+    if spatial_index.is_used():
+        pk = instance.pk
+        transaction.on_commit(lambda: spatial_index.remove_user(pk))
+
+
+@receiver(post_save, sender = User)
+def invalidate_tiles_on_save(sender, instance: User, created: bool, update_fields, **kwargs) -> None:
+    # Runs before save() refreshes _loaded_state, so it still holds the old addresses.
+    loaded_state = getattr(instance, '_loaded_state', None) or {}
+    if not created and loaded_state and not instance._changed_fields(update_fields) & set(User.ADDRESS_FIELDS):
+        return
+    bboxes = [
+        user_bbox(loaded_state.get('home_address'), loaded_state.get('office_address')),
+        user_bbox(instance.home_address, instance.office_address)
+    ]
+    transaction.on_commit(lambda: invalidate_tiles(bboxes))
+
+
+@receiver(post_delete, sender = User)
+def invalidate_tiles_on_delete(sender, instance: User, **kwargs) -> None:
+    bboxes = [user_bbox(instance.home_address, instance.office_address)]
+    transaction.on_commit(lambda: invalidate_tiles(bboxes))
+
+
+@receiver(post_save, sender = User)
+def record_cluster_move_on_save(sender, instance: User, created: bool, update_fields, **kwargs) -> None:
+    loaded_state = getattr(instance, '_loaded_state', None) or {}
+    if created:
+        UserClusterDelta.objects.bulk_create(cluster_deltas(None, instance))
+    elif all(field in loaded_state for field in User.CLUSTER_FIELDS):
+        if instance._changed_fields(update_fields) & set(User.CLUSTER_FIELDS):
+            UserClusterDelta.objects.bulk_create(cluster_deltas(loaded_state, instance))
+    # Otherwise the old location is unknown; the nightly rebuild corrects it.
+
+
+@receiver(post_delete, sender = User)
+def record_cluster_move_on_delete(sender, instance: User, **kwargs) -> None:
+    state = {field: getattr(instance, field) for field in User.CLUSTER_FIELDS}
+    state.update(getattr(instance, '_loaded_state', None) or {})
+    UserClusterDelta.objects.bulk_create(cluster_deltas(state, None))
+
+
+@receiver(post_delete, sender = User)
+def revoke_tokens_on_delete(sender, instance: User, **kwargs) -> None:
+    forget_token_version(instance.pk)
+
+
+
+@receiver(m2m_changed, sender = User.groups.through)
+@receiver(m2m_changed, sender = User.user_permissions.through)
+def invalidate_permissions_on_user_m2m(sender, instance, action: str, reverse: bool, pk_set: set|None, **kwargs) -> None:
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidate_user_permissions(instance.pk)
+    elif pk_set:
+        # Changed from the group/permission side; pk_set holds the users.
+        for pk in pk_set:
+            invalidate_user_permissions(pk)
+    else:
+        invalidate_all_permissions()
+
+
+@receiver(m2m_changed, sender = Group.permissions.through)
+def invalidate_permissions_on_group_m2m(sender, action: str, **kwargs) -> None:
+    if action.startswith('post_'):
+        invalidate_all_permissions()
+
+
+@receiver(post_save, sender = Permission)
+@receiver(post_delete, sender = Permission)
+@receiver(post_delete, sender = Group)
+def invalidate_permissions_on_change(sender, **kwargs) -> None:
+    invalidate_all_permissions()
+
+
+@receiver(post_delete, sender = Document)
+def release_document_blob(sender, instance: Document, **kwargs) -> None:
+    if instance.blob_id is not None:
+        release_blob(instance.blob_id)
+
+
+@receiver(post_save, sender = User)
+@receiver(post_delete, sender = User)
+@receiver(post_save, sender = WorkDistance)
+@receiver(post_delete, sender = WorkDistance)
+@receiver(post_save, sender = AreaOfInterest)
+@receiver(post_delete, sender = AreaOfInterest)
+@receiver(post_save, sender = Interest)
+@receiver(post_delete, sender = Interest)
+@receiver(post_save, sender = Document)
+@receiver(post_delete, sender = Document)
+def invalidate_cached_responses(sender, **kwargs) -> None:
+    # After commit, so a concurrent read cannot cache the old rows under the new version.
+    label = sender._meta.label_lower
+    transaction.on_commit(lambda: bump_resource_version(label))
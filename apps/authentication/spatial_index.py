@@ -0,0 +1,265 @@
+import heapq
+import math
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+EARTH_RADIUS_M = 6371008.8
+METRES_PER_DEGREE = 111320.0
+
+
+def haversine(lon1: float, lat1: float, lon2: float, lat2: float) -> float:
+    '''
+    Great-circle distance in metres between two lon/lat points.
+    '''
+    lon1, lat1, lon2, lat2 = map(math.radians, (lon1, lat1, lon2, lat2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GridIndex:
+    '''
+    In-memory lon/lat grid of points keyed by id.
+
+    Each point is bucketed into a `cell_size` degree cell, so a radius query
+    only measures the points in the handful of cells overlapping the search
+    circle and a nearest-N query grows outwards ring by ring from the cell
+    containing the search point.
+    '''
+    def __init__(self, cell_size: float = 0.1):
+        self.cell_size = cell_size
+        self.columns = math.ceil(360 / cell_size)
+        self.rows = math.ceil(180 / cell_size)
+        self._cells: dict[tuple[int, int], dict[int, tuple[float, float]]] = {}
+        self._points: dict[int, tuple[float, float]] = {}
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def points(self) -> list[tuple[float, float]]:
+        return list(self._points.values())
+
+    def _cell(self, lon: float, lat: float) -> tuple[int, int]:
+        x = math.floor((lon + 180) / self.cell_size) % self.columns
+        y = min(max(math.floor((lat + 90) / self.cell_size), 0), self.rows - 1)
+        return x, y
+
+    def insert(self, pk: int, lon: float, lat: float) -> None:
+        with self._lock:
+            self.remove(pk)
+            self._points[pk] = (lon, lat)
+            self._cells.setdefault(self._cell(lon, lat), {})[pk] = (lon, lat)
+
+    def remove(self, pk: int) -> None:
+        with self._lock:
+            point = self._points.pop(pk, None)
+            if point is None:
+                return
+            cell = self._cell(*point)
+            bucket = self._cells[cell]
+            del bucket[pk]
+            if not bucket:
+                del self._cells[cell]
+
+    def _ring(self, x: int, y: int, r: int):
+        '''
+        Cells at Chebyshev distance exactly `r` from (x, y).
+        '''
+        if r == 0:
+            yield x, y
+            return
+        seen = set()
+        for dy in range(-r, r + 1):
+            row = y + dy
+            if row < 0 or row >= self.rows:
+                continue
+            step = 1 if abs(dy) == r else 2 * r
+            for dx in range(-r, r + 1, step):
+                cell = ((x + dx) % self.columns, row)
+                if cell not in seen:
+                    seen.add(cell)
+                    yield cell
+
+    def _ring_clearance(self, lat: float, r: int) -> float:
+        '''
+        Lower bound in metres on the distance from the search point to any
+        point outside rings 0..r. The search point may sit on the edge of its
+        own cell, so only `r` whole cells are guaranteed in between.
+        '''
+        edge = abs(lat) + (r + 1) * self.cell_size
+        if edge >= 90:
+            return 0.0
+        return r * self.cell_size * METRES_PER_DEGREE * math.cos(math.radians(edge))
+
+    def within(self, lon: float, lat: float, radius_m: float) -> list[tuple[int, float]]:
+        '''
+        (id, distance) pairs within `radius_m` of the point, nearest first.
+        '''
+        dlat = radius_m / METRES_PER_DEGREE
+        cos_lat = math.cos(math.radians(min(abs(lat) + dlat, 90.0)))
+        dlon = 180.0 if cos_lat < 1e-9 else min(dlat / cos_lat, 180.0)
+        x0, y0 = self._cell(lon - dlon, lat - dlat)
+        x1, y1 = self._cell(lon + dlon, lat + dlat)
+        width = self.columns if dlon >= 180.0 else (x1 - x0) % self.columns + 1
+
+        hits = []
+        with self._lock:
+            for y in range(y0, y1 + 1):
+                for i in range(width):
+                    for pk, (plon, plat) in self._cells.get(((x0 + i) % self.columns, y), {}).items():
+                        distance = haversine(lon, lat, plon, plat)
+                        if distance <= radius_m:
+                            hits.append((pk, distance))
+        hits.sort(key = lambda hit: (hit[1], hit[0]))
+        return hits
+
+    def nearest(self, lon: float, lat: float, limit: int, radius_m: float|None = None) -> list[tuple[int, float]]:
+        '''
+        The `limit` closest (id, distance) pairs, optionally bounded by `radius_m`.
+        '''
+        if radius_m is not None:
+            return self.within(lon, lat, radius_m)[:limit]
+
+        x, y = self._cell(lon, lat)
+        best: list[tuple[float, int]] = []
+        with self._lock:
+            # Growing rings over mostly empty cells costs more than measuring
+            # every point once, so give up on the rings past that point. Rings
+            # wider than half the grid would also wrap onto visited columns.
+            budget = 4 * len(self._cells) + 9
+            visited = 0
+            for r in range((self.columns - 1) // 2 + 1):
+                cells = list(self._ring(x, y, r))
+                visited += len(cells)
+                if visited > budget:
+                    return self._scan(lon, lat, limit)
+                for cell in cells:
+                    for pk, (plon, plat) in self._cells.get(cell, {}).items():
+                        distance = haversine(lon, lat, plon, plat)
+                        if len(best) < limit:
+                            heapq.heappush(best, (-distance, pk))
+                        elif distance < -best[0][0]:
+                            heapq.heapreplace(best, (-distance, pk))
+                if len(best) == limit and -best[0][0] <= self._ring_clearance(lat, r):
+                    break
+            else:
+                return self._scan(lon, lat, limit)
+        return sorted(((pk, -distance) for distance, pk in best), key = lambda hit: (hit[1], hit[0]))
+
+    def _scan(self, lon: float, lat: float, limit: int) -> list[tuple[int, float]]:
+        hits = ((pk, haversine(lon, lat, plon, plat)) for pk, (plon, plat) in self._points.items())
+        return heapq.nsmallest(limit, hits, key = lambda hit: (hit[1], hit[0]))
+
+
+# Bumped in the shared cache on every committed address change, so each
+# process can tell its indexes missed a change made elsewhere.
+GENERATION_KEY = 'spatial-index:generation'
+
+_indexes: dict[str, GridIndex] = {}
+_indexes_lock = threading.RLock()
+# Generation the loaded indexes reflect, and when it was last compared.
+_generation: int|None = None
+_checked_at = 0.0
+
+
+def is_enabled() -> bool:
+    return getattr(settings, 'USER_SPATIAL_INDEX_ENABLED', False)
+
+
+def is_used() -> bool:
+    '''
+    Whether proximity queries go through the index: it is switched on, or
+    the database has no PostGIS `ST_DWithin`/`<->` to lean on.
+    '''
+    return is_enabled() or connection.vendor != 'postgresql'
+
+
+def _current_generation() -> int:
+    cache.add(GENERATION_KEY, 0, None)
+    return cache.get(GENERATION_KEY, 0)
+
+
+def invalidate() -> int:
+    '''
+    Makes every process reload its indexes at its next check, for writes
+    that bypass the `User` signals (bulk imports and updates). Returns the
+    new generation.
+    '''
+    try:
+        return cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, 1, None)
+        return cache.get(GENERATION_KEY, 1)
+
+
+def get_index(field: str) -> GridIndex:
+    '''
+    Returns the process-wide index for a `User` address field, loading it
+    from the database on first use and again once another process changed
+    an address (checked every `USER_SPATIAL_INDEX_CHECK_INTERVAL` seconds).
+    '''
+    global _generation, _checked_at
+    from .models import User
+
+    with _indexes_lock:
+        now = time.monotonic()
+        if _indexes and now - _checked_at >= getattr(settings, 'USER_SPATIAL_INDEX_CHECK_INTERVAL', 5):
+            _checked_at = now
+            if _current_generation() != _generation:
+                _indexes.clear()
+        if not _indexes:
+            # Read before loading, so changes committed during the load
+            # trigger another one.
+            _generation, _checked_at = _current_generation(), now
+            cell_size = getattr(settings, 'USER_SPATIAL_INDEX_CELL_SIZE', 0.1)
+            home, office = GridIndex(cell_size), GridIndex(cell_size)
+            rows = User.objects.values_list('id', 'home_address', 'office_address')
+            for pk, home_address, office_address in rows.iterator(chunk_size = 5000):
+                if home_address is not None:
+                    home.insert(pk, home_address.x, home_address.y)
+                if office_address is not None:
+                    office.insert(pk, office_address.x, office_address.y)
+            _indexes.update(home_address = home, office_address = office)
+    return _indexes[field]
+
+
+def _published(generation: int) -> None:
+    # Indexes that were current before this change now include it; if
+    # another process changed something in between, they reload instead.
+    global _generation
+    with _indexes_lock:
+        if _indexes and _generation == generation - 1:
+            _generation = generation
+
+
+def update_user(pk: int, points: dict) -> None:
+    '''
+    Mirrors a committed user save, given its address `points` by field,
+    into the loaded indexes and tells the other processes. Indexes not
+    loaded yet pick the change up when they are built.
+    '''
+    with _indexes_lock:
+        for field, index in _indexes.items():
+            point = points[field]
+            if point is None:
+                index.remove(pk)
+            else:
+                index.insert(pk, point.x, point.y)
+    _published(invalidate())
+
+
+def remove_user(pk: int) -> None:
+    with _indexes_lock:
+        for index in _indexes.values():
+            index.remove(pk)
+    _published(invalidate())
+
+
+def reset() -> None:
+    global _generation
+    with _indexes_lock:
+        _indexes.clear()
+        _generation = None
@@ -1,25 +1,226 @@
-from celery import shared_task
-from django.core.mail import send_mail
-from apps.authentication.models import User
+import time
+from datetime import timedelta
+from zoneinfo import ZoneInfo
+from celery import shared_task, group
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+import uuid
+from django.db.models import Max, Min, Count
+from apps.authentication.models import User, OutgoingEmail, DocumentUpload, WorkDistance, WorkDistanceRecomputeChunk, UserCluster, birthday_keys_for
+from apps.authentication.uploads import discard_upload
+from apps.authentication.tiles import invalidate_all_tiles
+from apps.authentication.utils import chunked
 from django.utils import timezone
 from django.conf import settings
+from backend_task.pooled_postgis.pool import pool_stats
 
 @shared_task
 def wish_birthday() -> None:
-    users = User.objects.filter(
-        date_of_birth = timezone.now()
+    '''
+    Splits today's birthday users into chunks and fans them out to
+    `enqueue_birthday_batch` as a Celery group.
+    '''
+    # Beat fires at local midnight, so "today" is taken in the Celery timezone.
+    today = timezone.localdate(timezone = ZoneInfo(settings.CELERY_TIMEZONE))
+    user_ids = User.objects.filter(
+        birthday_key__in = birthday_keys_for(today)
+    ).values_list('id', flat = True)
+    
+    batches = chunked(user_ids.iterator(chunk_size = 2000), settings.BIRTHDAY_MAIL_BATCH_SIZE)
+    group(enqueue_birthday_batch.s(batch, today.isoformat()) for batch in batches).apply_async()
+
+@shared_task
+def enqueue_birthday_batch(user_ids: list[int], day: str) -> int:
+    '''
+    Queues the birthday emails for one chunk of users in the outbox. Each
+    message is keyed by user and day, so a retried run does not double-send.
+    '''
+    users = User.objects.filter(id__in = user_ids).only('first_name', 'last_name', 'email')
+    emails = []
+    
+    for user in users.iterator(chunk_size = 2000):
+        emails.append(OutgoingEmail(
+            key = f'birthday:{day}:{user.id}',
+            subject = f"Happy Birthday {user.first_name} {user.last_name} !",
+            body = f"Happy Birthday {user.first_name} {user.last_name} !!! Have a great year ahead !",
+            from_email = settings.EMAIL_HOST_USER,
+            to = [user.email]
+        ))
+    
+    return len(OutgoingEmail.objects.enqueue_many(emails))
+
+def _message(email: OutgoingEmail, connection) -> EmailMultiAlternatives:
+    message = EmailMultiAlternatives(
+        email.subject,
+        email.body,
+        email.from_email or None,
+        email.to,
+        connection = connection
     )
+    if email.html_body:
+        message.attach_alternative(email.html_body, 'text/html')
+    return message
+
+def _record_failure(email: OutgoingEmail, error: Exception, now) -> None:
+    email.attempts += 1
+    email.last_error = repr(error)
+    if email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        email.status = 'Failed'
+    else:
+        email.next_attempt_at = now + timedelta(minutes = 2 ** email.attempts)
+
+def dispatch_outbox_batch(batch_size: int|None = None) -> int:
+    '''
+    Claims one batch of due outbox rows with `SELECT ... FOR UPDATE SKIP LOCKED`,
+    sends them over a single connection and records the outcome. Concurrent
+    dispatchers skip each other's rows, so no message is claimed twice.
+    Sends are spaced to at most `EMAIL_OUTBOX_MESSAGES_PER_SECOND`.
+    Returns the number of rows claimed.
+    '''
+    batch_size = batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE
+    rate = settings.EMAIL_OUTBOX_MESSAGES_PER_SECOND
+    interval = 1 / rate if rate else 0.0
+    now = timezone.now()
     
-    for user in users:
-        print(f'Happy {user.first_name}')
+    with transaction.atomic():
+        emails = list(
+            OutgoingEmail.objects.select_for_update(skip_locked = True).filter(
+                status = 'Pending',
+                next_attempt_at__lte = now
+            ).order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        if not emails:
+            return 0
         
-        subject = f"Happy Birthday {user.first_name} {user.last_name} !"
-        message = f"Happy Birthday {user.first_name} {user.last_name} !!! Have a great year ahead !"
+        connection = get_connection()
+        try:
+            connection.open()
+        except Exception as ex:
+            # Without a connection every claimed message counts a failed
+            # attempt, so an SMTP outage backs off instead of retrying hot.
+            for email in emails:
+                _record_failure(email, ex, now)
+        else:
+            with connection:
+                for email in emails:
+                    started = time.monotonic()
+                    try:
+                        _message(email, connection).send()
+                    except Exception as ex:
+                        _record_failure(email, ex, now)
+                    else:
+                        email.attempts += 1
+                        email.status = 'Sent'
+                        email.sent_at = timezone.now()
+                        email.last_error = None
+                    # Waiting after each send keeps the pace across batches too.
+                    remaining = interval - (time.monotonic() - started)
+                    if remaining > 0:
+                        time.sleep(remaining)
         
-        send_mail(
-            subject,
-            message,
-            settings['EMAIL_HOST_USER'],
-            [f'{user.email}'],
-            fail_silently = True
-        )
\ No newline at end of file
+        OutgoingEmail.objects.bulk_update(
+            emails,
+            ['status', 'attempts', 'last_error', 'next_attempt_at', 'sent_at']
+        )
+    return len(emails)
+
+@shared_task
+def dispatch_outbox(max_batches: int = 50) -> int:
+    '''
+    Drains the outbox batch by batch. Safe to run on many workers at once.
+    '''
+    sent = 0
+    for _ in range(max_batches):
+        claimed = dispatch_outbox_batch()
+        if not claimed:
+            break
+        sent += claimed
+    return sent
+
+@shared_task
+def purge_stale_uploads() -> int:
+    '''
+    Discards chunked document uploads that have not progressed for a day.
+    '''
+    stale = DocumentUpload.objects.filter(updated_at__lt = timezone.now() - timedelta(days = 1))
+    count = 0
+    for upload in stale.iterator(chunk_size = 500):
+        discard_upload(upload)
+        count += 1
+    return count
+
+def plan_work_distance_recompute(chunk_size: int|None = None) -> uuid.UUID:
+    '''
+    Splits the user id space into ranges of `chunk_size` ids and records
+    them as the chunks of a new recomputation run.
+    '''
+    chunk_size = chunk_size or settings.WORK_DISTANCE_RECOMPUTE_CHUNK_SIZE
+    run = uuid.uuid4()
+    bounds = User.objects.aggregate(first = Min('id'), last = Max('id'))
+    if bounds['first'] is not None:
+        WorkDistanceRecomputeChunk.objects.bulk_create(
+            WorkDistanceRecomputeChunk(run = run, start_id = start, end_id = start + chunk_size)
+            for start in range(bounds['first'], bounds['last'] + 1, chunk_size)
+        )
+    return run
+
+def work_distance_recompute_progress(run: uuid.UUID|str) -> dict:
+    progress = WorkDistanceRecomputeChunk.objects.filter(run = run).aggregate(
+        total = Count('id'),
+        done = Count('completed_at')
+    )
+    return {'run': str(run), **progress}
+
+@shared_task
+def recompute_work_distances(run: str|None = None, chunk_size: int|None = None) -> str:
+    '''
+    Rebuilds every user's WorkDistance in parallel chunks. Pass the `run` of
+    an interrupted recomputation to resume it; only chunks that have not
+    completed are dispatched again.
+    '''
+    run = run or str(plan_work_distance_recompute(chunk_size))
+    pending = WorkDistanceRecomputeChunk.objects.filter(run = run, completed_at = None).values_list('id', flat = True)
+    group(recompute_work_distance_chunk.s(chunk_id) for chunk_id in pending.iterator()).apply_async()
+    return run
+
+@shared_task
+def recompute_work_distance_chunk(chunk_id: int) -> int:
+    with transaction.atomic():
+        chunk = WorkDistanceRecomputeChunk.objects.select_for_update(skip_locked = True).filter(
+            pk = chunk_id,
+            completed_at = None
+        ).first()
+        if chunk is None:
+            return 0
+        chunk.rows = WorkDistance.objects.recompute_range(chunk.start_id, chunk.end_id)
+        chunk.completed_at = timezone.now()
+        chunk.save(update_fields = ['rows', 'completed_at'])
+        transaction.on_commit(invalidate_all_tiles)
+    return chunk.rows
+
+
+@shared_task
+def refresh_user_clusters() -> int:
+    '''
+    Folds the user moves recorded since the last run into the materialised
+    map clusters.
+    '''
+    return UserCluster.objects.fold_deltas()
+
+
+@shared_task
+def rebuild_user_clusters() -> int:
+    '''
+    Recomputes the materialised map clusters from scratch, correcting any
+    drift from writes that bypassed the delta log.
+    '''
+    return UserCluster.objects.rebuild()
+
+
+@shared_task
+def database_pool_stats() -> dict:
+    '''
+    Utilisation of the database connection pools of the worker process that
+    runs the task.
+    '''
+    return pool_stats()
@@ -1,6 +1,27 @@
 import pytest
 from rest_framework.test import APIClient
 
+@pytest.fixture(autouse = True)
+def local_caches(settings):
+    settings.CACHES = {
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'local': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'local'}
+    }
+
+@pytest.fixture
+def make_user():
+    '''
+    Creates a user with valid required fields; keyword arguments override
+    them. The test still needs the django_db mark.
+    '''
+    from apps.authentication.models import User
+
+    def make_user(email: str, superuser: bool = False, **fields):
+        fields = {'country': 'Nepal', 'phone_number': '+9779860099345', 'date_of_birth': '1998-12-12', **fields}
+        create = User.objects.create_superuser if superuser else User.objects.create_user
+        return create(email, 'Str0ng-Passw0rd', **fields)
+    return make_user
+
 @pytest.mark.django_db
 def test_signup():
     client = APIClient()
@@ -17,4 +38,746 @@ def test_signup():
     }
     
     response = client.post(url, payload)
-    assert response.status_code == 400
\ No newline at end of file
+    assert response.status_code == 400
+    assert 'password' in response.data
+
+    from apps.authentication.models import User
+    assert not User.objects.exists()
+
+@pytest.mark.django_db
+def test_signup_writes_user_commute_and_cluster_moves_once():
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    payload = {
+        'email': 'writes@gmail.com',
+        'password': 'Str0ng-Passw0rd',
+        'country': 'Nepal',
+        'phone_number': '+9779860099345',
+        'date_of_birth': '1998-12-12'
+    }
+    with CaptureQueriesContext(connection) as queries:
+        response = APIClient().post('/api/user/signup/', payload)
+    assert response.status_code == 201
+    inserts = [query['sql'].split('"')[1] for query in queries.captured_queries if query['sql'].lstrip().upper().startswith('INSERT')]
+    assert sorted(inserts) == ['authentication_user', 'authentication_userclusterdelta', 'authentication_workdistance']
+
+
+@pytest.mark.django_db
+def test_user_list_cursor_pagination():
+    client = APIClient()
+
+    response = client.get('/api/user/list/', {'page_size': 1000})
+    assert response.status_code == 200
+    assert 'count' not in response.data
+    assert 'next' in response.data
+
+
+@pytest.mark.django_db
+def test_async_user_list_pages_like_sync(make_user):
+    import json
+    from asgiref.sync import async_to_sync
+    from django.test import AsyncClient
+
+    for index in range(3):
+        make_user(f'async{index}@example.com')
+    response = APIClient().get('/api/user/list/', {'page_size': 2})
+    async_response = async_to_sync(AsyncClient().get)('/api/async/user/list/', {'page_size': 2})
+    assert async_response.status_code == 200
+    assert json.loads(async_response.content)['results'] == json.loads(response.content)['results']
+    assert 'cursor=' in json.loads(async_response.content)['next']
+
+    async_response = async_to_sync(AsyncClient().get)('/api/async/user/find/', {'latitude': 27.7})
+    assert async_response.status_code == 400
+    assert 'longitude' in json.loads(async_response.content)
+
+
+@pytest.mark.django_db
+def test_user_find_requires_coordinates():
+    client = APIClient()
+
+    response = client.get('/api/user/find/', {'latitude': 27.7})
+    assert response.status_code == 400
+    assert 'longitude' in response.data
+
+
+def test_grid_index_nearest_and_within():
+    from apps.authentication.spatial_index import GridIndex
+
+    index = GridIndex(cell_size = 0.1)
+    index.insert(1, 85.30, 27.70)
+    index.insert(2, 85.32, 27.71)
+    index.insert(3, 83.98, 28.21)
+    index.remove(2)
+    index.insert(2, 85.40, 27.70)
+
+    assert [pk for pk, _ in index.nearest(85.30, 27.70, 2)] == [1, 2]
+    assert [pk for pk, _ in index.within(85.30, 27.70, 15000)] == [1, 2]
+    # Far from every point the rings give way to a scan of all points.
+    assert [pk for pk, _ in index.nearest(-100.0, -60.0, 3)] == [2, 1, 3]
+
+
+@pytest.mark.django_db
+def test_spatial_index_follows_commits_and_other_processes(settings, make_user, django_capture_on_commit_callbacks):
+    from django.contrib.gis.geos import Point
+    from apps.authentication import spatial_index
+
+    settings.USER_SPATIAL_INDEX_ENABLED = True
+    settings.USER_SPATIAL_INDEX_CHECK_INTERVAL = 0
+    spatial_index.reset()
+    try:
+        index = spatial_index.get_index('home_address')
+        # Uncommitted saves stay out of the index.
+        user = make_user('index@gmail.com', home_address = Point(85.30, 27.70, srid = 4326))
+        assert len(index) == 0
+
+        with django_capture_on_commit_callbacks(execute = True):
+            user.home_address = Point(85.40, 27.70, srid = 4326)
+            user.save()
+        assert spatial_index.get_index('home_address') is index
+        assert index.nearest(85.40, 27.70, 1) == [(user.pk, 0.0)]
+
+        # A change published by another process reloads the index.
+        spatial_index.invalidate()
+        reloaded = spatial_index.get_index('home_address')
+        assert reloaded is not index
+        assert [pk for pk, _ in reloaded.nearest(85.40, 27.70, 1)] == [user.pk]
+    finally:
+        spatial_index.reset()
+
+
+def test_birthday_keys_for_leap_day():
+    import datetime
+    from apps.authentication.models import birthday_keys_for
+
+    assert birthday_keys_for(datetime.date(2023, 12, 12)) == [1212]
+    assert birthday_keys_for(datetime.date(2023, 2, 28)) == [228, 229]
+    assert birthday_keys_for(datetime.date(2024, 2, 28)) == [228]
+    assert birthday_keys_for(datetime.date(2024, 2, 29)) == [229]
+
+
+@pytest.mark.django_db
+def test_birthday_outbox_is_idempotent(mailoutbox, make_user):
+    from apps.authentication.models import OutgoingEmail
+    from apps.authentication.tasks import enqueue_birthday_batch, dispatch_outbox_batch
+
+    users = [
+        make_user(f'user{i}@gmail.com', first_name = 'John')
+        for i in range(3)
+    ]
+    user_ids = [user.id for user in users]
+
+    enqueue_birthday_batch(user_ids, '2023-12-12')
+    enqueue_birthday_batch(user_ids, '2023-12-12')
+
+    assert dispatch_outbox_batch() == 3
+    assert dispatch_outbox_batch() == 0
+    assert sorted(message.to[0] for message in mailoutbox) == ['user0@gmail.com', 'user1@gmail.com', 'user2@gmail.com']
+    assert OutgoingEmail.objects.filter(status = 'Sent').count() == 3
+
+@pytest.mark.django_db
+def test_outbox_backs_off_when_smtp_is_down(monkeypatch):
+    from apps.authentication import tasks
+    from apps.authentication.models import OutgoingEmail
+
+    class DownConnection:
+        def open(self):
+            raise ConnectionRefusedError('smtp down')
+
+    monkeypatch.setattr(tasks, 'get_connection', DownConnection)
+    email = OutgoingEmail.objects.create(subject = 'Hi', body = 'Hi', to = ['down@gmail.com'])
+
+    assert tasks.dispatch_outbox_batch() == 1
+    email.refresh_from_db()
+    assert email.attempts == 1
+    assert 'smtp down' in email.last_error
+    assert email.status == 'Pending'
+    assert tasks.dispatch_outbox_batch() == 0
+
+
+@pytest.mark.django_db
+def test_outbox_paces_messages(settings, monkeypatch, mailoutbox):
+    from apps.authentication import tasks
+    from apps.authentication.models import OutgoingEmail
+
+    settings.EMAIL_OUTBOX_MESSAGES_PER_SECOND = 4
+    sleeps = []
+    monkeypatch.setattr(tasks.time, 'sleep', sleeps.append)
+    for number in range(3):
+        OutgoingEmail.objects.create(subject = 'Hi', body = 'Hi', to = [f'pace{number}@gmail.com'])
+
+    assert tasks.dispatch_outbox_batch() == 3
+    assert len(mailoutbox) == 3
+    assert len(sleeps) == 3
+    assert all(0 < sleep <= 0.25 for sleep in sleeps)
+
+
+@pytest.mark.django_db
+def test_import_users_reports_bad_rows():
+    import io
+    from apps.authentication.importer import UserImporter, read_rows
+    from apps.authentication.models import User
+
+    stream = io.StringIO(
+        'email,password,country,phone_number,date_of_birth,home_address\n'
+        'a@gmail.com,Str0ng-Passw0rd,Nepal,+9779860099345,1998-12-12,POINT(85.3 27.7)\n'
+        'a@gmail.com,Str0ng-Passw0rd,Nepal,+9779860099345,1998-12-12,POINT(85.3 27.7)\n'
+        'b@gmail.com,asdf,Nepal,+9779860099345,1998-12-12,POINT(85.3 27.7)\n'
+    )
+    report = UserImporter(workers = 1).run(read_rows(stream, 'csv'))
+
+    assert report['created'] == 1
+    assert [error['row'] for error in report['errors']] == [2, 3]
+    assert User.objects.get(email = 'a@gmail.com').check_password('Str0ng-Passw0rd')
+
+
+@pytest.mark.django_db
+def test_import_users_derives_commutes():
+    import io
+    from apps.authentication.importer import UserImporter, read_rows
+    from apps.authentication.models import WorkDistance
+
+    stream = io.StringIO(
+        'email,password,country,phone_number,date_of_birth,home_address,office_address\n'
+        'a@gmail.com,Str0ng-Passw0rd,Nepal,+9779860099345,1998-12-12,POINT(85.3 27.7),POINT(85.4 27.7)\n'
+        'b@gmail.com,Str0ng-Passw0rd,Nepal,+9779860099345,1998-12-12,POINT(85.3 27.7),POINT(85.3 27.7)\n'
+    )
+    report = UserImporter(workers = 1).run(read_rows(stream, 'csv'))
+
+    assert report['created'] == 2
+    lengths = dict(WorkDistance.objects.values_list('user__email', 'length'))
+    assert round(lengths['a@gmail.com']) == 9845
+    assert lengths['b@gmail.com'] == 0
+
+
+def test_read_rows_reports_undecodable_records():
+    import io
+    from apps.authentication.importer import InvalidRow, read_rows
+
+    stream = io.TextIOWrapper(
+        io.BytesIO(b'{"email": "a@gmail.com"}\n{"email": \n\n{"email": "\xff"}\n'),
+        encoding = 'utf-8',
+        errors = 'surrogateescape'
+    )
+    rows = list(read_rows(stream, 'ndjson'))
+
+    assert rows[0] == {'email': 'a@gmail.com'}
+    assert [type(row) for row in rows[1:]] == [InvalidRow, InvalidRow]
+    assert 'UTF-8' in rows[2].errors['non_field_errors'][0]
+
+
+@pytest.mark.django_db(transaction = True)
+def test_token_user_authentication_and_revocation(make_user):
+    from rest_framework.test import APIRequestFactory
+    from rest_framework_simplejwt.exceptions import AuthenticationFailed
+    from apps.authentication.authentication import TokenUserAuthentication
+    from apps.authentication.serializers import ClaimsTokenObtainPairSerializer
+
+    user = make_user('token@gmail.com', is_admin = True)
+    access = str(ClaimsTokenObtainPairSerializer.get_token(user).access_token)
+    request = APIRequestFactory().get('/', HTTP_AUTHORIZATION = f'Bearer {access}')
+
+    request_user, _ = TokenUserAuthentication().authenticate(request)
+    assert request_user == user
+    assert request_user.is_admin
+
+    user.revoke_tokens()
+    with pytest.raises(AuthenticationFailed):
+        TokenUserAuthentication().authenticate(request)
+
+
+@pytest.mark.django_db
+def test_permission_cache_invalidated_by_m2m(django_assert_num_queries, make_user):
+    from django.contrib.auth.models import Group, Permission
+    from apps.authentication.models import User
+
+    user = make_user('perms@gmail.com')
+    assert not user.has_perm('authentication.view_user')
+
+    group = Group.objects.create(name = 'viewers')
+    group.permissions.add(Permission.objects.get(codename = 'view_user'))
+    user.groups.add(group)
+
+    user = User.objects.get(pk = user.pk)
+    assert user.has_perm('authentication.view_user')
+    with django_assert_num_queries(0):
+        assert user.has_perm('authentication.view_user')
+
+
+@pytest.mark.django_db
+def test_chunked_document_upload_is_deduplicated(settings, tmp_path, make_user):
+    from django.core.files.base import ContentFile
+    from django.core.files.storage import default_storage
+    from apps.authentication.models import DocumentBlob
+    from apps.authentication.uploads import atomic_storage, store_file
+
+    settings.MEDIA_ROOT = tmp_path
+    settings.DOCUMENT_UPLOAD_STAGING_DIR = tmp_path / 'uploads'
+    user = make_user('docs@gmail.com')
+    client = APIClient()
+    client.force_authenticate(user = user)
+    content = b'scanned citizenship document'
+
+    for _ in range(2):
+        response = client.post('/api/user/document-upload/', {'user': user.id, 'document_type': 'NID', 'filename': 'Scan.PDF', 'size': len(content)})
+        assert response.status_code == 201
+        upload_url = f"/api/user/document-upload/{response.data['id']}/"
+
+        response = client.put(upload_url, content, content_type = 'application/octet-stream', HTTP_CONTENT_RANGE = f'bytes 5-{len(content) - 1}/{len(content)}')
+        assert response.status_code == 409
+        assert response.data['offset'] == 0
+
+        response = client.put(upload_url, content, content_type = 'application/octet-stream', HTTP_CONTENT_RANGE = f'bytes 0-{len(content) - 1}/{len(content)}')
+        assert response.status_code == 201
+
+    blob = DocumentBlob.objects.get()
+    assert blob.ref_count == 2
+    assert blob.file.name.endswith('.pdf')
+    assert blob.file.read() == content
+    assert list(settings.DOCUMENT_UPLOAD_STAGING_DIR.iterdir()) == []
+
+    # A stored file goes away with the transaction that stored it.
+    with pytest.raises(RuntimeError):
+        with atomic_storage():
+            name = store_file(ContentFile(b'rolled back', name = 'scan.pdf')).file.name
+            raise RuntimeError
+    assert not default_storage.exists(name)
+    assert DocumentBlob.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_document_download_range_and_conditional(settings, tmp_path, make_user):
+    from django.core.files.uploadedfile import SimpleUploadedFile
+
+    settings.MEDIA_ROOT = tmp_path
+    user = make_user('admin@gmail.com', superuser = True)
+    client = APIClient()
+    client.force_authenticate(user = user)
+    response = client.post('/api/user/document/', {
+        'user': user.id,
+        'document_type': 'Citizenship',
+        'document': SimpleUploadedFile('scan.pdf', b'0123456789')
+    })
+    assert response.status_code == 201
+    url = f"/api/user/document/{response.data['id']}/download/"
+
+    response = client.get(url, HTTP_RANGE = 'bytes=2-5')
+    assert response.status_code == 206
+    assert response['Content-Range'] == 'bytes 2-5/10'
+    assert b''.join(response.streaming_content) == b'2345'
+
+    response = client.get(url, HTTP_IF_NONE_MATCH = response['ETag'])
+    assert response.status_code == 304
+
+
+@pytest.mark.django_db
+def test_work_distance_follows_addresses(make_user):
+    from django.contrib.gis.geos import Point
+    from apps.authentication.models import User, WorkDistance
+
+    user = make_user(
+        'commute@gmail.com',
+        home_address = Point(85.30, 27.70, srid = 4326),
+        office_address = Point(85.30, 27.70, srid = 4326)
+    )
+    assert WorkDistance.objects.get(user = user).length == 0
+
+    user = User.objects.get(pk = user.pk)
+    user.office_address = Point(85.40, 27.70, srid = 4326)
+    user.save()
+    assert round(WorkDistance.objects.get(user = user).length) == 9845
+
+
+@pytest.mark.django_db
+def test_work_distance_recompute_chunk_runs_once(make_user):
+    from django.contrib.gis.geos import Point
+    from apps.authentication.models import WorkDistance, WorkDistanceRecomputeChunk
+    from apps.authentication.tasks import plan_work_distance_recompute, recompute_work_distance_chunk, work_distance_recompute_progress
+
+    commuter = make_user(
+        'recompute@gmail.com',
+        home_address = Point(85.30, 27.70, srid = 4326),
+        office_address = Point(85.40, 27.70, srid = 4326)
+    )
+    make_user(
+        'neighbour@gmail.com',
+        home_address = Point(85.30, 27.70, srid = 4326),
+        office_address = Point(85.30, 27.70, srid = 4326)
+    )
+    make_user('later@gmail.com')
+    WorkDistance.objects.update(length = None)
+
+    run = plan_work_distance_recompute(chunk_size = 2)
+    first, second = WorkDistanceRecomputeChunk.objects.filter(run = run).order_by('start_id')
+    assert (first.start_id, first.end_id, second.start_id) == (commuter.pk, commuter.pk + 2, commuter.pk + 2)
+
+    assert recompute_work_distance_chunk(first.pk) == 2
+    first.refresh_from_db()
+    assert first.rows == 2 and first.completed_at is not None
+    assert round(WorkDistance.objects.get(user = commuter).length) == 9845
+    # Only the chunk that ran was rewritten.
+    assert WorkDistance.objects.filter(length = None).count() == 1
+
+    completed_at = first.completed_at
+    assert recompute_work_distance_chunk(first.pk) == 0
+    first.refresh_from_db()
+    assert (first.rows, first.completed_at) == (2, completed_at)
+    assert work_distance_recompute_progress(run) == {'run': str(run), 'total': 2, 'done': 1}
+
+
+def test_top_k_distance_matrix_excludes_self():
+    import numpy as np
+    from apps.authentication.distances import to_radians, top_k
+
+    points = to_radians([[85.30, 27.70], [85.32, 27.71], [83.98, 28.21]])
+    ids = np.array([1, 2, 3])
+
+    indices, distances = top_k(points, points, 2, ids, ids)
+    assert indices.tolist() == [[1, 2], [0, 2], [0, 1]]
+    assert distances[0][0] == pytest.approx(2261, rel = 0.01)
+
+
+def test_export_encoding_streams_valid_geojson_and_ndjson():
+    import gzip
+    import json
+    from apps.authentication.exports import encode
+
+    features = [{'type': 'Feature', 'id': pk, 'geometry': None, 'properties': {}} for pk in range(2500)]
+
+    chunks = list(encode(iter(features), 'geojson'))
+    assert len(chunks) > 1
+    assert json.loads(b''.join(chunks))['features'] == features
+
+    lines = gzip.decompress(b''.join(encode(iter(features), 'ndjson', gzip = True))).splitlines()
+    assert [json.loads(line) for line in lines] == features
+    assert json.loads(b''.join(encode(iter([]), 'geojson'))) == {'type': 'FeatureCollection', 'features': []}
+
+
+def test_accepts_gzip_honours_q_values():
+    from apps.authentication.exports import accepts_gzip
+
+    assert accepts_gzip('gzip, deflate, br')
+    assert accepts_gzip('br;q=1.0, gzip;q=0.5')
+    assert accepts_gzip('*')
+    assert not accepts_gzip('')
+    assert not accepts_gzip('identity')
+    assert not accepts_gzip('gzip;q=0')
+    assert not accepts_gzip('gzip; q=0.000, *')
+    assert not accepts_gzip('*;q=0')
+
+
+def test_async_export_encoding_matches_sync():
+    import asyncio
+    import gzip
+    from apps.authentication.exports import encode, aencode
+
+    features = [{'type': 'Feature', 'id': pk, 'geometry': None, 'properties': {}} for pk in range(2500)]
+
+    async def afeatures():
+        for feature in features:
+            yield feature
+
+    async def collect(chunks):
+        return [chunk async for chunk in chunks]
+
+    for format in ('geojson', 'ndjson'):
+        assert asyncio.run(collect(aencode(afeatures(), format))) == list(encode(iter(features), format))
+    assert gzip.decompress(b''.join(asyncio.run(collect(aencode(afeatures(), 'ndjson', gzip = True))))) == b''.join(encode(iter(features), 'ndjson'))
+
+
+def test_tile_invalidation_drops_only_touched_tiles():
+    from apps.authentication import tiles
+
+    columns, rows = tiles.tiles_covering((85.30, 27.70, 85.30, 27.70), 12)
+    assert (len(columns), len(rows)) == (1, 1)
+    x, y = columns[0], rows[0]
+
+    version = tiles._zoom_versions([12])[12]
+    tiles.tile_cache.set(tiles.tile_key(12, x, y, version), b'near')
+    tiles.tile_cache.set(tiles.tile_key(12, x + 5, y, version), b'far')
+    low_version = tiles._zoom_versions([2])[2]
+
+    tiles.invalidate_tiles([(85.30, 27.70, 85.30, 27.70)])
+    assert tiles.tile_cache.get(tiles.tile_key(12, x, y, version)) is None
+    assert tiles.tile_cache.get(tiles.tile_key(12, x + 5, y, version)) == b'far'
+    assert tiles._zoom_versions([2])[2] == low_version
+
+    # A commute across the country touches too many high-zoom tiles to list.
+    tiles.invalidate_tiles([(80.0, 26.5, 88.0, 30.4)])
+    assert tiles._zoom_versions([12])[12] != version
+
+
+def test_cluster_aggregate_merges_countries_per_cell():
+    from apps.authentication.clusters import aggregate, cell_range
+
+    cells = [
+        (10, 20, 'Nepal', 3, 3 * 85.3, 3 * 27.7),
+        (10, 20, 'India', 1, 85.7, 27.3),
+        (11, 20, 'India', 1, 88.0, 27.0),
+    ]
+    results = aggregate(cells, countries = True)
+    assert results[0] == {'longitude': pytest.approx(85.4), 'latitude': pytest.approx(27.6), 'count': 4, 'countries': {'Nepal': 3, 'India': 1}}
+    assert 'countries' not in aggregate(cells)[0]
+
+    columns, rows = cell_range((85.0, 27.0, 86.0, 28.0), 0)
+    assert (len(columns), len(rows)) == (1, 1)
+
+
+def test_cluster_query_limits_dbscan_to_fine_zoom_levels(settings):
+    from apps.authentication.serializers import ClusterQuerySerializer
+
+    params = {'bbox': '85.0,27.0,85.1,27.1', 'method': 'dbscan'}
+    query = ClusterQuerySerializer(data = {**params, 'zoom': settings.USER_CLUSTER_MATERIALIZED_MAX_ZOOM})
+    assert not query.is_valid() and 'method' in query.errors
+    assert ClusterQuerySerializer(data = {**params, 'zoom': settings.USER_CLUSTER_MATERIALIZED_MAX_ZOOM + 1}).is_valid()
+
+
+@pytest.mark.django_db
+def test_user_list_conditional_get_and_invalidation(django_assert_num_queries, django_capture_on_commit_callbacks, make_user):
+    client = APIClient()
+
+    response = client.get('/api/user/list/')
+    assert response.status_code == 200
+    etag = response['ETag']
+    assert not response.has_header('Last-Modified')
+
+    with django_assert_num_queries(0):
+        response = client.get('/api/user/list/', HTTP_IF_NONE_MATCH = etag)
+    assert response.status_code == 304
+
+    with django_capture_on_commit_callbacks(execute = True):
+        make_user('etag@gmail.com')
+    response = client.get('/api/user/list/', HTTP_IF_NONE_MATCH = etag)
+    assert response.status_code == 200
+    assert response['ETag'] != etag
+    assert len(response.data['results']) == 1
+
+
+@pytest.mark.django_db
+def test_values_serializer_matches_model_serializer(make_user):
+    from django.contrib.gis.geos import Point
+    from apps.authentication.models import User, WorkDistance
+    from apps.authentication.serializers import UserSerializer, WorkDistanceSerializer
+    from apps.authentication.values import ValuesSerializer
+
+    make_user(
+        'values@gmail.com',
+        home_address = Point(85.30, 27.70, srid = 4326),
+        office_address = Point(85.40, 27.70, srid = 4326)
+    )
+    for model, serializer_class in ((User, UserSerializer), (WorkDistance, WorkDistanceSerializer)):
+        values = ValuesSerializer(serializer_class)
+        expected = serializer_class(model.objects.order_by('id'), many = True).data
+        assert values.to_representation(values.queryset(model.objects.order_by('id'))) == [dict(item) for item in expected]
+
+
+def test_distance_points_are_range_checked():
+    from apps.authentication.serializers import DistanceMatrixSerializer
+
+    serializer = DistanceMatrixSerializer(data = {'origins': {'points': [[85.3, 27.7], [185.0, 27.7], [85.3, -91.0], [85.3, 27.7, 0]]}})
+    assert not serializer.is_valid()
+    assert set(serializer.errors['origins']['points']) == {1, 2, 3}
+    assert set(serializer.errors['origins']['points'][1]) == {0}
+    assert set(serializer.errors['origins']['points'][2]) == {1}
+
+    serializer = DistanceMatrixSerializer(data = {'origins': {'points': [[-180, -90], [180, 90]]}})
+    assert serializer.is_valid(), serializer.errors
+
+
+def test_orjson_renderer_matches_json_renderer():
+    import datetime
+    from decimal import Decimal
+    from rest_framework.renderers import JSONRenderer
+    from apps.authentication.renderers import ORJSONRenderer
+
+    data = {'when': datetime.datetime(2023, 7, 1, 12, 30, tzinfo = datetime.timezone.utc), 'amount': Decimal('1.5'), 'text': 'नमस्ते ', 1: [None, True]}
+    assert ORJSONRenderer().render(data) == JSONRenderer().render(data)
+    for value in (float('nan'), float('inf')):
+        for renderer in (ORJSONRenderer(), JSONRenderer()):
+            with pytest.raises(ValueError):
+                renderer.render({'results': [{'distance': value}]})
+
+
+@pytest.mark.django_db
+def test_interests_are_shared_and_match_similar_users(make_user):
+    from apps.authentication.models import Interest, AreaOfInterest
+
+    users = [
+        make_user(f'interest{number}@gmail.com')
+        for number in range(3)
+    ]
+    interests = {
+        0: ['Hiking', 'Chess', 'Python'],
+        1: ['  hiking', 'CHESS'],
+        2: ['python', 'Go'],
+    }
+    for number, names in interests.items():
+        for name in names:
+            AreaOfInterest.objects.create(user = users[number], interest = Interest.objects.resolve(name))
+    assert Interest.objects.count() == 4
+
+    client = APIClient()
+    client.force_authenticate(user = users[0])
+    response = client.get(f'/api/user/{users[0].id}/similar/')
+    assert response.status_code == 200
+    assert [(match['user'], match['shared']) for match in response.data] == [(users[1].id, 2), (users[2].id, 1)]
+
+
+@pytest.mark.django_db
+def test_bulk_area_of_interest_actions(django_assert_max_num_queries, make_user):
+    from apps.authentication.models import AreaOfInterest
+
+    user, other = [
+        make_user(f'bulk{number}@gmail.com')
+        for number in range(2)
+    ]
+    client = APIClient()
+    client.force_authenticate(user = user)
+
+    items = [{'user': user.id, 'interest': name} for name in ('Hiking', 'Chess', 'Python', 'Go')]
+    items += [{'user': other.id, 'interest': 'Hiking'}, {'user': user.id}]
+    with django_assert_max_num_queries(10):
+        response = client.post('/api/user/area-interest/bulk/', items, format = 'json')
+    assert response.status_code == 201
+    assert len(response.data['created']) == 4
+    assert [error['index'] for error in response.data['errors']] == [4, 5]
+
+    ids = [item['id'] for item in response.data['created']]
+    response = client.patch('/api/user/area-interest/bulk/', [{'id': ids[0], 'interest': 'Climbing'}], format = 'json')
+    assert response.status_code == 200
+    assert response.data['updated'][0]['interest'] == 'Climbing'
+
+    response = client.delete('/api/user/area-interest/bulk/', ids[1:], format = 'json')
+    assert response.data['deleted'] == ids[1:]
+    assert list(AreaOfInterest.objects.values_list('interest__name', flat = True)) == ['Climbing']
+
+
+@pytest.mark.django_db
+def test_bulk_document_create_stores_files_once(settings, tmp_path, monkeypatch, make_user):
+    import json
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from apps.authentication.models import Document, DocumentBlob
+
+    settings.MEDIA_ROOT = tmp_path
+    user = make_user('bulkdocs@gmail.com')
+    client = APIClient()
+    client.force_authenticate(user = user)
+
+    def stored_files():
+        return sorted(path for path in tmp_path.rglob('*') if path.is_file())
+
+    items = [{'user': user.id, 'document_type': 'NID'}, {'user': user.id, 'document_type': 'Citizenship'}, {'user': user.id, 'document_type': 'NID'}]
+    response = client.post('/api/user/document/bulk/', {
+        'items': json.dumps(items),
+        'document.0': SimpleUploadedFile('front.pdf', b'same scan'),
+        'document.1': SimpleUploadedFile('copy.pdf', b'same scan'),
+        'document.2': SimpleUploadedFile('other.pdf', b'other scan')
+    })
+    assert response.status_code == 201
+    assert len(response.data['created']) == 3
+    assert response.data['errors'] == []
+    assert sorted(DocumentBlob.objects.values_list('ref_count', flat = True)) == [1, 2]
+    files = stored_files()
+    assert len(files) == 2
+
+    # Files stored for a batch that rolls back are deleted with it.
+    def fail(*args, **kwargs):
+        raise RuntimeError('bulk insert failed')
+
+    monkeypatch.setattr(Document.objects, 'bulk_create', fail)
+    with pytest.raises(RuntimeError):
+        client.post('/api/user/document/bulk/', {
+            'items': json.dumps(items[:1]),
+            'document.0': SimpleUploadedFile('new.pdf', b'new scan')
+        })
+    assert stored_files() == files
+    assert DocumentBlob.objects.count() == 2
+    assert Document.objects.count() == 3
+
+
+@pytest.mark.django_db
+def test_database_pool_waits_reuses_and_replaces_dead_connections():
+    from django.db import connection
+    from backend_task.pooled_postgis.pool import ConnectionPool, PoolTimeout
+
+    pool = ConnectionPool('test', connection.get_connection_params(), {'min_size': 1, 'max_size': 1, 'timeout': 0.05, 'health_check_interval': 0})
+    try:
+        first = pool.getconn()
+        with pytest.raises(PoolTimeout):
+            pool.getconn()
+        assert pool.stats()['utilisation'] == 1
+        assert pool.stats()['timeouts'] == 1
+
+        pool.putconn(first)
+        assert pool.getconn() is first
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_terminate_backend(%s)', [first.get_backend_pid()])
+        pool.putconn(first)
+        replacement = pool.getconn()
+        assert replacement is not first
+        assert pool.stats()['failed_health_checks'] == 1
+        pool.putconn(replacement)
+        assert pool.stats()['in_use'] == 0
+    finally:
+        pool.close()
+
+
+@pytest.mark.django_db(transaction = True, databases = ['default', 'replica'])
+def test_replica_router_reads_writes_and_stickiness(settings, monkeypatch, make_user):
+    import asyncio
+    from asgiref.sync import iscoroutinefunction
+    from django.db import transaction
+    from django.http import HttpResponse, StreamingHttpResponse
+    from django.test import RequestFactory
+    from apps.authentication import routers
+    from apps.authentication.models import User
+
+    settings.DATABASE_REPLICAS = ['replica']
+    router = routers.ReplicaRouter()
+    assert router.db_for_read(User) == 'default'
+
+    with routers.replica_reads():
+        assert router.db_for_read(User) == 'replica'
+        assert User.objects.using(router.db_for_read(User)).count() == 0
+        with transaction.atomic():
+            assert router.db_for_read(User) == 'default'
+        with routers.primary_reads():
+            assert router.db_for_read(User) == 'default'
+        assert router.db_for_read(User) == 'replica'
+        monkeypatch.setattr(routers, 'is_healthy', lambda alias: False)
+        assert router.db_for_read(User) == 'default'
+        monkeypatch.undo()
+
+    reads = []
+    def view(request):
+        if request.method == 'POST':
+            make_user('replica@gmail.com')
+        reads.append(router.db_for_read(User))
+        return HttpResponse()
+
+    middleware = routers.ReplicaReadMiddleware(view)
+    factory = RequestFactory()
+    assert not middleware(factory.get('/')).cookies
+
+    allowed = []
+    async def async_view(request):
+        allowed.append(routers._state.get().allowed)
+        return HttpResponse()
+    async_middleware = routers.ReplicaReadMiddleware(async_view)
+    assert iscoroutinefunction(async_middleware)
+    asyncio.run(async_middleware(factory.get('/')))
+    assert allowed == [True]
+
+    response = middleware(factory.post('/'))
+    assert response.cookies[routers.PIN_COOKIE]['max-age'] == settings.REPLICA_STICKY_SECONDS
+    factory.cookies[routers.PIN_COOKIE] = '1'
+    middleware(factory.get('/'))
+    assert reads == ['replica', 'default', 'default']
+
+    # A streamed body reads with the request's state, which is dropped once it is sent.
+    def streaming_view(request):
+        return StreamingHttpResponse(router.db_for_read(User) for _ in range(1))
+    response = routers.ReplicaReadMiddleware(streaming_view)(RequestFactory().get('/'))
+    assert list(response.streaming_content) == [b'replica']
+    assert routers._state.get() is None
@@ -0,0 +1,164 @@
+import math
+import uuid
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.utils.connection import ConnectionProxy
+from .models import User, WorkDistance
+
+tile_cache = ConnectionProxy(caches, getattr(settings, 'TILE_CACHE', 'default'))
+
+EXTENT = 4096
+BUFFER = 64
+MAX_ZOOM = getattr(settings, 'TILE_MAX_ZOOM', 20)
+TILE_CACHE_TIMEOUT = getattr(settings, 'TILE_CACHE_TIMEOUT', 24 * 60 * 60)
+# Past this many tiles per zoom level, a change drops the whole level instead.
+MAX_INVALIDATED_TILES = 16
+MAX_LATITUDE = 85.0511287798066
+WEB_MERCATOR_SIZE = 2 * 20037508.342789244
+
+LAYERS = {
+    'home': f'''
+        SELECT u.id,
+               ST_AsMVTGeom(ST_Transform(u.home_address::geometry(POINT,4326), 3857), bounds.tile, {EXTENT}, {BUFFER}, true) AS geom
+        FROM {User._meta.db_table} u, bounds
+        WHERE u.home_address::geometry(POINT,4326) && bounds.area
+    ''',
+    'office': f'''
+        SELECT u.id,
+               ST_AsMVTGeom(ST_Transform(u.office_address::geometry(POINT,4326), 3857), bounds.tile, {EXTENT}, {BUFFER}, true) AS geom
+        FROM {User._meta.db_table} u, bounds
+        WHERE u.office_address::geometry(POINT,4326) && bounds.area
+    ''',
+    'commutes': f'''
+        SELECT w.user_id AS "user", w.length,
+               ST_AsMVTGeom(ST_Transform(w.points, 3857), bounds.tile, {EXTENT}, {BUFFER}, true) AS geom
+        FROM {WorkDistance._meta.db_table} w, bounds
+        WHERE w.points && bounds.area
+    ''',
+}
+
+
+def is_valid_tile(z: int, x: int, y: int) -> bool:
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def render_tile(z: int, x: int, y: int, layers: list[str]) -> bytes:
+    '''
+    Renders one Mapbox Vector Tile with a layer per name in `layers`,
+    entirely in PostGIS. Features are selected with the spatial indexes on
+    the tile envelope, widened by the buffer so symbols are not cut at
+    tile edges.
+    '''
+    margin = WEB_MERCATOR_SIZE / 2 ** z * BUFFER / EXTENT
+    ctes = ',\n'.join(f'"{name}" AS ({LAYERS[name]})' for name in layers)
+    tiles = ' || '.join(
+        f"COALESCE((SELECT ST_AsMVT(\"{name}\", '{name}', {EXTENT}, 'geom') FROM \"{name}\"), ''::bytea)"
+        for name in layers
+    )
+    sql = f'''
+        WITH bounds AS (
+            SELECT ST_TileEnvelope(%s, %s, %s) AS tile,
+                   ST_Transform(ST_Expand(ST_TileEnvelope(%s, %s, %s), %s), 4326) AS area
+        ),
+        {ctes}
+        SELECT {tiles}
+    '''
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [z, x, y, z, x, y, margin])
+        return bytes(cursor.fetchone()[0])
+
+
+def _zoom_version_key(z: int) -> str:
+    return f'tiles:version:{z}'
+
+
+def _zoom_versions(zooms) -> dict[int, str]:
+    '''
+    The current version of each zoom level, in one cache round trip. An
+    evicted version is replaced by a fresh one, never read back stale.
+    '''
+    keys = {z: _zoom_version_key(z) for z in zooms}
+    versions = tile_cache.get_many(keys.values())
+    for key in keys.values():
+        if key not in versions:
+            tile_cache.add(key, uuid.uuid4().hex[:12], None)
+            versions[key] = tile_cache.get(key)
+    return {z: versions[key] for z, key in keys.items()}
+
+
+def tile_key(z: int, x: int, y: int, version: str) -> str:
+    return f'tiles:{z}:{version}:{x}:{y}'
+
+
+def get_tile(z: int, x: int, y: int) -> bytes:
+    '''
+    The tile from the cache, rendering and caching it on a miss.
+    '''
+    key = tile_key(z, x, y, _zoom_versions([z])[z])
+    tile = tile_cache.get(key)
+    if tile is None:
+        tile = render_tile(z, x, y, settings.TILE_LAYERS)
+        tile_cache.set(key, tile, TILE_CACHE_TIMEOUT)
+    return tile
+
+
+def _tile_coordinates(lon: float, lat: float, z: int) -> tuple[float, float]:
+    n = 2 ** z
+    lat = math.radians(max(-MAX_LATITUDE, min(MAX_LATITUDE, lat)))
+    return (lon + 180) / 360 * n, (1 - math.asinh(math.tan(lat)) / math.pi) / 2 * n
+
+
+def tiles_covering(bbox: tuple[float, float, float, float], z: int) -> tuple[range, range]:
+    '''
+    Columns and rows of the zoom `z` tiles whose buffered extent touches a
+    lon/lat bbox.
+    '''
+    min_lon, min_lat, max_lon, max_lat = bbox
+    margin = BUFFER / EXTENT
+    left, top = _tile_coordinates(min_lon, max_lat, z)
+    right, bottom = _tile_coordinates(max_lon, min_lat, z)
+    last = 2 ** z - 1
+    columns = range(max(0, math.floor(left - margin)), min(last, math.floor(right + margin)) + 1)
+    rows = range(max(0, math.floor(top - margin)), min(last, math.floor(bottom + margin)) + 1)
+    return columns, rows
+
+
+def invalidate_tiles(bboxes) -> None:
+    '''
+    Drops the cached tiles touching any of the lon/lat `bboxes`. Zoom levels
+    where that would mean more than MAX_INVALIDATED_TILES keys get a new
+    version instead, which orphans all of that level's tiles at once.
+    '''
+    bboxes = [bbox for bbox in bboxes if bbox is not None]
+    if not bboxes:
+        return
+    versions = _zoom_versions(range(MAX_ZOOM + 1))
+    for z, version in versions.items():
+        keys = set()
+        for bbox in bboxes:
+            columns, rows = tiles_covering(bbox, z)
+            if len(columns) * len(rows) > MAX_INVALIDATED_TILES:
+                keys = None
+                break
+            keys.update((x, y) for x in columns for y in rows)
+        if keys is None or len(keys) > MAX_INVALIDATED_TILES:
+            tile_cache.set(_zoom_version_key(z), uuid.uuid4().hex[:12], None)
+        else:
+            tile_cache.delete_many([tile_key(z, x, y, version) for x, y in keys])
+
+
+def invalidate_all_tiles() -> None:
+    tile_cache.set_many({_zoom_version_key(z): uuid.uuid4().hex[:12] for z in range(MAX_ZOOM + 1)}, None)
+
+
+def user_bbox(home, office) -> tuple[float, float, float, float]|None:
+    '''
+    Bbox of a user's features in every layer: both addresses and the
+    commute line between them.
+    '''
+    points = [point for point in (home, office) if point is not None]
+    if not points:
+        return None
+    lons, lats = [point.x for point in points], [point.y for point in points]
+    return min(lons), min(lats), max(lons), max(lats)
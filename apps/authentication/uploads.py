@@ -0,0 +1,208 @@
+import hashlib
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from .models import Document, DocumentBlob, DocumentUpload
+
+CHUNK_SIZE = getattr(settings, 'DOCUMENT_UPLOAD_CHUNK_SIZE', 5 * 1024 * 1024)
+READ_SIZE = 64 * 1024
+
+# Files written by `acquire_blob` inside the innermost `atomic_storage` block.
+_stored: ContextVar[list[str]|None] = ContextVar('stored_blob_files', default = None)
+
+
+class UploadConflict(Exception):
+    '''
+    Raised when a chunk does not start at the upload's current offset.
+    '''
+    def __init__(self, offset: int):
+        super().__init__(f'Expected chunk starting at byte {offset}.')
+        self.offset = offset
+
+
+def content_digest(chunk_digests: list[str]) -> str:
+    '''
+    Content hash of a file: SHA-256 over the SHA-256 digests of its
+    consecutive CHUNK_SIZE blocks. It can be built chunk by chunk across
+    requests, and is the same however the file was uploaded.
+    '''
+    return hashlib.sha256(b''.join(bytes.fromhex(digest) for digest in chunk_digests)).hexdigest()
+
+
+def file_digest(file) -> tuple[str, int]:
+    '''
+    Streams a file object in CHUNK_SIZE blocks and returns its content hash and size.
+    '''
+    chunk_digests, size = [], 0
+    file.seek(0)
+    while True:
+        digest, read = hashlib.sha256(), 0
+        while read < CHUNK_SIZE:
+            data = file.read(min(READ_SIZE, CHUNK_SIZE - read))
+            if not data:
+                break
+            digest.update(data)
+            read += len(data)
+        if not read:
+            break
+        chunk_digests.append(digest.hexdigest())
+        size += read
+    file.seek(0)
+    return content_digest(chunk_digests), size
+
+
+def blob_name(digest: str, extension: str = '') -> str:
+    return f'documents/sha256/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+
+def file_extension(name: str|None) -> str:
+    # Kept on stored blobs so downloads get a sensible content type.
+    return os.path.splitext(name or '')[1].lower()
+
+
+def acquire_blob(digest: str, size: int, content, extension: str = '') -> DocumentBlob:
+    '''
+    Returns the blob for `digest` with one more reference, writing `content`
+    to storage only if no identical file is stored yet.
+    '''
+    if DocumentBlob.objects.filter(sha256 = digest).update(ref_count = F('ref_count') + 1):
+        return DocumentBlob.objects.get(sha256 = digest)
+
+    name = default_storage.save(blob_name(digest, extension), File(content))
+    try:
+        with transaction.atomic():
+            blob = DocumentBlob.objects.create(sha256 = digest, file = name, size = size, ref_count = 1)
+    except IntegrityError:
+        # Someone stored the same content concurrently; share theirs.
+        default_storage.delete(name)
+        return acquire_blob(digest, size, content, extension)
+    stored = _stored.get()
+    if stored is not None:
+        stored.append(name)
+    return blob
+
+
+@contextmanager
+def atomic_storage():
+    '''
+    `transaction.atomic()` that also deletes the files `acquire_blob` wrote
+    inside it when it rolls back, so no stored file outlives its blob row.
+    '''
+    stored = []
+    token = _stored.set(stored)
+    try:
+        with transaction.atomic():
+            yield
+    except BaseException:
+        for name in stored:
+            default_storage.delete(name)
+        raise
+    finally:
+        _stored.reset(token)
+    # Nested blocks hand their files on; the outer block may still roll back.
+    outer = _stored.get()
+    if outer is not None:
+        outer.extend(stored)
+
+
+def release_blob(blob_id: int) -> None:
+    '''
+    Drops one reference and deletes the stored file with the last one.
+    '''
+    DocumentBlob.objects.filter(pk = blob_id).update(ref_count = F('ref_count') - 1)
+    blob = DocumentBlob.objects.filter(pk = blob_id, ref_count = 0).first()
+    if blob is not None and DocumentBlob.objects.filter(pk = blob.pk, ref_count = 0).delete()[0]:
+        transaction.on_commit(lambda: default_storage.delete(blob.file.name))
+
+
+def store_file(file) -> DocumentBlob:
+    digest, size = file_digest(file)
+    return acquire_blob(digest, size, file, file_extension(file.name))
+
+
+def staging_path(upload: DocumentUpload) -> Path:
+    return Path(settings.DOCUMENT_UPLOAD_STAGING_DIR) / f'{upload.id}.part'
+
+
+def append_chunk(upload: DocumentUpload, start: int, stream) -> DocumentUpload:
+    '''
+    Streams one chunk from `stream` into a file of its own, hashing it on the
+    way, then appends it to the upload's staging file. Every chunk but the
+    last must be exactly CHUNK_SIZE bytes so the per-chunk digests line up
+    with `file_digest`.
+
+    The upload row is only locked for the offset check and the local append,
+    not while the client sends the body.
+    '''
+    if start != upload.offset:
+        raise UploadConflict(upload.offset)
+
+    path = staging_path(upload)
+    path.parent.mkdir(parents = True, exist_ok = True)
+    chunk_path = path.with_name(f'{upload.id}.{uuid.uuid4().hex}.chunk')
+    expected = min(CHUNK_SIZE, upload.size - start)
+    digest, written = hashlib.sha256(), 0
+
+    try:
+        with open(chunk_path, 'wb') as chunk:
+            while written < expected:
+                data = stream.read(min(READ_SIZE, expected - written))
+                if not data:
+                    break
+                chunk.write(data)
+                digest.update(data)
+                written += len(data)
+            if written != expected or stream.read(1):
+                raise ValueError(f'Chunk must be exactly {expected} bytes.')
+
+        with transaction.atomic():
+            upload = DocumentUpload.objects.select_for_update().get(pk = upload.pk)
+            if start != upload.offset:
+                # Another request appended this chunk while ours streamed.
+                raise UploadConflict(upload.offset)
+
+            with open(path, 'ab') as staging, open(chunk_path, 'rb') as chunk:
+                staging.truncate(upload.offset)
+                shutil.copyfileobj(chunk, staging, READ_SIZE)
+                staging.flush()
+                os.fsync(staging.fileno())
+
+            upload.offset += written
+            upload.chunk_digests = [*upload.chunk_digests, digest.hexdigest()]
+            upload.save(update_fields = ['offset', 'chunk_digests', 'updated_at'])
+    finally:
+        chunk_path.unlink(missing_ok = True)
+    return upload
+
+
+def complete_upload(upload: DocumentUpload) -> Document:
+    '''
+    Turns a fully received upload into a `Document`, storing its content only
+    if it is not stored already.
+    '''
+    path = staging_path(upload)
+    with atomic_storage():
+        with open(path, 'rb') as staging:
+            blob = acquire_blob(content_digest(upload.chunk_digests), upload.size, staging, file_extension(upload.filename))
+        document = Document.objects.create(
+            user_id = upload.user_id,
+            document_type = upload.document_type,
+            document = blob.file.name,
+            blob = blob
+        )
+        upload.delete()
+    path.unlink(missing_ok = True)
+    return document
+
+
+def discard_upload(upload: DocumentUpload) -> None:
+    staging_path(upload).unlink(missing_ok = True)
+    upload.delete()
@@ -4,21 +4,38 @@ from rest_framework_simplejwt.views import (
 )
 from django.urls import path
 from .views import *
+from .async_views import AsyncUserListView, AsyncUserRetrieveView, AsyncUserFindView, AsyncExportView
+from .serializers import ClaimsTokenObtainPairSerializer
 from rest_framework.routers import SimpleRouter
 
 urlpatterns = [
-    path('api/token/', TokenObtainPairView.as_view(), name = 'token_obtain_pair'),
+    path('api/token/', TokenObtainPairView.as_view(serializer_class = ClaimsTokenObtainPairSerializer), name = 'token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name = 'token_refresh'),
     
     path('api/user/list/', UserListView.as_view(), name = 'api-user-list'),
     path('api/user/create/', UserCreateView.as_view(), name = 'api-user-create'),
     path('api/user/<int:pk>/', UserRetrieveUpdateDestroyView.as_view(), name = 'api-user-rud'),
     path('api/user/signup/', UserSignupView.as_view(), name = 'api-signup'),
-    path('api/user/find/', UserFindView.as_view(), name = 'api-user-find')
+    path('api/user/import/', UserImportView.as_view(), name = 'api-user-import'),
+    path('api/user/find/', UserFindView.as_view(), name = 'api-user-find'),
+    path('api/user/commute/', CommuteListView.as_view(), name = 'api-user-commute'),
+    path('api/user/distance-matrix/', DistanceMatrixView.as_view(), name = 'api-user-distance-matrix'),
+    path('api/user/clusters/', ClusterView.as_view(), name = 'api-user-clusters'),
+    path('api/user/<int:pk>/similar/', SimilarUsersView.as_view(), name = 'api-user-similar'),
+    path('api/interest/autocomplete/', InterestAutocompleteView.as_view(), name = 'api-interest-autocomplete'),
+    path('api/export/<slug:kind>.<slug:extension>', ExportView.as_view(), name = 'api-export'),
+    path('tiles/<int:z>/<int:x>/<int:y>.mvt', TileView.as_view(), name = 'tiles'),
+    path('api/health/database-pool/', DatabasePoolStatsView.as_view(), name = 'api-database-pool'),
+    
+    path('api/async/user/list/', AsyncUserListView.as_view(), name = 'api-async-user-list'),
+    path('api/async/user/<int:pk>/', AsyncUserRetrieveView.as_view(), name = 'api-async-user-retrieve'),
+    path('api/async/user/find/', AsyncUserFindView.as_view(), name = 'api-async-user-find'),
+    path('api/async/export/<slug:kind>.<slug:extension>', AsyncExportView.as_view(), name = 'api-async-export')
 ]
 
 router = SimpleRouter()
 router.register('api/user/work-distance', WorkDistanceView)
 router.register('api/user/area-interest', AreaOfInterestView)
 router.register('api/user/document', DocumentView)
+router.register('api/user/document-upload', DocumentUploadView)
 urlpatterns += router.urls
\ No newline at end of file
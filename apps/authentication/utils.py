@@ -0,0 +1,9 @@
+from itertools import islice
+
+def chunked(iterable, size: int):
+    '''
+    Yields lists of at most `size` items from any iterable.
+    '''
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
\ No newline at end of file
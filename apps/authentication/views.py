@@ -4,29 +4,61 @@ from .models import *
 from django.http import HttpRequest
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.pagination import PageNumberPagination
+from .pagination import StandardPagination, StandardCursorPagination, CommuteCursorPagination
 from rest_framework.views import APIView
-from django.contrib.auth.password_validation import validate_password
+from django.db import transaction
 from django.contrib.gis.geos import Point
-from django.contrib.gis.measure import Distance
+from .proximity import *
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.viewsets import ModelViewSet
+from rest_framework.viewsets import ModelViewSet, GenericViewSet
+from rest_framework.decorators import action
+from django.http import HttpResponse
+from .downloads import document_response
+from .distances import load_coordinates, to_radians, top_k
 from django.core.exceptions import ObjectDoesNotExist
+from django.conf import settings
+from rest_framework.parsers import MultiPartParser
+from .importer import UserImporter, read_rows
+from .uploads import append_chunk, atomic_storage, complete_upload, discard_upload, store_file, release_blob, UploadConflict
+from .exports import EXPORTS, FORMATS, export, accepts_gzip
+from .tiles import get_tile, is_valid_tile
+from .clusters import clusters, TooManyPoints
+from .responses import cached_response
+from .values import ValuesSerializer
+from .bulk import BulkModelMixin
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db.models import Count, Q
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework.negotiation import BaseContentNegotiation
+import re
+import io
+import orjson
+from backend_task.pooled_postgis.pool import pool_stats
 
-def custom_validate_password(password: str) -> Response|None:
-    try:
-        validate_password(password)
-    except Exception as ex:
-        return Response(ex, status = status.HTTP_400_BAD_REQUEST)
 
-class StandardPagination(PageNumberPagination):
-    page_size = 100
-    page_size_query_param = 'page_size'
+class IgnoreClientContentNegotiation(BaseContentNegotiation):
+    '''
+    For views that return their own binary or streamed bodies, so an Accept
+    header like "application/vnd.mapbox-vector-tile" is not answered with 406.
+    '''
+    def select_parser(self, request, parsers):
+        return parsers[0]
+    
+    def select_renderer(self, request, renderers, format_suffix = None):
+        return (renderers[0], renderers[0].media_type)
+
 
 class UserListView(ListAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer 
-    pagination_class = StandardPagination
+    pagination_class = StandardCursorPagination
+    
+    @cached_response(User)
+    def list(self, request: HttpRequest, *args: Any, **kwargs: Any) -> Response:
+        values = ValuesSerializer(self.get_serializer_class(), self.get_serializer_context())
+        user_list = self.paginate_queryset(values.queryset(self.get_queryset()))
+        return self.get_paginated_response(values.to_representation(user_list))
 
 
 class UserCreateView(CreateAPIView):
@@ -36,17 +68,13 @@ class UserCreateView(CreateAPIView):
     
     def create(self, request: HttpRequest, *args: Any, **kwargs: Any) -> Response:
         if request.user.has_perm('authentication.add_user'):
-            res = custom_validate_password(request.data['password'])
-            if res:
-                return res
             return super().create(request, *args, **kwargs)
         else:
             return Response(status = status.HTTP_403_FORBIDDEN)
         
-    def perform_create(self, serializer):
-        instance = serializer.save()
-        instance.set_password(instance.password)
-        instance.save()
+    def perform_create(self, serializer) -> None:
+        with transaction.atomic():
+            serializer.save()
         
         
 class UserRetrieveUpdateDestroyView(RetrieveUpdateDestroyAPIView):
@@ -58,6 +86,7 @@ class UserRetrieveUpdateDestroyView(RetrieveUpdateDestroyAPIView):
             return UserAdminSerializer
         return UserSerializer
     
+    @cached_response(User, perm = 'authentication.view_user')
     def retrieve(self, request: HttpRequest, *args: Any, **kwargs: Any) -> Response:
         if (request.user.has_perm('authentication.view_user')) or (request.user == self.get_object()):
             return super().retrieve(request, *args, **kwargs)
@@ -66,19 +95,13 @@ class UserRetrieveUpdateDestroyView(RetrieveUpdateDestroyAPIView):
         
     def update(self, request: HttpRequest, *args: Any, **kwargs: Any) -> Response:
         if (request.user.has_perm('authentication.change_user')) or (request.user == self.get_object()):
-            if 'password' in request.data:
-                res = custom_validate_password(request.data['password'])
-                if res:
-                    return res
             return super().update(request, *args, **kwargs)
         else:
             return Response(status = status.HTTP_403_FORBIDDEN)
         
     def perform_update(self, serializer) -> None:
-        instance = serializer.save()
-        if 'password' in self.request.data:
-            instance.set_password(instance.password)
-            instance.save()
+        with transaction.atomic():
+            serializer.save()
         
     def destroy(self, request: HttpRequest, *args: Any, **kwargs: Any) -> Response:
         if (request.user.has_perm('authentication.delete_user')) or (request.user == self.get_object()):
@@ -88,10 +111,6 @@ class UserRetrieveUpdateDestroyView(RetrieveUpdateDestroyAPIView):
         
     def patch(self, request: HttpRequest, *args: Any, **kwargs: Any) -> Response:
         if (request.user.has_perm('authentication.change_user')) or (request.user == self.get_object()):
-            if 'password' in request.data:
-                res = custom_validate_password(request.data['password'])
-                if res:
-                    return res
             return super().patch(request, *args, **kwargs)
         else:
             return Response(status = status.HTTP_403_FORBIDDEN)
@@ -100,38 +119,289 @@ class UserRetrieveUpdateDestroyView(RetrieveUpdateDestroyAPIView):
 class UserSignupView(APIView):
     def post(self, request: HttpRequest, *args: Any, **kwargs: Any) -> Response:
         serializer = UserSignUpSerializer(data = request.data)
-        password = request.data['password']
         
         if serializer.is_valid():
-            user = serializer.save()
-            res = custom_validate_password(request.data['password'])
-            if res:
-                return res
-            user.set_password(password)
-            user.save()
+            with transaction.atomic():
+                serializer.save()
             
             return Response('User created successfully.', status = status.HTTP_201_CREATED)
         else:
             return Response(serializer.errors, status = status.HTTP_400_BAD_REQUEST)
         
-class UserFindView(APIView):
-    def get(self, request: HttpRequest, *args: Any, **kwargs: Any) -> Response:
-        point = Point(request.data['latitude'], request.data['longitude'])
-        instance = User.objects.filter(
-            home_address__distance_lt = (point, Distance(km = 10))
+class UserImportView(APIView):
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser]
+    
+    def post(self, request: HttpRequest, *args: Any, **kwargs: Any) -> Response:
+        if not (request.user.is_admin or request.user.is_superuser):
+            return Response(status = status.HTTP_403_FORBIDDEN)
+        
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'file': ['No file was submitted.']}, status = status.HTTP_400_BAD_REQUEST)
+        
+        format = request.data.get('format') or upload.name.rsplit('.', 1)[-1].lower()
+        if format not in ('csv', 'ndjson'):
+            return Response({'format': ['Must be csv or ndjson.']}, status = status.HTTP_400_BAD_REQUEST)
+        
+        stream = io.TextIOWrapper(upload.file, encoding = 'utf-8', errors = 'surrogateescape', newline = '')
+        report = UserImporter(workers = settings.USER_IMPORT_WORKERS).run(read_rows(stream, format))
+        return Response(report, status = status.HTTP_201_CREATED if report['created'] else status.HTTP_400_BAD_REQUEST)
+        
+        
+class UserFindView(ListAPIView):
+    queryset = User.objects.all()
+    serializer_class = UserDistanceSerializer
+    pagination_class = StandardPagination
+    
+    def list(self, request: HttpRequest, *args: Any, **kwargs: Any) -> Response:
+        query = UserFindQuerySerializer(data = request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status = status.HTTP_400_BAD_REQUEST)
+        
+        params = query.validated_data
+        point = Point(params['longitude'], params['latitude'], srid = 4326)
+        field = f"{params['address']}_address"
+        
+        if use_spatial_index():
+            return self.list_from_index(point, field, params)
+        
+        if 'nearest' in params:
+            instance = nearest_users(point, field, params['nearest'], params.get('radius'))
+            serializer = self.get_serializer(instance, many = True)
+            return Response(serializer.data, status = status.HTTP_200_OK)
+        
+        instance = self.paginate_queryset(
+            users_within(point, field, params.get('radius', DEFAULT_RADIUS_KM))
         )
-        users = UserSerializer(data = instance, many = True).data
-        return Response(
-            users,
-            status = status.HTTP_200_OK
+        serializer = self.get_serializer(instance, many = True)
+        return self.get_paginated_response(serializer.data)
+    
+    def list_from_index(self, point: Point, field: str, params: dict) -> Response:
+        if 'nearest' in params:
+            hits = indexed_nearest_users(point, field, params['nearest'], params.get('radius'))
+            serializer = self.get_serializer(hydrate(hits), many = True)
+            return Response(serializer.data, status = status.HTTP_200_OK)
+        
+        hits = self.paginate_queryset(
+            indexed_users_within(point, field, params.get('radius', DEFAULT_RADIUS_KM))
         )
+        serializer = self.get_serializer(hydrate(hits), many = True)
+        return self.get_paginated_response(serializer.data)
+        
+        
+class DistanceMatrixView(APIView):
+    '''
+    The k nearest destinations of each origin, computed in NumPy from one
+    load of the relevant coordinates instead of a distance query per origin.
+    '''
+    permission_classes = [IsAuthenticated]
+    
+    def post(self, request: HttpRequest, *args: Any, **kwargs: Any) -> Response:
+        if not request.user.has_perm('authentication.view_user'):
+            return Response(status = status.HTTP_403_FORBIDDEN)
+        
+        serializer = DistanceMatrixSerializer(data = request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status = status.HTTP_400_BAD_REQUEST)
+        
+        params = serializer.validated_data
+        destination_params = params.get('destinations', {'address': 'home'})
+        origin_ids, origins = self.load(params['origins'])
+        # Destinations without users or points are every user, so cap them;
+        # loading one more than the cap is enough to tell.
+        limit = settings.DISTANCE_MATRIX_MAX_DESTINATIONS
+        destination_ids, destinations = self.load(destination_params, limit + 1)
+        if len(destinations) > limit:
+            return Response({'destinations': [f'More than {limit} users; pass destination users or points.']}, status = status.HTTP_400_BAD_REQUEST)
+        indices, distances = top_k(origins, destinations, params['k'], origin_ids, destination_ids)
+        
+        origin_key = 'origin_point' if origin_ids is None else 'origin_user'
+        match_key = 'point' if destination_ids is None else 'user'
+        results = []
+        for row, (matches, row_distances) in enumerate(zip(indices, distances)):
+            results.append({
+                origin_key: row if origin_ids is None else int(origin_ids[row]),
+                'matches': [
+                    {
+                        match_key: int(index) if destination_ids is None else int(destination_ids[index]),
+                        'distance': float(distance)
+                    }
+                    for index, distance in zip(matches, row_distances) if index >= 0
+                ]
+            })
+        return Response(results, status = status.HTTP_200_OK)
+    
+    def load(self, params: dict, limit: int|None = None):
+        if 'points' in params:
+            return None, to_radians(params['points'])
+        queryset = User.objects.all()
+        if 'users' in params:
+            queryset = queryset.filter(id__in = params['users'])
+        return load_coordinates(queryset, f"{params['address']}_address", limit)
+        
+        
+class CommuteListView(ListAPIView):
+    queryset = WorkDistance.objects.all()
+    serializer_class = WorkDistanceSerializer
+    pagination_class = CommuteCursorPagination
+    permission_classes = [IsAuthenticated]
+    
+    def list(self, request: HttpRequest, *args: Any, **kwargs: Any) -> Response:
+        if not request.user.has_perm('authentication.view_workdistance'):
+            return Response(status = status.HTTP_403_FORBIDDEN)
+        
+        query = CommuteQuerySerializer(data = request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status = status.HTTP_400_BAD_REQUEST)
+        
+        # The cursor orders by length, which cannot page past NULL lengths.
+        queryset = WorkDistance.objects.filter(length__isnull = False)
+        if 'min_km' in query.validated_data:
+            queryset = queryset.filter(length__gte = query.validated_data['min_km'] * 1000)
+        if 'max_km' in query.validated_data:
+            queryset = queryset.filter(length__lte = query.validated_data['max_km'] * 1000)
+        
+        values = ValuesSerializer(self.get_serializer_class(), self.get_serializer_context())
+        work_distance_list = self.paginate_queryset(values.queryset(queryset))
+        return self.get_paginated_response(values.to_representation(work_distance_list))
+        
+        
+class ExportView(APIView):
+    '''
+    Streams a whole table as GeoJSON or NDJSON, gzipped when the client
+    accepts it, without building the response in memory.
+    '''
+    permission_classes = [IsAuthenticated]
+    content_negotiation_class = IgnoreClientContentNegotiation
+    exporter = staticmethod(export)
+    
+    def get(self, request: HttpRequest, kind: str, extension: str, *args: Any, **kwargs: Any) -> HttpResponse:
+        if kind not in EXPORTS or extension not in FORMATS:
+            return Response(status = status.HTTP_404_NOT_FOUND)
+        if not request.user.has_perm(EXPORTS[kind][2]):
+            return Response(status = status.HTTP_403_FORBIDDEN)
+        
+        address = request.query_params.get('address', 'home')
+        if address not in ('home', 'office'):
+            return Response({'address': ['Must be home or office.']}, status = status.HTTP_400_BAD_REQUEST)
+        
+        gzip = accepts_gzip(request.headers.get('Accept-Encoding', ''))
+        response = StreamingHttpResponse(self.exporter(kind, extension, address, gzip), content_type = FORMATS[extension])
+        response['Content-Disposition'] = f'attachment; filename="{kind}.{extension}"'
+        if gzip:
+            response['Content-Encoding'] = 'gzip'
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+        
+        
+class InterestAutocompleteView(APIView):
+    '''
+    Interests matching a prefix or fuzzily similar to `q`, best matches
+    first. Both conditions are served by the trigram index on the key.
+    '''
+    def get(self, request: HttpRequest, *args: Any, **kwargs: Any) -> Response:
+        query = InterestQuerySerializer(data = request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status = status.HTTP_400_BAD_REQUEST)
+        
+        key = normalize_interest(query.validated_data['q'])
+        interests = Interest.objects.filter(
+            Q(key__startswith = key) | Q(key__trigram_similar = key)
+        ).annotate(
+            similarity = TrigramSimilarity('key', key)
+        ).order_by('-similarity', 'key').values('id', 'name')[:query.validated_data['limit']]
+        return Response(list(interests), status = status.HTTP_200_OK)
+        
+        
+class SimilarUsersView(APIView):
+    '''
+    Users sharing the most interests with a user, found through the
+    (interest, user) index instead of comparing every user.
+    '''
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request: HttpRequest, pk: int, *args: Any, **kwargs: Any) -> Response:
+        if not ((request.user.has_perm('authentication.view_areaofinterest')) or (request.user.id == pk)):
+            return Response(status = status.HTTP_403_FORBIDDEN)
+        
+        query = SimilarUsersQuerySerializer(data = request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status = status.HTTP_400_BAD_REQUEST)
+        
+        interests = AreaOfInterest.objects.filter(user_id = pk).values('interest_id')
+        similar = AreaOfInterest.objects.filter(
+            interest_id__in = interests
+        ).exclude(
+            user_id = pk
+        ).values('user').annotate(
+            shared = Count('interest', distinct = True)
+        ).order_by('-shared', 'user')[:query.validated_data['limit']]
+        return Response(list(similar), status = status.HTTP_200_OK)
+        
+        
+class ClusterView(APIView):
+    '''
+    User counts and centroids per map cluster inside a bbox, for overview
+    maps that do not need individual users.
+    '''
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request: HttpRequest, *args: Any, **kwargs: Any) -> Response:
+        if not request.user.has_perm('authentication.view_user'):
+            return Response(status = status.HTTP_403_FORBIDDEN)
+        
+        query = ClusterQuerySerializer(data = request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status = status.HTTP_400_BAD_REQUEST)
+        
+        params = query.validated_data
+        try:
+            results = clusters(params['bbox'], params['zoom'], params['address'], params['method'], params['countries'])
+        except TooManyPoints as ex:
+            return Response({'bbox': [str(ex)]}, status = status.HTTP_400_BAD_REQUEST)
+        return Response(results, status = status.HTTP_200_OK)
+        
+        
+class TileView(APIView):
+    '''
+    Mapbox Vector Tiles of user addresses and commutes, rendered by PostGIS
+    and served from the tile cache.
+    '''
+    permission_classes = [IsAuthenticated]
+    content_negotiation_class = IgnoreClientContentNegotiation
+    
+    def get(self, request: HttpRequest, z: int, x: int, y: int, *args: Any, **kwargs: Any) -> HttpResponse:
+        if not is_valid_tile(z, x, y):
+            return Response(status = status.HTTP_404_NOT_FOUND)
+        if not request.user.has_perm('authentication.view_user'):
+            return Response(status = status.HTTP_403_FORBIDDEN)
+        
+        tile = get_tile(z, x, y)
+        response = HttpResponse(tile, content_type = 'application/vnd.mapbox-vector-tile', status = 200 if tile else 204)
+        response['Cache-Control'] = 'private, max-age=60'
+        return response
+        
+        
+class DatabasePoolStatsView(APIView):
+    '''
+    Utilisation of the database connection pools of the worker process
+    answering the request.
+    '''
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request: HttpRequest, *args: Any, **kwargs: Any) -> Response:
+        if not (request.user.is_admin or request.user.is_superuser):
+            return Response(status = status.HTTP_403_FORBIDDEN)
+        return Response(pool_stats(), status = status.HTTP_200_OK)
         
         
 class WorkDistanceView(ModelViewSet):
     queryset = WorkDistance.objects.all()
     serializer_class = WorkDistanceSerializer
-    pagination_class = StandardPagination
+    pagination_class = StandardCursorPagination
     
+    @cached_response(WorkDistance, User, perm = 'authentication.view_workdistance')
     def list(self, request: HttpRequest, *args: Any, **kwargs: Any) -> Response:
         user_id = request.query_params.get('user', None)
         try:
@@ -139,10 +409,10 @@ class WorkDistanceView(ModelViewSet):
         except ObjectDoesNotExist:
             return Response('User not found', status = status.HTTP_404_NOT_FOUND)
         else:
-            if (request.user.has_perm('authentication.view_workdistance')) or (request.user.id == user):
-                work_distance_list = WorkDistance.objects.filter(user = user)
-                serializer = WorkDistanceSerializer(work_distance_list, many = True)
-                return Response(serializer.data, status = status.HTTP_200_OK)
+            if (request.user.has_perm('authentication.view_workdistance')) or (request.user.id == user.id):
+                values = ValuesSerializer(WorkDistanceSerializer)
+                work_distance_list = self.paginate_queryset(values.queryset(WorkDistance.objects.filter(user = user)))
+                return self.get_paginated_response(values.to_representation(work_distance_list))
             else:
                 return Response(status = status.HTTP_403_FORBIDDEN)
         
@@ -152,8 +422,9 @@ class WorkDistanceView(ModelViewSet):
         else:
             return Response(status = status.HTTP_403_FORBIDDEN)
         
+    @cached_response(WorkDistance, perm = 'authentication.view_workdistance')
     def retrieve(self, request: HttpRequest, *args: Any, **kwargs: Any) -> Response:
-        if (request.user.has_perm('authentication.view_workdistance')) or (request.user.id == self.get_object().user):
+        if (request.user.has_perm('authentication.view_workdistance')) or (request.user.id == self.get_object().user_id):
             return super().retrieve(request, *args, **kwargs)
         else:
             return Response(status = status.HTTP_403_FORBIDDEN)
@@ -171,11 +442,28 @@ class WorkDistanceView(ModelViewSet):
             return Response(status = status.HTTP_403_FORBIDDEN)
         
 
-class AreaOfInterestView(ModelViewSet):
-    queryset = AreaOfInterest.objects.all()
+class AreaOfInterestView(BulkModelMixin, ModelViewSet):
+    queryset = AreaOfInterest.objects.select_related('interest')
     serializer_class = AreaOfInterestSerializer
-    pagination_class = StandardPagination
+    pagination_class = StandardCursorPagination
     
+    def _resolve_interests(self, validated: list[dict]) -> list[dict]:
+        '''
+        Replaces interest names with vocabulary entries, all in one INSERT and one SELECT.
+        '''
+        interests = Interest.objects.resolve_many([data['interest']['name'] for data in validated if 'interest' in data])
+        return [
+            {**data, 'interest': interests[normalize_interest(data['interest']['name'])]} if 'interest' in data else data
+            for data in validated
+        ]
+    
+    def build_instances(self, validated: list[dict]) -> list[AreaOfInterest]:
+        return super().build_instances(self._resolve_interests(validated))
+    
+    def apply_changes(self, instances: list[AreaOfInterest], validated: list[dict]) -> set[str]:
+        return super().apply_changes(instances, self._resolve_interests(validated))
+    
+    @cached_response(AreaOfInterest, Interest, User, perm = 'authentication.view_areaofinterest')
     def list(self, request: HttpRequest, *args: Any, **kwargs: Any) -> Response:
         user_id = request.query_params.get('user', None)
         try:
@@ -183,21 +471,26 @@ class AreaOfInterestView(ModelViewSet):
         except ObjectDoesNotExist:
             return Response('User not found', status = status.HTTP_404_NOT_FOUND)
         else:
-            if (request.user.has_perm('authentication.view_areaofinterest')) or (request.user.id == user):
-                aof_list = AreaOfInterest.objects.filter(user = user)
-                serializer = AreaOfInterestSerializer(aof_list, many = True)
-                return Response(serializer.data, status = status.HTTP_200_OK)
+            if (request.user.has_perm('authentication.view_areaofinterest')) or (request.user.id == user.id):
+                values = ValuesSerializer(AreaOfInterestSerializer)
+                aof_list = self.paginate_queryset(values.queryset(AreaOfInterest.objects.filter(user = user)))
+                return self.get_paginated_response(values.to_representation(aof_list))
             else:
                 return Response(status = status.HTTP_403_FORBIDDEN)
         
     def create(self, request: HttpRequest, *args: Any, **kwargs: Any) -> Response:
-        if (request.user.has_perm('authentication.add_areaofinterest')) or (request.user.id == self.get_object().user):
-            return super().create(request, *args, **kwargs)
+        serializer = self.get_serializer(data = request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status = status.HTTP_400_BAD_REQUEST)
+        if (request.user.has_perm('authentication.add_areaofinterest')) or (request.user.id == serializer.validated_data['user'].id):
+            serializer.save()
+            return Response(serializer.data, status = status.HTTP_201_CREATED)
         else:
             return Response(status = status.HTTP_403_FORBIDDEN)
         
+    @cached_response(AreaOfInterest, Interest, perm = 'authentication.view_areaofinterest')
     def retrieve(self, request: HttpRequest, *args: Any, **kwargs: Any) -> Response:
-        if (request.user.has_perm('authentication.view_areaofinterest')) or (request.user.id == self.get_object().user):
+        if (request.user.has_perm('authentication.view_areaofinterest')) or (request.user.id == self.get_object().user_id):
             return super().retrieve(request, *args, **kwargs)
         else:
             return Response(status = status.HTTP_403_FORBIDDEN)
@@ -215,12 +508,57 @@ class AreaOfInterestView(ModelViewSet):
             return Response(status = status.HTTP_403_FORBIDDEN)
         
         
-class DocumentView(ModelViewSet):
+class DocumentView(BulkModelMixin, ModelViewSet):
+    '''
+    Bulk creates are multipart: an `items` JSON list plus each item's file
+    in a `document.<index>` part.
+    '''
     queryset = Document.objects.all()
     serializer_class = DocumentSerializer
-    pagination_class = StandardPagination
+    pagination_class = StandardCursorPagination
     permission_classes = [IsAuthenticated]
     
+    def get_bulk_items(self, request: HttpRequest) -> list|None:
+        if isinstance(request.data, list):
+            return request.data
+        items = request.data.get('items')
+        if isinstance(items, str):
+            # Multipart bodies carry the items as a JSON string next to the files.
+            try:
+                items = orjson.loads(items)
+            except orjson.JSONDecodeError:
+                return None
+        if isinstance(items, list):
+            for index, item in enumerate(items):
+                if isinstance(item, dict) and f'document.{index}' in request.FILES:
+                    item['document'] = request.FILES[f'document.{index}']
+        return items
+    
+    def bulk_atomic(self):
+        # Files stored for a batch that rolls back are deleted with it.
+        return atomic_storage()
+    
+    def _store_files(self, validated: list[dict]) -> list[dict]:
+        # Content-addressed like single uploads, so duplicates are stored once.
+        stored = []
+        for data in validated:
+            if 'document' in data:
+                blob = store_file(data['document'])
+                data = {**data, 'document': blob.file.name, 'blob': blob}
+            stored.append(data)
+        return stored
+    
+    def build_instances(self, validated: list[dict]) -> list[Document]:
+        return super().build_instances(self._store_files(validated))
+    
+    def apply_changes(self, instances: list[Document], validated: list[dict]) -> set[str]:
+        replaced = [instance.blob_id for instance, data in zip(instances, validated) if 'document' in data and instance.blob_id is not None]
+        fields = super().apply_changes(instances, self._store_files(validated))
+        for blob_id in replaced:
+            release_blob(blob_id)
+        return fields
+    
+    @cached_response(Document, User, perm = 'authentication.view_document')
     def list(self, request: HttpRequest, *args: Any, **kwargs: Any) -> Response:
         user_id = request.query_params.get('user', None)
         try:
@@ -228,21 +566,26 @@ class DocumentView(ModelViewSet):
         except ObjectDoesNotExist:
             return Response('User not found', status = status.HTTP_404_NOT_FOUND)
         else:
-            if (request.user.has_perm('authentication.view_document')) or (request.user.id == user):
-                document_list = Document.objects.filter(user = user)
-                serializer = DocumentSerializer(document_list, many = True)
-                return Response(serializer.data, status = status.HTTP_200_OK)
+            if (request.user.has_perm('authentication.view_document')) or (request.user.id == user.id):
+                values = ValuesSerializer(DocumentSerializer)
+                document_list = self.paginate_queryset(values.queryset(Document.objects.filter(user = user)))
+                return self.get_paginated_response(values.to_representation(document_list))
             else:
                 return Response(status = status.HTTP_403_FORBIDDEN)
         
     def create(self, request: HttpRequest, *args: Any, **kwargs: Any) -> Response:
-        if (request.user.has_perm('authentication.add_document')) or (request.user.id == request.data['user']):
-            return super().create(request, *args, **kwargs)
+        serializer = self.get_serializer(data = request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status = status.HTTP_400_BAD_REQUEST)
+        if (request.user.has_perm('authentication.add_document')) or (request.user.id == serializer.validated_data['user'].id):
+            serializer.save()
+            return Response(serializer.data, status = status.HTTP_201_CREATED)
         else:
             return Response(status = status.HTTP_403_FORBIDDEN)
         
+    @cached_response(Document, perm = 'authentication.view_document')
     def retrieve(self, request: HttpRequest, *args: Any, **kwargs: Any) -> Response:
-        if (request.user.has_perm('authentication.view_document')) or (request.user.id == self.get_object().user):
+        if (request.user.has_perm('authentication.view_document')) or (request.user.id == self.get_object().user_id):
             return super().retrieve(request, *args, **kwargs)
         else:
             return Response(status = status.HTTP_403_FORBIDDEN)
@@ -256,5 +599,74 @@ class DocumentView(ModelViewSet):
     def destroy(self, request: HttpRequest, *args: Any, **kwargs: Any) -> Response:
         if (request.user.has_perm('authentication.delete_document')) or (request.user.id == self.get_object().user):
             return super().destroy(request, *args, **kwargs)
+        else:
+            return Response(status = status.HTTP_403_FORBIDDEN)
+        
+    @action(detail = True, methods = ['get'])
+    def download(self, request: HttpRequest, *args: Any, **kwargs: Any) -> HttpResponse:
+        document = self.get_object()
+        if (request.user.has_perm('authentication.view_document')) or (request.user.id == document.user_id):
+            return document_response(request, document)
+        else:
+            return Response(status = status.HTTP_403_FORBIDDEN)
+            
+            
+class DocumentUploadView(GenericViewSet):
+    '''
+    Chunked, resumable document uploads.
+
+    POST creates an upload for a `user`, `document_type` and total `size`.
+    Each chunk is then PUT as the raw request body with a
+    `Content-Range: bytes <start>-<end>/<size>` header; GET returns the offset
+    to resume from. The `Document` is created when the last chunk arrives.
+    '''
+    queryset = DocumentUpload.objects.all()
+    serializer_class = DocumentUploadSerializer
+    permission_classes = [IsAuthenticated]
+    content_range = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+    
+    def create(self, request: HttpRequest, *args: Any, **kwargs: Any) -> Response:
+        serializer = self.get_serializer(data = request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status = status.HTTP_400_BAD_REQUEST)
+        if (request.user.has_perm('authentication.add_document')) or (request.user.id == serializer.validated_data['user'].id):
+            serializer.save()
+            return Response(serializer.data, status = status.HTTP_201_CREATED)
+        else:
+            return Response(status = status.HTTP_403_FORBIDDEN)
+        
+    def retrieve(self, request: HttpRequest, *args: Any, **kwargs: Any) -> Response:
+        upload = self.get_object()
+        if (request.user.has_perm('authentication.add_document')) or (request.user.id == upload.user_id):
+            return Response(self.get_serializer(upload).data, status = status.HTTP_200_OK)
+        else:
+            return Response(status = status.HTTP_403_FORBIDDEN)
+        
+    def update(self, request: HttpRequest, *args: Any, **kwargs: Any) -> Response:
+        upload = self.get_object()
+        if not ((request.user.has_perm('authentication.add_document')) or (request.user.id == upload.user_id)):
+            return Response(status = status.HTTP_403_FORBIDDEN)
+        
+        match = self.content_range.match(request.headers.get('Content-Range', ''))
+        if not match or int(match.group(3)) != upload.size:
+            return Response({'Content-Range': [f'Expected "bytes <start>-<end>/{upload.size}".']}, status = status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            upload = append_chunk(upload, int(match.group(1)), request.stream)
+        except UploadConflict as ex:
+            return Response({'offset': ex.offset}, status = status.HTTP_409_CONFLICT)
+        except ValueError as ex:
+            return Response({'detail': str(ex)}, status = status.HTTP_400_BAD_REQUEST)
+        
+        if upload.offset < upload.size:
+            return Response(self.get_serializer(upload).data, status = status.HTTP_200_OK)
+        document = complete_upload(upload)
+        return Response(DocumentSerializer(document).data, status = status.HTTP_201_CREATED)
+        
+    def destroy(self, request: HttpRequest, *args: Any, **kwargs: Any) -> Response:
+        upload = self.get_object()
+        if (request.user.has_perm('authentication.add_document')) or (request.user.id == upload.user_id):
+            discard_upload(upload)
+            return Response(status = status.HTTP_204_NO_CONTENT)
         else:
             return Response(status = status.HTTP_403_FORBIDDEN)
\ No newline at end of file
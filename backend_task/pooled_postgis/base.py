@@ -0,0 +1,49 @@
+import psycopg2.extras
+from django.contrib.gis.db.backends.postgis.base import DatabaseWrapper as PostGISDatabaseWrapper
+from .pool import get_pool, closeall
+
+
+class DatabaseCreation(PostGISDatabaseWrapper.creation_class):
+    def _destroy_test_db(self, test_database_name: str, verbosity: int) -> None:
+        # Pooled sessions would keep DROP DATABASE from running.
+        closeall(test_database_name)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(PostGISDatabaseWrapper):
+    '''
+    PostGIS backend that checks connections out of a per-process pool
+    instead of opening one per request, and returns them on close.
+
+    The pool is configured by `OPTIONS['pool']` (see `pool.DEFAULTS`); keep
+    `CONN_MAX_AGE` at 0 so connections go back to the pool at the end of
+    every request and Celery task.
+    '''
+    creation_class = DatabaseCreation
+    connection_pool = None
+
+    def get_connection_params(self) -> dict:
+        params = super().get_connection_params()
+        params.pop('pool', None)
+        return params
+
+    def get_new_connection(self, conn_params: dict):
+        self.connection_pool = get_pool(self.alias, conn_params, self.settings_dict['OPTIONS'].get('pool'))
+        connection = self.connection_pool.getconn()
+        # The per-connection setup of the PostgreSQL backend, which does not
+        # touch the server and is repeated for each checkout.
+        options = self.settings_dict['OPTIONS']
+        try:
+            self.isolation_level = options['isolation_level']
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level = self.isolation_level)
+        psycopg2.extras.register_default_jsonb(conn_or_curs = connection, loads = lambda x: x)
+        return connection
+
+    def _close(self) -> None:
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.connection_pool.putconn(self.connection)
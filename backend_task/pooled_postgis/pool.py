@@ -0,0 +1,185 @@
+import os
+import threading
+import time
+import psycopg2
+from psycopg2 import extensions
+from psycopg2_pool import ThreadSafeConnectionPool
+
+DEFAULTS = {
+    'min_size': 1,
+    'max_size': 10,
+    # Seconds to wait for a free connection before failing the checkout.
+    'timeout': 5.0,
+    # Seconds an idle connection above `min_size` is kept open.
+    'idle_timeout': 10 * 60,
+    # Connections idle for longer than this are pinged before reuse; 0 pings on every checkout.
+    'health_check_interval': 30.0,
+}
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    '''
+    No connection became free within the checkout timeout. Django reports
+    it as a `django.db.OperationalError`, like a failed connect.
+    '''
+
+
+class PooledConnection(extensions.connection):
+    returned_at = None
+
+
+class ConnectionPool:
+    '''
+    Per-process pool of psycopg2 connections for one database.
+
+    `psycopg2_pool` keeps the idle connections and closes those idle for
+    longer than `idle_timeout`. On top of it, checkouts wait up to `timeout`
+    for a slot once `max_size` connections are in use, connections idle for
+    longer than `health_check_interval` are pinged and replaced when dead,
+    and connections come back rolled back to an idle transaction state.
+    '''
+    def __init__(self, name: str, conn_params: dict, options: dict|None = None):
+        options = {**DEFAULTS, **(options or {})}
+        self.name = name
+        self.database = conn_params.get('database')
+        self.pid = os.getpid()
+        self.max_size = options['max_size']
+        self.timeout = options['timeout']
+        self.health_check_interval = options['health_check_interval']
+        self.pool = ThreadSafeConnectionPool(
+            minconn = options['min_size'],
+            maxconn = options['max_size'],
+            idle_timeout = options['idle_timeout'],
+            dsn = extensions.make_dsn(**conn_params),
+            connection_factory = PooledConnection
+        )
+        self.available = threading.Condition()
+        self.in_use = 0
+        self.counters = {'checkouts': 0, 'waits': 0, 'timeouts': 0, 'failed_health_checks': 0, 'wait_seconds': 0.0}
+
+    def getconn(self) -> PooledConnection:
+        started = time.monotonic()
+        with self.available:
+            if self.in_use >= self.max_size:
+                self.counters['waits'] += 1
+            while self.in_use >= self.max_size:
+                remaining = self.timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    self.counters['timeouts'] += 1
+                    raise PoolTimeout(f'No connection free in pool "{self.name}" after {self.timeout}s ({self.max_size} in use).')
+                self.available.wait(remaining)
+            self.in_use += 1
+            self.counters['checkouts'] += 1
+            self.counters['wait_seconds'] += time.monotonic() - started
+
+        try:
+            return self._checkout()
+        except BaseException:
+            self._release_slot()
+            raise
+
+    def _checkout(self) -> PooledConnection:
+        while True:
+            connection = self.pool.getconn()
+            if self._is_healthy(connection):
+                return connection
+            with self.available:
+                self.counters['failed_health_checks'] += 1
+            connection.close()
+            self.pool.putconn(connection)
+
+    def _is_healthy(self, connection: PooledConnection) -> bool:
+        if connection.closed:
+            return False
+        # Fresh connections and recently returned ones are trusted as they are.
+        if connection.returned_at is None or time.monotonic() - connection.returned_at < self.health_check_interval:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if connection.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    def putconn(self, connection: PooledConnection) -> None:
+        try:
+            if not connection.closed and connection.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+        except psycopg2.Error:
+            connection.close()
+        connection.returned_at = time.monotonic()
+        try:
+            self.pool.putconn(connection)
+        finally:
+            self._release_slot()
+
+    def _release_slot(self) -> None:
+        with self.available:
+            self.in_use -= 1
+            self.available.notify()
+
+    def close(self) -> None:
+        '''
+        Closes the idle connections and stops keeping `min_size` open;
+        connections still checked out are closed when they come back.
+        '''
+        self.pool.minconn = 0
+        self.pool.idle_timeout = 0
+        self.pool.clear()
+
+    def stats(self) -> dict:
+        with self.available:
+            return {
+                'max_size': self.max_size,
+                'in_use': self.in_use,
+                'utilisation': self.in_use / self.max_size,
+                **self.counters
+            }
+
+
+_pools: dict[tuple, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+# Pools inherited from a parent process. Their sockets belong to the parent,
+# so they are never used here, and are kept referenced so garbage collection
+# does not close the parent's connections from the child.
+_inherited: list[ConnectionPool] = []
+
+
+def get_pool(alias: str, conn_params: dict, options: dict|None = None) -> ConnectionPool:
+    '''
+    The pool of this process for `alias` and `conn_params`, created on first
+    use. Forked workers (Celery prefork, gunicorn --preload) each get their
+    own pool the first time they connect.
+    '''
+    key = (alias, tuple(sorted((name, repr(value)) for name, value in conn_params.items())))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is not None and pool.pid != os.getpid():
+            _inherited.append(pool)
+            pool = None
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(f"{alias}/{conn_params.get('database', '')}", conn_params, options)
+        return pool
+
+
+def closeall(database: str|None = None) -> None:
+    '''
+    Closes and forgets the pools of this process, or only those connected
+    to `database`, e.g. before the test database is dropped.
+    '''
+    with _pools_lock:
+        for key, pool in list(_pools.items()):
+            if pool.pid == os.getpid() and database in (None, pool.database):
+                pool.close()
+                del _pools[key]
+
+
+def pool_stats() -> dict[str, dict]:
+    '''
+    Utilisation and counters of every pool of this process.
+    '''
+    with _pools_lock:
+        pools = [pool for pool in _pools.values() if pool.pid == os.getpid()]
+    return {pool.name: pool.stats() for pool in pools}
@@ -27,6 +27,7 @@ INSTALLED_APPS = [
     "django.contrib.messages",
     "django.contrib.staticfiles",
     "django.contrib.gis",
+    "django.contrib.postgres",
     "phonenumber_field",
     "rest_framework",
     "rest_framework_gis",
@@ -40,6 +41,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "apps.authentication.routers.ReplicaReadMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -77,14 +79,43 @@ WSGI_APPLICATION = "backend_task.wsgi.application"
 
 DATABASES = {
     "default": {
-        "ENGINE": "django.contrib.gis.db.backends.postgis",
+        # PostGIS with a per-process connection pool (backend_task/pooled_postgis).
+        "ENGINE": "backend_task.pooled_postgis",
         "NAME": "backend_test_db",
         "USER": "admin",
-        "PASSWORD": "admin"
+        "PASSWORD": "admin",
+        # Connections go back to the pool at the end of each request or task.
+        "CONN_MAX_AGE": 0,
+        "OPTIONS": {
+            "pool": {
+                "min_size": 2,
+                "max_size": 20,
+                "timeout": 5,
+                "idle_timeout": 10 * 60,
+                "health_check_interval": 30,
+            },
+        },
     },
 }
 
 
+# Safe-method requests read from a healthy replica; writes, transactions and
+# requests from users who wrote in the last few seconds use "default".
+# Point the replica's HOST at a streaming standby; locally it is a second
+# alias to the same database.
+DATABASES["replica"] = {
+    **DATABASES["default"],
+    "OPTIONS": {**DATABASES["default"]["OPTIONS"], "connect_timeout": 2},
+    "TEST": {"MIRROR": "default"},
+}
+
+DATABASE_ROUTERS = ["apps.authentication.routers.ReplicaRouter"]
+DATABASE_REPLICAS = ["replica"]
+REPLICA_STICKY_SECONDS = 10
+REPLICA_MAX_LAG_SECONDS = 5
+REPLICA_HEALTH_CHECK_INTERVAL = 10
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -115,6 +146,22 @@ USE_TZ = True
 
 STATIC_URL = "static/"
 
+MEDIA_URL = "media/"
+MEDIA_ROOT = BASE_DIR / "media"
+
+# Chunked document uploads. Every chunk but the last must be exactly
+# DOCUMENT_UPLOAD_CHUNK_SIZE bytes; partial uploads live in the staging dir.
+DOCUMENT_UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024
+DOCUMENT_UPLOAD_MAX_SIZE = 100 * 1024 * 1024
+DOCUMENT_UPLOAD_STAGING_DIR = MEDIA_ROOT / "uploads"
+
+# How document downloads are served: "django" streams the file from the app
+# (FileResponse, sendfile-capable under gunicorn), "nginx" hands off with
+# X-Accel-Redirect to DOCUMENT_ACCEL_REDIRECT_PREFIX (an internal location
+# aliased to MEDIA_ROOT) and "sendfile" sets X-Sendfile for Apache/lighttpd.
+DOCUMENT_DOWNLOAD_BACKEND = "django"
+DOCUMENT_ACCEL_REDIRECT_PREFIX = "/protected-media/"
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
@@ -122,12 +169,56 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 AUTH_USER_MODEL = "authentication.User"
 
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": "redis://localhost:6379/1",
+    },
+    # Per-process tier in front of Redis for hot entries such as permission sets.
+    "local": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "local",
+    },
+}
+
+# Builds request.user from token claims instead of loading it per request.
+# Swap back to 'rest_framework_simplejwt.authentication.JWTAuthentication'
+# to always load the user row.
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-    )
+        'apps.authentication.authentication.TokenUserAuthentication',
+    ),
+    # orjson encodes and decodes JSON bodies several times faster than the stdlib.
+    'DEFAULT_RENDERER_CLASSES': (
+        'apps.authentication.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'apps.authentication.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
 
+TOKEN_VERSION_CACHE_TIMEOUT = 60 * 60
+PERMISSION_CACHE_TIMEOUT = 60 * 60
+# Cached read responses are also invalidated by model signals; this only bounds memory.
+RESPONSE_CACHE_TIMEOUT = 5 * 60
+
+# In-process spatial index for UserFindView. Always used when the database
+# is not PostGIS (e.g. SpatiaLite test setups). Each process holds its own
+# copy; committed user saves and imports bump a generation in the default
+# cache, and the other processes reload their copy from the database when
+# they see it change, at most USER_SPATIAL_INDEX_CHECK_INTERVAL seconds
+# later. Every change elsewhere costs each process a full reload, so enable
+# it for read-mostly data.
+USER_SPATIAL_INDEX_ENABLED = False
+USER_SPATIAL_INDEX_CELL_SIZE = 0.1
+USER_SPATIAL_INDEX_CHECK_INTERVAL = 5
+
+# Password hashing processes used by bulk user imports (None = one per CPU).
+USER_IMPORT_WORKERS = None
+
 # Celery Configuration Options
 CELERY_TIMEZONE = "Asia/Kathmandu"
 CELERY_TASK_TRACK_STARTED = True
@@ -144,6 +235,22 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'apps.authentication.tasks.wish_birthday',
         'schedule': crontab(hour = 0, minute = 1),
     },
+    'email-outbox': {
+        'task': 'apps.authentication.tasks.dispatch_outbox',
+        'schedule': crontab(minute = '*'),
+    },
+    'purge-stale-uploads': {
+        'task': 'apps.authentication.tasks.purge_stale_uploads',
+        'schedule': crontab(hour = 3, minute = 0),
+    },
+    'refresh-user-clusters': {
+        'task': 'apps.authentication.tasks.refresh_user_clusters',
+        'schedule': crontab(minute = '*'),
+    },
+    'rebuild-user-clusters': {
+        'task': 'apps.authentication.tasks.rebuild_user_clusters',
+        'schedule': crontab(hour = 2, minute = 30),
+    },
 }
 
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
@@ -152,3 +259,38 @@ EMAIL_USE_TLS = True
 EMAIL_PORT = 587
 EMAIL_HOST_USER = ''
 EMAIL_HOST_PASSWORD =  ''
+
+
+# Birthday mails are enqueued in the outbox in chunks of BIRTHDAY_MAIL_BATCH_SIZE.
+BIRTHDAY_MAIL_BATCH_SIZE = 200
+
+# Outbox dispatchers send EMAIL_OUTBOX_BATCH_SIZE messages per SMTP connection,
+# give up after EMAIL_OUTBOX_MAX_ATTEMPTS and send at most
+# EMAIL_OUTBOX_MESSAGES_PER_SECOND messages each (None = unthrottled); dispatchers
+# running in parallel add up.
+EMAIL_OUTBOX_BATCH_SIZE = 100
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_MESSAGES_PER_SECOND = 5
+
+# User id range handled by each chunk of a bulk WorkDistance recomputation.
+WORK_DISTANCE_RECOMPUTE_CHUNK_SIZE = 10000
+
+# /api/user/distance-matrix/ answers 400 instead of comparing the origins with
+# more than this many users when the destinations name no users or points.
+DISTANCE_MATRIX_MAX_DESTINATIONS = 50000
+
+# Vector tiles (/tiles/{z}/{x}/{y}.mvt) render these layers and are cached in
+# the TILE_CACHE alias; point it at a FileBasedCache alias to keep tiles on disk.
+TILE_LAYERS = ['home', 'office', 'commutes']
+TILE_CACHE = 'default'
+TILE_CACHE_TIMEOUT = 24 * 60 * 60
+TILE_MAX_ZOOM = 20
+
+# Map clusters use a grid of about USER_CLUSTER_CELLS_PER_TILE cells across each
+# tile. Zoom levels up to USER_CLUSTER_MATERIALIZED_MAX_ZOOM are materialised;
+# run the rebuild_user_clusters task after changing either setting.
+USER_CLUSTER_CELLS_PER_TILE = 16
+USER_CLUSTER_MATERIALIZED_MAX_ZOOM = 8
+# method=dbscan clusters users on the fly, so it is only offered above the
+# materialised zoom levels and for at most this many users per request.
+USER_CLUSTER_DBSCAN_MAX_POINTS = 20000